@@ -47,10 +47,17 @@ c ------------------------------------------------------------------------------
 c
   nps       1e8
   prdmp   j 1e7 1 2 j
+c
+c     Convergence mode: replace nps with a stop card to end the run once the
+c     F14 chart bin reaches 1% relative error or after 10 hours of computer time
+c stop    nps 1e8  ctme 600  f14 0.01
 c
   mode    n
   imp:n   1 6r 0
 c
+c     Weight windows: read the wwinp written by NDAS-OpenMC/SHINE_NDAS_ww.py
+c wwp:n   5 3 5 0 -1
+c
 c ------------------------------------------------------------------------------
 c     Materials
 c ------------------------------------------------------------------------------
@@ -0,0 +1,171 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import csv
+import hashlib
+import itertools
+import os
+import re
+import string
+import time
+import numpy as np
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from case_id import get_case_id
+from source_data import load_source_data, get_beam_radii
+from SHINE_NDAS_source_cards import (get_extent_cards, get_angular_cards, get_radial_cards, get_energy_cards,
+                                     join_cards)
+
+# Inputs that define a deck, and their nominal values (beam radius and divergence from the source data)
+PARAMETERS = ('length', 'diameter', 'strength', 'divergence', 'r_min', 'nps')
+NOMINAL    = {'length': 137.0, 'diameter': 3.29 * 2.54, 'strength': 2.7e13, 'nps': 1e8}
+
+TEMPLATE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SHINE_NDAS.i')
+
+_cache = {}
+
+def format_number(x):
+
+    # Shortest form MCNP reads back, e.g. 2.7e13 or 1e8
+    text = '%.6g' % (x)
+    if 'e' in text:
+        mantissa, exponent = text.split('e')
+        text = '%se%d' % (mantissa, int(exponent))
+    return text
+
+def format_fixed(x):
+
+    text = ('%.5f' % (x)).rstrip('0')
+    return text + '0' if text.endswith('.') else text
+
+def format_aligned(x, width):
+
+    # Values aligned on the decimal point, as in the surface cards of the deck
+    whole, fraction = format_fixed(x).split('.')
+    return whole.rjust(8) + ('.' + fraction).ljust(width)
+
+def get_surface_cards(length, diameter):
+
+    # Same surfaces as get_geometry() of the OpenMC model, as RCC bodies
+    half_length  = length / 2
+    tally_center = -half_length + 54./137 * length
+    radius       = diameter / 2
+
+    # Base, height and radius of the beam stop, vacuum, walls, water jacket and tally cell
+    bodies = [(-half_length       , -0.63500          , 3.81           ),
+              ( half_length       , -length - 0.63500 , radius         ),
+              ( half_length       , -length - 0.95250 , radius + 0.2794),
+              ( half_length       , -length - 1.18872 , radius + 0.4191),
+              ( half_length       , -length - 3.52552 , radius + 0.6477),
+              ( tally_center - 2.5,  5.0              , radius + 0.9017)]
+
+    lines = []
+    for n, (z, h, r) in enumerate(bodies):
+        lines.append('%3u    rcc     0 0%s       0 0%s%s' %
+                     (n + 1, format_aligned(z, 2), format_aligned(h, 9), format_fixed(r)))
+    lines.append('%3u    so   %s' % (len(bodies) + 1, format_number(1000)))
+    return lines
+
+def get_template(fname=TEMPLATE):
+
+    # The deck with placeholders for the surfaces, the source strength, nps and the source file
+    if fname not in _cache:
+        with open(fname, 'r') as r: text = r.read().replace('$', '$$')
+        text, count = re.subn(r'(?:^ *\d+ +(?:rcc|so) .*\n)+', '${surfaces}\n', text, 1, re.M)
+        if count != 1: raise ValueError('No surface cards in %s' % (fname))
+        for pattern, name in ((r'^( *nps +)\S+'         , 'nps'     ),
+                              (r'^( *fm14 +)\S+'        , 'strength'),
+                              (r'^( *factor *= *)\S+'   , 'strength'),
+                              (r'^( *read file *= *)\S+', 'source'  )):
+            text, count = re.subn(pattern, r'\g<1>${%s}' % (name), text, 0, re.M)
+            if count == 0: raise ValueError('No %s in %s' % (name, fname))
+        _cache[fname] = string.Template(text)
+    return _cache[fname]
+
+def get_static_cards(data_file=None, mu_bias=None):
+
+    # Angular and energy cards do not depend on the geometry or the beam, format them once
+    key = (data_file, None if mu_bias is None else hashlib.sha256(np.asarray(mu_bias).tobytes()).hexdigest())
+    if key not in _cache:
+        data = load_source_data(data_file)
+        _cache[key] = (get_angular_cards(data, mu_bias), get_energy_cards(data))
+    return _cache[key]
+
+def get_deck(case, source='SHINE_NDAS_source.txt', template=TEMPLATE):
+
+    return get_template(template).substitute(surfaces='\n'.join(get_surface_cards(case['length'], case['diameter'])),
+                                             strength=format_number(case['strength']),
+                                             nps=format_number(case['nps']), source=source)
+
+def get_source(case, r_beam=None, data_file=None, z_bias=None, mu_bias=None):
+
+    angular, energy = get_static_cards(data_file, mu_bias)
+    length, diameter = case['length'], case['diameter']
+    radial = get_radial_cards(length, diameter, data_file, r_min=case.get('r_min'),
+                              divergence=case.get('divergence'), r_beam=r_beam)
+    return '\n'.join(join_cards([get_extent_cards(length, load_source_data(data_file), z_bias),
+                                 angular, radial, energy])) + '\n'
+
+def get_cases(grid, data_file=None):
+
+    # Cartesian product of every parameter's values, nominal values for the others
+    data  = load_source_data(data_file)
+    fixed = dict(NOMINAL, r_min=float(data['r_min']), divergence=float(data['divergence']))
+    names = [x for x in PARAMETERS if grid.get(x)]
+    cases = []
+    for values in itertools.product(*[grid[x] for x in names]):
+        case = dict(fixed)
+        case.update(zip(names, values))
+        cases.append(case)
+    return cases
+
+def write_decks(root, cases, data_file=None, template=TEMPLATE):
+
+    # Beam radii of every case in one pass, then one directory per case (named by the hash of its inputs)
+    r_beam = get_beam_radii([x['length']   for x in cases], [x['diameter']   for x in cases], data_file,
+                            [x['r_min']    for x in cases], [x['divergence'] for x in cases])
+    rows   = []
+    for case, radii in zip(cases, r_beam):
+        case_id = get_case_id(case)
+        path    = os.path.join(root, 'case_%s' % (case_id))
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, 'SHINE_NDAS.i'), 'w') as w: w.write(get_deck(case, template=template))
+        with open(os.path.join(path, 'SHINE_NDAS_source.txt'), 'w') as w: w.write(get_source(case, radii, data_file))
+        rows.append(dict(case_id=case_id, **case))
+
+    fname = os.path.join(root, 'cases.csv')
+    print('Writing %s' % (fname))
+    with open(fname, 'w', newline='') as w:
+        writer = csv.DictWriter(w, fieldnames=['case_id'] + list(PARAMETERS))
+        writer.writeheader()
+        writer.writerows(rows)
+
+    return rows
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Write SHINE NDAS MCNP decks over a grid of parameters')
+    parser.add_argument('--length'     , type=float, nargs='+', help='target chamber length [cm]')
+    parser.add_argument('--diameter'   , type=float, nargs='+', help='target chamber inner diameter [cm]')
+    parser.add_argument('--strength'   , type=float, nargs='+', help='neutron source strength [n/s]')
+    parser.add_argument('--divergence' , type=float, nargs='+', help='beam divergence [rad]')
+    parser.add_argument('--beam-radius', type=float, nargs='+', help='beam radius at the chamber entrance [cm]')
+    parser.add_argument('--nps'        , type=float, nargs='+')
+    parser.add_argument('-o', '--output', default='decks')
+    args = parser.parse_args()
+
+    grid  = {'length': args.length, 'diameter': args.diameter, 'strength': args.strength,
+             'divergence': args.divergence, 'r_min': args.beam_radius, 'nps': args.nps}
+    cases = get_cases(grid)
+
+    t0 = time.perf_counter()
+    write_decks(args.output, cases)
+    print('%u decks in %.2f s' % (len(cases), time.perf_counter() - t0))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from mcnp_mctal import read_mctal
+
+# Files of a run; MCNP picks another name (outq, mctam, ...) rather than overwrite them
+OUTPUTS = ('outp', 'mctal', 'meshtal')
+
+def get_deck_nps(fname):
+
+    with open(fname, 'r') as r: match = re.search(r'^ *nps +(\S+)', r.read(), re.M | re.I)
+    if not match: raise ValueError('No nps card in %s' % (fname))
+    return int(float(match.group(1)))
+
+def get_deck_key(path, deck):
+
+    # Hash of a deck without its nps card, with the files it reads (e.g. SHINE_NDAS_source.txt), so that
+    # asking for more histories is still the same run
+    with open(os.path.join(path, deck), 'r') as r: text = r.read()
+    digest = hashlib.sha256(re.sub(r'^ *nps +\S+.*$', '', text, flags=re.M | re.I).encode())
+    for name in re.findall(r'^ *read +file *= *(\S+)', text, re.M | re.I):
+        with open(os.path.join(path, name), 'rb') as r: digest.update(r.read())
+    return digest.hexdigest()
+
+def get_run_key(path):
+
+    # Deck key of the run that wrote runtpe and mctal
+    fname = os.path.join(path, 'SHINE_NDAS.run.json')
+    if not os.path.exists(fname): return None
+    with open(fname, 'r') as r: return json.load(r).get('deck')
+
+def get_done_nps(path, key=None):
+
+    # Histories in the last mctal, written at every dump of the prdmp card, if it comes from the same deck
+    fname = os.path.join(path, 'mctal')
+    if not os.path.exists(fname): return 0
+    if key is not None and get_run_key(path) != key: return 0
+    try:
+        return read_mctal(fname)['header'].get('nps', 0)
+    except (ValueError, IndexError):
+        return 0
+
+def run_mcnp(path='.', deck='SHINE_NDAS.i', nps=None, tasks=None, executable='mcnp6', fresh=False):
+
+    # Continue from the last dump in runtpe (after an interruption, or to extend a finished run to more
+    # histories), or start a new run
+    if shutil.which(executable) is None: raise RuntimeError('%s not found' % (executable))
+    nps     = nps or get_deck_nps(os.path.join(path, deck))
+    key     = get_deck_key(path, deck)
+    outputs = [x for x in ('runtpe', 'mctal') if os.path.exists(os.path.join(path, x))]
+    if not fresh and outputs and get_run_key(path) != key:
+        print('Starting over, %s is not from %s' % (os.path.join(path, outputs[0]), os.path.join(path, deck)))
+        fresh = True
+    done = 0 if fresh else get_done_nps(path, key)
+    if done >= nps:
+        print('Reusing %s, %u histories' % (os.path.join(path, 'mctal'), done))
+        return done
+
+    # Recorded before the run, so that a dump of an interrupted run is continued
+    with open(os.path.join(path, 'SHINE_NDAS.run.json'), 'w') as w: json.dump({'deck': key}, w, indent=2)
+
+    if not fresh and os.path.exists(os.path.join(path, 'runtpe')):
+        print('Continuing from %s after %u histories' % (os.path.join(path, 'runtpe'), done))
+        with open(os.path.join(path, 'SHINE_NDAS.c'), 'w') as w: w.write('continue\n  nps       %u\n' % (nps))
+        for name in OUTPUTS:
+            if os.path.exists(os.path.join(path, name)):
+                os.replace(os.path.join(path, name), os.path.join(path, name + '.prev'))
+        args = [executable, 'c', 'i=SHINE_NDAS.c', 'r=runtpe']
+    else:
+        for name in OUTPUTS + ('runtpe',):
+            if os.path.exists(os.path.join(path, name)): os.remove(os.path.join(path, name))
+        with open(os.path.join(path, deck), 'r') as r: text = r.read()
+        if nps != get_deck_nps(os.path.join(path, deck)):
+            deck = 'SHINE_NDAS.run.i'
+            with open(os.path.join(path, deck), 'w') as w:
+                w.write(re.sub(r'^( *nps +)\S+', r'\g<1>%u' % (nps), text, 1, re.M | re.I))
+        args = [executable, 'i=%s' % (deck)]
+
+    subprocess.run(args + (['tasks', str(tasks)] if tasks else []), cwd=path, check=True)
+    done = get_done_nps(path)
+    print('%u histories in %s' % (done, os.path.join(path, 'mctal')))
+    return done
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Run the SHINE NDAS MCNP deck, continuing from the last dump')
+    parser.add_argument('-n', '--nps'       , type=float, default=None, help='histories (default: the nps card)')
+    parser.add_argument('-t', '--tasks'     , type=int  , default=None)
+    parser.add_argument('-x', '--executable', default='mcnp6')
+    parser.add_argument('--fresh'           , action='store_true', help='start over, ignoring runtpe')
+    args = parser.parse_args()
+
+    path = os.path.dirname(os.path.abspath(__file__))
+    run_mcnp(path, nps=int(args.nps) if args.nps else None, tasks=args.tasks, executable=args.executable,
+             fresh=args.fresh)
+
+if __name__ == '__main__': main()
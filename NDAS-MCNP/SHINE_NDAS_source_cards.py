@@ -0,0 +1,143 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import os
+import numpy as np
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from source_data import load_source_data, get_beam_radii
+from source_bias import add_bias_arguments, get_bias_arguments
+
+SEPARATOR = 'c ' + '-' * 78
+
+def format_card(prefix, values, per_line=6):
+
+    # The first line starts with the 7-character card prefix, the rest are indented
+    lines = []
+    for i in range(0, len(values), per_line):
+        start = prefix if i == 0 else ' ' * 7
+        lines.append(start + ''.join(' ' + x for x in values[i:i + per_line]))
+    return lines
+
+def format_interp(lo, hi):
+
+    # Energy grid indices (10 keV steps) as 'e0 Ni e1'
+    values = [repr(int(lo) / 100)]
+    if hi - lo > 1: values.append('%ui' % (hi - lo - 1))
+    if hi > lo    : values.append(repr(int(hi) / 100))
+    return values
+
+def get_header():
+
+    return ['c ' + '*' * 78,
+            'c Copyright 2025, SHINE Technologies. All rights reserved.',
+            'c ' + '*' * 78,
+            'c',
+            SEPARATOR,
+            'c     Source definition',
+            SEPARATOR,
+            'c']
+
+def get_sdef():
+
+    return ['  sdef  par = n',
+            '        pos = 0 0 0',
+            '        axs = 0 0  1',
+            '        vec = 0 0 -1',
+            '        ext = d1',
+            '        dir = d2',
+            '        rad = fext = d3',
+            '        erg = fdir = d4']
+
+def get_extent_cards(length, data, bias=None):
+
+    # With a bias (ratio of biased to analog probabilities), MCNP weights each particle by sp/sb
+    z_p   = data['z_p']
+    lines = ['  sc1   Extent distribution']
+    lines.append('  si1   %g %ui %g' % (-length / 2, len(z_p) - 1, length / 2))
+    lines.extend(format_card('  sp1  ', ['%.5e' % (x) for x in np.append(0, z_p)]))
+    if bias is not None:
+        lines.extend(format_card('  sb1  ', ['%.5e' % (x) for x in np.append(0, z_p * bias)]))
+    return lines
+
+def get_angular_cards(data, bias=None):
+
+    lines = ['  sc2   Angular distribution']
+    lines.extend(format_card('  si2 H', ['%11.8f' % (x) for x in data['mu_x']]))
+    lines.extend(format_card('  sp2  ', ['%.5e' % (x) for x in np.append(0, data['mu_p'])]))
+    if bias is not None:
+        lines.extend(format_card('  sb2  ', ['%.5e' % (x) for x in np.append(0, data['mu_p'] * bias)]))
+    return lines
+
+def get_radial_cards(length, diameter, data_file=None, first=101, r_min=None, divergence=None, r_beam=None):
+
+    # One power-law (r^1) distribution per z bin, out to the local beam radius
+    if r_beam is None: r_beam = get_beam_radii(length, diameter, data_file, r_min, divergence)
+    numbers = first + np.arange(len(r_beam))
+    lines   = ['  sc3   Radial distribution']
+    lines.extend(format_card('  ds3 S', ['%3u' % (x) for x in numbers], 18))
+    lines.append('c')
+    lines.extend('  %-5s 0 %.4f' % ('si%u' % (n), r) for n, r in zip(numbers, r_beam))
+    lines.append('c')
+    lines.extend('  %-5s -21 1' % ('sp%u' % (n)) for n in numbers)
+    return lines
+
+def get_energy_cards(data, first=5):
+
+    # One energy distribution per cosine bin, covering its DD and DT parts
+    e_mu_p  = data['e_mu_p']
+    bounds  = data['e_mu_bounds']
+    numbers = first + np.arange(len(e_mu_p))
+    lines   = ['  sc4   Energy distribution']
+    lines.extend(format_card('  ds4 S', ['%3u' % (x) for x in numbers], 18))
+    for n, spectrum, (lo1, hi1, lo2, hi2) in zip(numbers, e_mu_p, bounds):
+        values = np.append(spectrum[lo1:hi1 + 1], spectrum[lo2:hi2 + 1])
+        lines.append('c')
+        lines.append('  %-5s %s' % ('si%u' % (n), ' '.join(['A'] + format_interp(lo1, hi1) + format_interp(lo2, hi2))))
+        lines.extend(format_card('  %-5s' % ('sp%u' % (n)), ['%.5e' % (x) for x in values]))
+    return lines
+
+def join_cards(blocks):
+
+    # Extent, angular, radial and energy cards, each between separators
+    lines = get_header() + get_sdef()
+    for cards in blocks:
+        lines += ['c', SEPARATOR, 'c'] + cards
+    lines += ['c', SEPARATOR]
+    return lines
+
+def get_source_cards(length, diameter, data_file=None, z_bias=None, mu_bias=None, r_min=None, divergence=None):
+
+    data = load_source_data(data_file)
+    return join_cards([get_extent_cards(length, data, z_bias),
+                       get_angular_cards(data, mu_bias),
+                       get_radial_cards(length, diameter, data_file, r_min=r_min, divergence=divergence),
+                       get_energy_cards(data)])
+
+def write_source_cards(fname, length, diameter, data_file=None, z_bias=None, mu_bias=None, r_min=None, divergence=None):
+
+    with open(fname, 'w') as w:
+        w.write('\n'.join(get_source_cards(length, diameter, data_file, z_bias, mu_bias, r_min, divergence)) + '\n')
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Write the SHINE NDAS MCNP source cards')
+    parser.add_argument('-o', '--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SHINE_NDAS_source.txt'))
+    parser.add_argument('-d', '--data'  , default=None, help='source data file, SHINE_NDAS_source.npz by default')
+    add_bias_arguments(parser)
+    args = parser.parse_args()
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+
+    z_bias, mu_bias = get_bias_arguments(args, length, diameter)
+    print('Writing %s' % (args.output))
+    write_source_cards(args.output, length, diameter, args.data, z_bias, mu_bias)
+
+if __name__ == '__main__': main()
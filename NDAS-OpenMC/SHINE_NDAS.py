@@ -4,18 +4,36 @@
 # Copyright 2025, SHINE Technologies. All rights reserved.
 # ******************************************************************************
 
+import argparse
+import glob
+import hashlib
+import json
 import os
+import re
+import h5py
 import numpy as np
 import openmc
+from xml.etree import ElementTree
 
 import sys
 sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from stage_timing import stage, run_openmc, get_record, write_record
 from SHINE_NDAS_source import get_source
 
-def get_materials():
+# Cross section library, unless SHINE_NDAS_CROSS_SECTIONS or OPENMC_CROSS_SECTIONS point elsewhere
+# (e.g. at a pruned library from SHINE_NDAS_xslib.py)
+CROSS_SECTIONS = '/home/lucas/openmc_data/%s/cross_sections.xml'
+
+def get_cross_sections(xslib='endfb-viii.0-hdf5'):
+
+    path = os.environ.get('SHINE_NDAS_CROSS_SECTIONS') or os.environ.get('OPENMC_CROSS_SECTIONS')
+    return path or CROSS_SECTIONS % (xslib)
+
+def get_materials(cross_sections=None):
 
     xslib = 'endfb-viii.0-hdf5'
-    openmc.Materials.cross_sections = '/home/lucas/openmc_data/%s/cross_sections.xml' % (xslib)
+    openmc.Materials.cross_sections = cross_sections or get_cross_sections(xslib)
 
     mat_dict = {}
 
@@ -41,8 +59,9 @@ def get_materials():
 
     return mat_dict
 
-def get_geometry(length, diameter, mats):
+def get_cells(length, diameter, mats, bounded=True):
 
+    # Cells of one chamber; unbounded, the last cell extends to infinity (to fill a cell of a larger model)
     half_length  = length / 2
     tally_center = -half_length + 54./137 * length
     radius       = diameter / 2
@@ -64,7 +83,7 @@ def get_geometry(length, diameter, mats):
     z0_tally = openmc.ZPlane(tally_center - 2.5)
     z1_tally = openmc.ZPlane(tally_center + 2.5)
 
-    r_bound  = openmc.Sphere(r=1000, boundary_type='vacuum')
+    r_bound  = openmc.Sphere(r=1000, boundary_type='vacuum') if bounded else None
 
     reg_stop   = -r_stop   & +z_vacuum & -z_stop
     reg_vacuum = -r_vacuum & +z_vacuum & -zmax & (+r_stop   | -z_vacuum | +z_stop)
@@ -72,7 +91,8 @@ def get_geometry(length, diameter, mats):
     reg_water  = -r_water  & +z_water  & -zmax & (+r_wall_1 | -z_wall_1)
     reg_wall_2 = -r_wall_2 & +z_wall_2 & -zmax & (+r_water  | -z_water )
     reg_tally  = -r_tally  & +z0_tally & -z1_tally & +r_wall_2
-    reg_bound  = -r_bound  & (+r_wall_2 | -z_wall_2 | +zmax) & (+r_tally | -z0_tally | +z1_tally)
+    reg_bound  = openmc.Intersection(([-r_bound] if bounded else []) +
+                                     [+r_wall_2 | -z_wall_2 | +zmax, +r_tally | -z0_tally | +z1_tally])
 
     cells = [
         openmc.Cell(name='Beam stop'                , region=reg_stop  , fill=mats['Cu'   ]),
@@ -84,7 +104,11 @@ def get_geometry(length, diameter, mats):
         openmc.Cell(name='Bounding cell'            , region=reg_bound , fill=None         ),
     ]
 
-    root_universe = openmc.Universe(cells=cells)
+    return cells
+
+def get_geometry(length, diameter, mats):
+
+    root_universe = openmc.Universe(cells=get_cells(length, diameter, mats))
     geometry      = openmc.Geometry(root_universe)
 
     return geometry
@@ -131,39 +155,206 @@ def get_plots(geom):
 
     return plots
 
-def get_settings(source):
+def get_settings(source, batches=10, particles=int(1e7), checkpoint=None):
 
     settings           = openmc.Settings()
     settings.run_mode  = 'fixed source'
     settings.source    = source
-    settings.batches   = 10
-    settings.particles = int(1e7)
+    settings.batches   = batches
+    settings.particles = particles
+
+    # Statepoints every checkpoint batches (and after the last one), to restart from after an interruption
+    if checkpoint:
+        settings.statepoint = {'batches': list(range(checkpoint, batches, checkpoint)) + [batches]}
 
     return settings
 
-def main():
+def get_digest(fname):
 
-    length   = 137.0
-    diameter = 3.29 * 2.54
-    strength = 2.7e13
+    with open(fname, 'rb') as r: return hashlib.sha256(r.read()).hexdigest()
+
+def export_xml(obj, fname):
+
+    # Replace the file only when its content changes, so that unchanged inputs are left untouched
+    tname = fname[:-len('.xml')] + '.new.xml'
+    obj.export_to_xml(tname)
+    digest = get_digest(tname)
+    if os.path.exists(fname) and get_digest(fname) == digest:
+        os.remove(tname)
+        return digest, False
+    os.replace(tname, fname)
+    return digest, True
 
-    mat_dict  = get_materials()
-    geometry  = get_geometry(length, diameter, mat_dict)
-    tallies   = get_tallies(geometry)
-    plots     = get_plots(geometry)
-    source    = get_source(length, diameter, strength)
-    settings  = get_settings(source)
+def get_model(length, diameter, strength, batches=10, particles=int(1e7), plots=True, source=None, checkpoint=None,
+              timer=None):
+
+    # A prebuilt source (e.g. a biased source file) replaces the analog distributions
+    with stage(timer, 'materials'): mat_dict = get_materials()
+    with stage(timer, 'geometry' ): geometry = get_geometry(length, diameter, mat_dict)
+    with stage(timer, 'tallies'  ): tallies  = get_tallies(geometry)
+    with stage(timer, 'source'   ): source   = source or get_source(length, diameter, strength)
+    with stage(timer, 'settings' ): settings = get_settings(source, batches, particles, checkpoint)
 
     materials = openmc.Materials(mat_dict.values())
 
-    materials.export_to_xml()
-    geometry .export_to_xml()
-    tallies  .export_to_xml()
-    plots    .export_to_xml()
-    settings .export_to_xml()
+    objects = {'materials.xml': materials,
+               'geometry.xml' : geometry,
+               'tallies.xml'  : tallies,
+               'settings.xml' : settings}
+    if plots:
+        with stage(timer, 'plots'): objects['plots.xml'] = get_plots(geometry)
+
+    return objects
+
+def write_model(path, objects, timer=None):
+
+    # Content hashes of the last export, and of the inputs of the last geometry plots
+    fname    = os.path.join(path, 'export.json')
+    manifest = {}
+    if os.path.exists(fname):
+        with open(fname, 'r') as r: manifest = json.load(r)
+
+    status = {}
+    for name, obj in objects.items():
+        with stage(timer, 'export %s' % (name)): manifest[name], written = export_xml(obj, os.path.join(path, name))
+        status[name] = 'written' if written else 'reused'
+
+    if 'plots.xml' in objects:
+        key     = manifest['geometry.xml'] + manifest['materials.xml'] + manifest['plots.xml']
+        missing = [x.filename for x in objects['plots.xml'] if not os.path.exists(os.path.join(path, x.filename))]
+        if missing or manifest.get('plotted') != key:
+            with stage(timer, 'plot geometry'): openmc.plot_geometry(cwd=path)
+            manifest['plotted'] = key
+            status['plots'] = 'rendered'
+        else:
+            status['plots'] = 'reused'
+
+    with open(fname, 'w') as w: json.dump(manifest, w, indent=2)
+
+    for name, value in status.items():
+        print('%s %s' % (value.capitalize(), os.path.join(path, name) if name in objects else 'geometry plots'))
+
+    return status
+
+def export_model(path, length, diameter, strength, batches=10, particles=int(1e7), plots=True, checkpoint=None,
+                 timer=None):
+
+    return write_model(path, get_model(length, diameter, strength, batches, particles, plots,
+                                       checkpoint=checkpoint, timer=timer), timer)
+
+def get_statepoint_batch(fname, particles):
+
+    # Batches completed in a statepoint, None when it is damaged (e.g. written when the run was killed)
+    # or from a run with another number of particles per batch
+    try:
+        with h5py.File(fname, 'r') as f:
+            if f.attrs['filetype'] not in (b'statepoint', 'statepoint'): return None
+            if int(f['n_particles'][()]) != particles: return None
+            batch = int(f['current_batch'][()])
+            if 'tallies' not in f or int(f['n_realizations'][()]) != batch: return None
+            return batch
+    except (OSError, KeyError, ValueError, AttributeError):
+        return None
+
+def get_model_key(path):
+
+    # Hash of the model a statepoint comes from: the exported materials, geometry and tallies, and the source
+    # part of the settings (with the contents of any source file), not the batches or statepoint schedule
+    with open(os.path.join(path, 'export.json'), 'r') as r: manifest = json.load(r)
+    digest = hashlib.sha256()
+    for name in ('materials.xml', 'geometry.xml', 'tallies.xml'): digest.update(manifest[name].encode())
+    root = ElementTree.parse(os.path.join(path, 'settings.xml')).getroot()
+    for element in root.iter('source'):
+        digest.update(ElementTree.tostring(element))
+        for item in [element.get('file'), element.findtext('file')]:
+            item = item and os.path.join(path, item)
+            if item and os.path.exists(item): digest.update(get_digest(item).encode())
+    return digest.hexdigest()
+
+def read_statepoint_keys(path):
+
+    # Model key of every statepoint written by run_model()
+    fname = os.path.join(path, 'statepoints.json')
+    if not os.path.exists(fname): return {}
+    with open(fname, 'r') as r: return json.load(r)
+
+def write_statepoint_keys(path, keys):
+
+    fname = os.path.join(path, 'statepoints.json')
+    with open(fname + '.tmp', 'w') as w: json.dump(keys, w, indent=2)
+    os.replace(fname + '.tmp', fname)
+
+def find_restart(path, batches, particles, key=None):
+
+    # Latest valid statepoint of at most the requested batches, and with a key from the same model
+    keys  = read_statepoint_keys(path)
+    found = []
+    for fname in glob.glob(os.path.join(path, 'statepoint.*.h5')):
+        match = re.match(r'^statepoint\.(\d+)\.h5$', os.path.basename(fname))
+        if match and int(match.group(1)) <= batches: found.append((int(match.group(1)), fname))
+    for batch, fname in sorted(found, reverse=True):
+        if key is not None and keys.get(os.path.basename(fname)) != key:
+            print('Skipping %s, from another model' % (fname))
+        elif get_statepoint_batch(fname, particles) == batch:
+            return batch, fname
+        else:
+            print('Skipping %s, damaged or from another run' % (fname))
+    return None, None
+
+def run_model(path, length, diameter, strength, batches=10, particles=int(1e7), checkpoint=1, plots=True,
+              threads=None, fresh=False, timer=None):
+
+    # Resume from the latest valid statepoint of the same model, which also extends a finished run when
+    # batches grows
+    export_model(path, length, diameter, strength, batches, particles, plots, checkpoint, timer)
+    key            = get_model_key(path)
+    start, restart = (None, None) if fresh else find_restart(path, batches, particles, key)
+    fname          = os.path.join(path, 'statepoint.%u.h5' % (batches))
+    if start == batches:
+        print('Reusing %s' % (fname))
+        return fname
+
+    # The statepoints this run writes are recorded before it starts, so those of an interrupted run count too
+    keys = read_statepoint_keys(path)
+    for batch in list(range(checkpoint, batches, checkpoint)) if checkpoint else []:
+        if batch > (start or 0): keys['statepoint.%u.h5' % (batch)] = key
+    keys[os.path.basename(fname)] = key
+    write_statepoint_keys(path, keys)
+
+    if restart: print('Restarting from %s' % (restart))
+    with stage(timer, 'openmc run') as item:
+        run_openmc(path, threads, os.path.basename(restart) if restart else None, item=item)
+
+    # Checkpoints are superseded by the last statepoint (the one restarted from is kept, it may be an earlier result)
+    if checkpoint:
+        for batch in range(checkpoint, batches, checkpoint):
+            name = os.path.join(path, 'statepoint.%u.h5' % (batch))
+            if batch != start and os.path.exists(name): os.remove(name)
+
+    return fname
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Run the SHINE NDAS model, resuming from the latest statepoint')
+    parser.add_argument('-b', '--batches'   , type=int  , default=10)
+    parser.add_argument('-n', '--particles' , type=float, default=1e7, help='particles per batch')
+    parser.add_argument('-c', '--checkpoint', type=int  , default=1, help='batches between statepoints (0 for none)')
+    parser.add_argument('-t', '--threads'   , type=int  , default=None)
+    parser.add_argument('--fresh'           , action='store_true', help='start over, ignoring earlier statepoints')
+    parser.add_argument('--timing'          , action='store_true', help='write the time and memory of every stage '
+                                                                        'to timing.json')
+    args = parser.parse_args()
 
-    openmc.plot_geometry()
+    length   = 137.0
+    diameter = 3.29 * 2.54
+    strength = 2.7e13
 
-    openmc.run()
+    timer = [] if args.timing else None
+    fname = run_model('.', length, diameter, strength, args.batches, int(args.particles), args.checkpoint,
+                      threads=args.threads, fresh=args.fresh, timer=timer)
+    if args.timing:
+        write_record('timing.json', get_record(timer, fname, length=length, diameter=diameter, strength=strength,
+                                               batches=args.batches, particles=int(args.particles),
+                                               threads=args.threads))
 
 if __name__ == '__main__': main()
@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import json
+import math
+import os
+import time
+import numpy as np
+import openmc
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from openmc_tallies import load_tally
+from SHINE_NDAS import export_model
+
+def get_rel_errors(tally):
+
+    # Relative errors of the bins that scored
+    mean    = tally['mean'].ravel()
+    std     = tally['std_dev'].ravel()
+    nonzero = mean != 0
+    return std[nonzero] / np.abs(mean[nonzero])
+
+def get_errors(fname, targets):
+
+    # Each target is (statistic, relative error): 'max' or a percentile over the tally bins
+    errors = {}
+    for name, (stat, _) in targets.items():
+        rel = get_rel_errors(load_tally(fname, name))
+        if   len(rel) == 0 : errors[name] = math.inf
+        elif stat == 'max' : errors[name] = float(np.max(rel))
+        else               : errors[name] = float(np.percentile(rel, stat))
+    return errors
+
+def get_next_batches(batches, errors, targets, batch_time, remaining, max_batches):
+
+    # Errors fall as 1/sqrt(batches), the slowest tally sets the number of batches needed
+    ratio  = max((errors[x] / targets[x][1])**2 for x in targets)
+    needed = math.ceil(batches * min(ratio, 1e6) * 1.05) if math.isfinite(ratio) else 2 * batches
+    budget = batches + int(remaining / batch_time)
+    return min(max(needed, batches + 1), budget, max_batches)
+
+def run_converge(path, length, diameter, strength, targets, budget, particles=int(1e6),
+                 batches=10, max_batches=10000, threads=None):
+
+    # Run an initial set of batches, then restart with more until the targets or the budget are reached
+    os.makedirs(path, exist_ok=True)
+    t0      = time.perf_counter()
+    history = []
+    export_model(path, length, diameter, strength, batches, particles, plots=False)
+    openmc.run(cwd=path, threads=threads, output=False)
+    batch_time = (time.perf_counter() - t0) / batches
+
+    while True:
+        elapsed = time.perf_counter() - t0
+        fname   = os.path.join(path, 'statepoint.%u.h5' % (batches))
+        errors  = get_errors(fname, targets)
+        history.append({'batches': batches, 'particles': batches * particles, 'elapsed': elapsed, 'errors': errors})
+        print('%6u batches, %8.1f s: %s' % (batches, elapsed, ', '.join('%s %.4f' % (x, y) for x, y in errors.items())))
+
+        if all(errors[x] <= targets[x][1] for x in targets):
+            status = 'converged'
+            break
+        next_batches = get_next_batches(batches, errors, targets, batch_time, budget - elapsed, max_batches)
+        if next_batches <= batches:
+            status = 'budget' if batches < max_batches else 'max batches'
+            break
+
+        # Only settings.xml changes, the other inputs are reused
+        t1 = time.perf_counter()
+        export_model(path, length, diameter, strength, next_batches, particles, plots=False)
+        openmc.run(cwd=path, threads=threads, output=False, restart_file=os.path.basename(fname))
+        batch_time = (time.perf_counter() - t1) / (next_batches - batches)
+        batches    = next_batches
+
+    record = {'status'   : status,
+              'targets'  : {x: {'statistic': y[0], 'rel_err': y[1]} for x, y in targets.items()},
+              'budget'   : budget,
+              'batches'  : batches,
+              'particles': batches * particles,
+              'errors'   : history[-1]['errors'],
+              'history'  : history}
+    fname = os.path.join(path, 'convergence.json')
+    print('Writing %s' % (fname))
+    with open(fname, 'w') as w: json.dump(record, w, indent=2)
+
+    return record
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Run the SHINE NDAS model until the tallies reach a target relative error')
+    parser.add_argument('--cell-target'    , type=float, default=0.05, help='max relative error over the cell tally bins')
+    parser.add_argument('--mesh-target'    , type=float, default=0.10, help='relative error of the mesh tally percentile')
+    parser.add_argument('--mesh-percentile', type=float, default=95)
+    parser.add_argument('--budget'         , type=float, default=24, help='wall-clock budget [h]')
+    parser.add_argument('-n', '--particles', type=float, default=1e6, help='particles per batch')
+    parser.add_argument('-b', '--batches'  , type=int  , default=10 , help='initial batches')
+    parser.add_argument('--max-batches'    , type=int  , default=10000)
+    parser.add_argument('-t', '--threads'  , type=int  , default=None)
+    parser.add_argument('-o', '--output'   , default='converge')
+    args = parser.parse_args()
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+    strength = 2.7e13
+
+    targets = {'Cell tally': ('max', args.cell_target),
+               'Mesh tally': (args.mesh_percentile, args.mesh_target)}
+
+    record = run_converge(args.output, length, diameter, strength, targets, args.budget * 3600,
+                          int(args.particles), args.batches, args.max_batches, args.threads)
+    print('%s after %u batches' % (record['status'].capitalize(), record['batches']))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import os
+import time
+import numpy as np
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from source_data import get_angular_spectra, get_beam_radii
+from SHINE_NDAS_sampler import SOURCE_DTYPE, get_tables, rotate_direction, sample_linear_bins, write_source_bank, get_file_source
+
+def build_alias(p):
+
+    # Walker alias table, built in vectorized rounds with a serial tail
+    n     = len(p)
+    q     = np.asarray(p, dtype=float) * (n / np.sum(p))
+    prob  = np.ones(n)
+    alias = np.arange(n, dtype=np.int32)
+    small = np.flatnonzero(q <  1)
+    large = np.flatnonzero(q >= 1)
+    while min(len(small), len(large)) > 64:
+        k    = min(len(small), len(large))
+        s, l = small[:k], large[:k]
+        prob [s]  = q[s]
+        alias[s]  = l
+        q    [l] -= 1 - q[s]
+        small = np.concatenate((small[k:], l[q[l] <  1]))
+        large = np.concatenate((large[k:], l[q[l] >= 1]))
+    small = list(small)
+    large = list(large)
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob [s]  = q[s]
+        alias[s]  = l
+        q    [l] -= 1 - q[s]
+        if q[l] < 1: small.append(l)
+        else       : large.append(l)
+
+    return prob, alias
+
+def build_table(z_x, mu_x, e_x, density, r_beam, reference=(0, 0, -1)):
+
+    # Bin probabilities of the joint (z, mu, E) density, linear in E between nodes
+    dz    = np.diff(z_x)[:, None, None]
+    dmu   = np.diff(mu_x)[None, :, None]
+    de    = np.diff(e_x)[None, None, :]
+    p     = 0.5 * (density[:, :, :-1] + density[:, :, 1:]) * dz * dmu * de
+    prob, alias = build_alias(p.ravel())
+
+    table = {}
+    table['z_x']       = np.asarray(z_x, dtype=float)
+    table['mu_x']      = np.asarray(mu_x, dtype=float)
+    table['e_x']       = np.asarray(e_x, dtype=float)
+    table['density']   = np.asarray(density, dtype=np.float32)
+    table['r_beam']    = np.asarray(r_beam, dtype=float)
+    table['reference'] = np.asarray(reference, dtype=float)
+    table['prob']      = prob
+    table['alias']     = alias
+
+    return table
+
+def get_table(length, diameter):
+
+    # Position and angle tables from OpenMC, energy given angle from MCNP
+    tables = get_tables(length, diameter)
+    pz     = np.diff(np.append(0, tables['z_cdf'])) / np.diff(tables['z_x'])
+    pmu    = np.diff(np.append(0, tables['mu_cdf'])) / np.diff(tables['mu_x'])
+
+    # Normalize each angle's spectrum so that the angular table is preserved
+    e_x, spectra, _ = get_angular_spectra()
+    spectra = spectra / np.sum(0.5 * (spectra[:, :-1] + spectra[:, 1:]) * np.diff(e_x), 1)[:, None]
+
+    density = pz[:, None, None] * pmu[None, :, None] * spectra[None, :, :]
+    r_beam  = get_beam_radii(length, diameter)
+
+    return build_table(tables['z_x'], tables['mu_x'], e_x, density, r_beam, tables['reference'])
+
+def save_table(fname, table):
+
+    np.savez_compressed(fname, **table)
+
+def load_table(fname):
+
+    with np.load(fname) as f: return {key: f[key] for key in f.files}
+
+def sample_particles(table, n, rng):
+
+    xi = rng.random((8, n))
+
+    # One alias lookup picks the (z, mu, E) bin
+    nz, nmu, ne = table['density'].shape
+    i    = np.minimum((xi[0] * len(table['prob'])).astype(np.int64), len(table['prob']) - 1)
+    i    = np.where(xi[1] < table['prob'][i], i, table['alias'][i])
+    iz, imu, ie = np.unravel_index(i, (nz, nmu, ne - 1))
+
+    # Position
+    z_x = table['z_x']
+    z   = z_x[iz] + xi[2] * (z_x[iz + 1] - z_x[iz])
+    r   = table['r_beam'][iz] * np.sqrt(xi[3])
+    phi = 2 * np.pi * xi[4]
+
+    # Direction
+    mu_x = table['mu_x']
+    mu   = mu_x[imu] + xi[5] * (mu_x[imu + 1] - mu_x[imu])
+    u    = rotate_direction(mu, 2 * np.pi * xi[6], table['reference'])
+
+    # Energy, linear between the two nodes of the selected bin
+    e_x = table['e_x']
+    p0  = table['density'][iz, imu, ie    ].astype(float)
+    p1  = table['density'][iz, imu, ie + 1].astype(float)
+    E   = sample_linear_bins(e_x[ie], e_x[ie + 1], p0, p1, xi[7])
+
+    particles = np.zeros(n, dtype=SOURCE_DTYPE)
+    particles['r']['x'] = r * np.cos(phi)
+    particles['r']['y'] = r * np.sin(phi)
+    particles['r']['z'] = z
+    particles['u']['x'] = u[:, 0]
+    particles['u']['y'] = u[:, 1]
+    particles['u']['z'] = u[:, 2]
+    particles['E']      = E
+    particles['wgt']    = 1.0
+
+    return particles
+
+def get_source(table, strength, fname='source.h5', n=int(1e7), seed=1):
+
+    # OpenMC file source sampled from the correlated table
+    write_source_bank(fname, table, n, seed=seed, sample=sample_particles)
+    return get_file_source(fname, strength)
+
+def format_card(name, values, fmt, per_line=6):
+
+    lines = []
+    for i in range(0, len(values), per_line):
+        prefix = ('  %-5s ' % (name)) if i == 0 else ' ' * 8
+        lines.append(prefix + ' '.join(fmt % (x) for x in values[i:i + per_line]))
+    return lines
+
+def write_mcnp_source(fname, table):
+
+    # Each (z, mu) bin becomes one source point that the other variables depend on
+    nz, nmu, ne = table['density'].shape
+    z_x  = table['z_x']
+    mu_x = table['mu_x']
+    e_x  = table['e_x'] * 1e-6
+    p    = 0.5 * (table['density'][:, :, :-1] + table['density'][:, :, 1:]) * np.diff(table['e_x'])
+    p    = np.sum(p, 2) * np.diff(z_x)[:, None] * np.diff(mu_x)[None, :]
+    bins = np.argwhere(p > 0)
+
+    # Identical distributions are written once and shared in the ds lists
+    dists   = {}
+    spectra = {}
+    lines   = []
+    def get_dist(key, si, sp):
+        if key not in dists:
+            n = 10 + len(dists)
+            dists[key] = n
+            lines.extend(si(n))
+            lines.extend(sp(n))
+        return dists[key]
+
+    ds_ext, ds_rad, ds_dir, ds_erg = [], [], [], []
+    for iz, imu in bins:
+        dz = z_x[iz + 1] - z_x[iz]
+        r  = table['r_beam'][iz]
+        ds_ext.append(get_dist(('ext', round(dz, 6)),
+                               lambda n: ['  si%u  0 %.4f' % (n, dz)],
+                               lambda n: ['  sp%u  -21 0' % (n)]))
+        ds_rad.append(get_dist(('rad', round(r, 6)),
+                               lambda n: ['  si%u  0 %.4f' % (n, r)],
+                               lambda n: ['  sp%u  -21 1' % (n)]))
+        ds_dir.append(get_dist(('dir', imu),
+                               lambda n: ['  si%u  H %.8f %.8f' % (n, mu_x[imu], mu_x[imu + 1])],
+                               lambda n: ['  sp%u  0 1' % (n)]))
+        spectrum = table['density'][iz, imu, :].astype(float)
+        nonzero  = np.flatnonzero(spectrum > 0)
+        lo       = max(nonzero[ 0] - 1, 0)
+        hi       = min(nonzero[-1] + 1, ne - 1)
+        spectrum = spectrum[lo:hi + 1] / np.max(spectrum)
+        matches  = [k for k, x in spectra.get((lo, hi), []) if np.allclose(x, spectrum, rtol=1e-5, atol=0)]
+        if not matches:
+            key = ('erg', lo, hi, len(spectra.get((lo, hi), [])))
+            spectra.setdefault((lo, hi), []).append((key, spectrum))
+        else: key = matches[0]
+        ds_erg.append(get_dist(key,
+                               lambda n: format_card('si%u' % (n), ['A'] + ['%g' % (x) for x in e_x[lo:hi + 1]], '%s', 12),
+                               lambda n: format_card('sp%u' % (n), spectrum, '%.5e')))
+
+    points = np.zeros((len(bins), 3))
+    points[:, 2] = z_x[bins[:, 0]]
+
+    with open(fname, 'w') as w:
+        w.write('c ' + '*' * 78 + '\n')
+        w.write('c Copyright 2025, SHINE Technologies. All rights reserved.\n')
+        w.write('c ' + '*' * 78 + '\n')
+        w.write('c\n')
+        w.write('c     Correlated (z, mu, E) source definition\n')
+        w.write('c\n')
+        w.write('  sdef  par = n\n')
+        w.write('        pos = d1\n')
+        w.write('        axs = 0 0  1\n')
+        w.write('        vec = %g %g %g\n' % tuple(table['reference']))
+        w.write('        ext = fpos = d2\n')
+        w.write('        rad = fpos = d3\n')
+        w.write('        dir = fpos = d4\n')
+        w.write('        erg = fpos = d5\n')
+        w.write('c\n')
+        for line in format_card('si1', ['L'] + ['%g' % (x) for x in points.ravel()], '%s', 12): w.write(line + '\n')
+        for line in format_card('sp1', p[bins[:, 0], bins[:, 1]], '%.5e'): w.write(line + '\n')
+        for n, ds in enumerate([ds_ext, ds_rad, ds_dir, ds_erg]):
+            for line in format_card('ds%u' % (n + 2), ['S'] + ['%u' % (x) for x in ds], '%s', 18): w.write(line + '\n')
+        w.write('c\n')
+        for line in lines: w.write(line + '\n')
+        w.write('c\n')
+
+    return len(dists)
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Build the correlated SHINE NDAS source table')
+    parser.add_argument('-t', '--table'    , default='source_table.npz')
+    parser.add_argument('-n', '--particles', type=float, default=0)
+    parser.add_argument('-o', '--output'   , default='source.h5')
+    parser.add_argument('-m', '--mcnp'     , default=None)
+    args = parser.parse_args()
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+
+    if os.path.exists(args.table):
+        print('Reading %s' % (args.table))
+        table = load_table(args.table)
+    else:
+        t0    = time.perf_counter()
+        table = get_table(length, diameter)
+        print('Built %s table in %.2f s' % ('x'.join(str(x) for x in table['density'].shape), time.perf_counter() - t0))
+        print('Writing %s' % (args.table))
+        save_table(args.table, table)
+
+    if args.particles > 0:
+        n = int(args.particles)
+        print('Writing %s' % (args.output))
+        rate = write_source_bank(args.output, table, n, sample=sample_particles)
+        print('Sampled %u particles at %.3e particles/s' % (n, rate))
+
+    if args.mcnp:
+        print('Writing %s' % (args.mcnp))
+        num_dists = write_mcnp_source(args.mcnp, table)
+        print('Wrote %u distributions' % (num_dists))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,203 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import os
+import time
+import numpy as np
+import h5py
+import openmc
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from openmc_tallies import load_tally
+from SHINE_NDAS import get_materials, get_cells, get_settings, write_model
+from SHINE_NDAS_sampler import SOURCE_DTYPE, get_tables, sample_particles, get_file_source
+
+def get_unit_extent(length, diameter):
+
+    # Extent of one chamber around its origin: outer radius (tally cell), bottom (outer wall) and top [cm]
+    return diameter / 2 + 0.9017, -length / 2 - 3.52552, length / 2
+
+def get_ring(num_units, radius, strengths=None):
+
+    # Units evenly spaced on a circle around the z axis (e.g. around a target), with relative strengths
+    angles = 2 * np.pi * np.arange(num_units) / num_units
+    return [{'translation': (radius * np.cos(x), radius * np.sin(x), 0.0),
+             'strength'   : 1.0 if strengths is None else strengths[i]} for i, x in enumerate(angles)]
+
+def check_units(length, diameter, units):
+
+    # The cylinders that hold the units must not overlap
+    r, z0, z1 = get_unit_extent(length, diameter)
+    points    = np.array([x['translation'] for x in units], dtype=float).reshape(-1, 3)
+    dxy       = np.hypot(*(points[:, None, :2] - points[None, :, :2]).transpose(2, 0, 1))
+    dz        = np.abs(points[:, None, 2] - points[None, :, 2])
+    overlap   = (dxy < 2 * r) & (dz < z1 - z0)
+    np.fill_diagonal(overlap, False)
+    if np.any(overlap):
+        i, j = np.argwhere(overlap)[0]
+        raise ValueError('Units %u and %u overlap' % (i, j))
+
+def get_facility_geometry(length, diameter, mats, units):
+
+    # One chamber universe shared by every unit. Only the vacuum cell, where the source is born, is repeated per
+    # unit, so that the source of each unit can be told apart by the cell it was born in.
+    cells   = get_cells(length, diameter, mats, bounded=False)
+    vacuum  = next(x for x in cells if x.name.startswith('Vacuum'))
+    chamber = openmc.Universe(name='NDAS chamber', cells=[x for x in cells if x is not vacuum])
+
+    # Cylinder that holds a chamber, in the chamber frame
+    r, z0, z1 = get_unit_extent(length, diameter)
+    container = -openmc.ZCylinder(r=r) & +openmc.ZPlane(z0) & -openmc.ZPlane(z1)
+
+    placed   = []
+    vacuums  = []
+    outside  = []
+    for n, unit in enumerate(units):
+        vacuums.append(openmc.Cell(name='Vacuum in target chamber %u' % (n), region=vacuum.region, fill=None))
+        rest     = openmc.Cell(name='Chamber %u' % (n), region=~vacuum.region, fill=chamber)
+        universe = openmc.Universe(name='NDAS unit %u' % (n), cells=[vacuums[-1], rest])
+        region   = container.translate(unit['translation'])
+        cell     = openmc.Cell(name='NDAS unit %u' % (n), region=region, fill=universe)
+        cell.translation = unit['translation']
+        placed.append(cell)
+        outside.append(~region)
+
+    # Same vacuum boundary as the single chamber model, pushed out to hold every unit
+    reach   = max(np.linalg.norm(x['translation']) for x in units) + np.hypot(r, max(-z0, z1))
+    r_bound = openmc.Sphere(r=max(1000, 2 * reach), boundary_type='vacuum')
+    bound   = openmc.Cell(name='Bounding cell', region=openmc.Intersection([-r_bound] + outside), fill=None)
+
+    geometry = openmc.Geometry(openmc.Universe(cells=placed + [bound]))
+    tally    = next(x for x in cells if x.name.startswith('Tally'))
+    return geometry, vacuums, tally
+
+def get_facility_tallies(length, diameter, units, vacuums, tally, voxel=2.0):
+
+    # Every tally is split by the unit whose source the neutron was born in
+    born_filter = openmc.CellBornFilter(vacuums)
+
+    # Spectrum in the tally cell of every unit (instances follow the order of the units)
+    energy_filter      = openmc.EnergyFilter.from_group_structure('CCFE-709')
+    cell_tally         = openmc.Tally(name='Cell tally')
+    cell_tally.filters = [born_filter, openmc.DistribcellFilter(tally), energy_filter]
+    cell_tally.scores  = ['flux']
+
+    # Flux map over every unit
+    r, z0, z1          = get_unit_extent(length, diameter)
+    points             = np.array([x['translation'] for x in units], dtype=float).reshape(-1, 3)
+    mesh               = openmc.RegularMesh()
+    mesh.lower_left    = points.min(0) + (-r - 10, -r - 10, z0 - 10)
+    mesh.upper_right   = points.max(0) + ( r + 10,  r + 10, z1 + 10)
+    mesh.dimension     = np.maximum(np.ceil((mesh.upper_right - mesh.lower_left) / voxel), 1).astype(int)
+    mesh_tally         = openmc.Tally(name='Mesh tally')
+    mesh_tally.filters = [born_filter, openmc.MeshFilter(mesh)]
+    mesh_tally.scores  = ['flux']
+
+    return openmc.Tallies([cell_tally, mesh_tally])
+
+def write_facility_bank(fname, tables, units, n, batch_size=1000000, seed=1):
+
+    # One source bank for every unit: the tables of one chamber are sampled for each unit's share of the
+    # particles, moved to the unit's origin
+    shares = np.array([x['strength'] for x in units], dtype=float)
+    counts = np.floor(n * shares / shares.sum()).astype(int)
+    counts[np.argmax(shares)] += n - counts.sum()
+    rng    = np.random.default_rng(seed)
+    with h5py.File(fname, 'w') as f:
+        f.attrs['filetype'] = np.bytes_('source')
+        dset  = f.create_dataset('source_bank', shape=(n,), dtype=SOURCE_DTYPE)
+        start = 0
+        for unit, count in zip(units, counts):
+            for i in range(0, count, batch_size):
+                particles = sample_particles(tables, min(batch_size, count - i), rng)
+                for axis, x in zip('xyz', unit['translation']): particles['r'][axis] += x
+                dset[start:start + len(particles)] = particles
+                start += len(particles)
+
+def get_facility_source(length, diameter, strength, units, path='.', particles=int(1e6), seed=1, data_file=None):
+
+    # The source of one chamber is sampled once into a single bank shared by every unit, so that settings.xml
+    # only holds the path of the bank whatever the number of units. The units are told apart by the vacuum
+    # cell their particles are born in.
+    fname = os.path.join(path, 'source.h5')
+    print('Writing %s' % (fname))
+    write_facility_bank(fname, get_tables(length, diameter, data_file=data_file), units, particles, seed=seed)
+    return get_file_source('source.h5', strength)
+
+def get_facility_model(length, diameter, strength, units, batches=10, particles=int(1e7), voxel=2.0,
+                       data_file=None, path='.', source_particles=int(1e6)):
+
+    check_units(length, diameter, units)
+    mat_dict = get_materials()
+    geometry, vacuums, tally = get_facility_geometry(length, diameter, mat_dict, units)
+    tallies  = get_facility_tallies(length, diameter, units, vacuums, tally, voxel)
+    source   = get_facility_source(length, diameter, strength, units, path, source_particles, data_file=data_file)
+    settings = get_settings(source, batches, particles)
+
+    return {'materials.xml': openmc.Materials(mat_dict.values()),
+            'geometry.xml' : geometry,
+            'tallies.xml'  : tallies,
+            'settings.xml' : settings}
+
+def get_contributions(fname, num_units):
+
+    # Tallies of a facility run split by source unit: cell spectra indexed (source unit, tally unit, energy)
+    # and flux maps indexed (source unit, voxel), per source particle of the whole facility
+    cell = load_tally(fname, 'Cell tally', scores=['flux'])
+    mesh = load_tally(fname, 'Mesh tally', scores=['flux'])
+    return {'cell_mean': cell['mean'].reshape(num_units, num_units, -1),
+            'cell_std' : cell['std_dev'].reshape(num_units, num_units, -1),
+            'mesh_mean': mesh['mean'].reshape(num_units, -1),
+            'mesh_std' : mesh['std_dev'].reshape(num_units, -1)}
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Build a facility of several SHINE NDAS units')
+    parser.add_argument('-n', '--units'     , type=int  , default=4, help='units on a ring around the z axis')
+    parser.add_argument('-r', '--radius'    , type=float, default=30.0, help='radius of the ring [cm]')
+    parser.add_argument('--positions'       , type=float, nargs='+', default=None, metavar='X Y Z',
+                        help='unit origins instead of a ring, three values per unit [cm]')
+    parser.add_argument('--strengths'       , type=float, nargs='+', default=None,
+                        help='relative strength of each unit')
+    parser.add_argument('--strength'        , type=float, default=2.7e13, help='total source strength [n/s]')
+    parser.add_argument('--batches'         , type=int  , default=10)
+    parser.add_argument('--particles'       , type=float, default=1e7)
+    parser.add_argument('--voxel'           , type=float, default=2.0, help='mesh tally voxel size [cm]')
+    parser.add_argument('--source-particles', type=float, default=1e6, help='particles in the shared source bank')
+    parser.add_argument('-o', '--output'    , default='facility')
+    parser.add_argument('--run'             , action='store_true')
+    args = parser.parse_args()
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+
+    if args.positions:
+        points = np.array(args.positions).reshape(-1, 3)
+        units  = [{'translation': tuple(x), 'strength': 1.0} for x in points]
+        if args.strengths:
+            for unit, value in zip(units, args.strengths): unit['strength'] = value
+    else:
+        units = get_ring(args.units, args.radius, args.strengths)
+
+    os.makedirs(args.output, exist_ok=True)
+    t0      = time.perf_counter()
+    objects = get_facility_model(length, diameter, args.strength, units, args.batches, int(args.particles),
+                                 args.voxel, path=args.output, source_particles=int(args.source_particles))
+    write_model(args.output, objects)
+    sizes = {x: os.path.getsize(os.path.join(args.output, x)) for x in list(objects) + ['source.h5']}
+    print('%u units built in %.2f s, %s' % (len(units), time.perf_counter() - t0,
+                                            ', '.join('%s %.0f kB' % (x, y / 1024) for x, y in sizes.items())))
+
+    if args.run:
+        openmc.run(cwd=args.output)
+        result = get_contributions(os.path.join(args.output, 'statepoint.%u.h5' % (args.batches)), len(units))
+        for n in range(len(units)):
+            print('Unit %u source: %s' % (n, ' '.join('%.4e' % (x) for x in result['cell_mean'][n].sum(1))))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import concurrent.futures
+import json
+import os
+import time
+import traceback
+import numpy as np
+import openmc
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from openmc_tallies import load_tally
+from source_data import load_source_data
+from SHINE_NDAS import get_model, write_model
+from SHINE_NDAS_source import get_spatial_distribution, get_angular_distribution, get_energy_distribution
+
+# Tallies stored for every source slice
+TALLIES = ('Cell tally', 'Mesh tally')
+
+def get_groups(num_bins, num_groups):
+
+    # Boundaries (bin indices) of contiguous groups of source bins
+    return np.round(np.linspace(0, num_bins, num_groups + 1)).astype(int)
+
+def get_slice_source(length, diameter, z_groups, mu_groups, i, j, data_file=None):
+
+    # The source restricted to one group of z bins and one group of cosine bins, through the masks of the
+    # z histogram and cosine table. Within a group the bins keep their shape in the source data file.
+    data    = load_source_data(data_file)
+    z_mask  = np.zeros(len(data['z_p']))
+    mu_mask = np.zeros(len(data['mu_p']))
+    z_mask [z_groups [i]:z_groups [i + 1]] = 1
+    mu_mask[mu_groups[j]:mu_groups[j + 1]] = 1
+
+    source          = openmc.IndependentSource()
+    source.space    = get_spatial_distribution(length, diameter, mask=z_mask, data_file=data_file)
+    source.angle    = get_angular_distribution(mask=mu_mask, data_file=data_file)
+    source.energy   = get_energy_distribution(data_file)
+    source.particle = 'neutron'
+    return source
+
+def get_settings_record(args):
+
+    # Everything the slices depend on; a response directory only holds slices of one set of settings
+    return {'length'   : args.length,
+            'diameter' : args.diameter,
+            'batches'  : args.batches,
+            'particles': args.particles,
+            'z_groups' : args.z_groups,
+            'mu_groups': args.mu_groups,
+            'data_file': os.path.abspath(args.data) if args.data else None}
+
+def get_slice_name(root, i, j):
+
+    return os.path.join(root, 'slices', 'slice_%03u_%02u.npz' % (i, j))
+
+def run_slice(root, record, i, j, threads):
+
+    # One transport run per slice, in its own directory; the tallies are kept per source particle
+    fname = get_slice_name(root, i, j)
+    if os.path.exists(fname): return i, j, 'reused'
+
+    try:
+        data      = load_source_data(record['data_file'])
+        z_groups  = get_groups(len(data['z_p']) , record['z_groups'])
+        mu_groups = get_groups(len(data['mu_p']), record['mu_groups'])
+        source    = get_slice_source(record['length'], record['diameter'], z_groups, mu_groups, i, j,
+                                     record['data_file'])
+        path      = os.path.join(root, 'slice_%03u_%02u' % (i, j))
+        os.makedirs(path, exist_ok=True)
+
+        # Independent random streams, so the slices add up with independent errors
+        objects = get_model(record['length'], record['diameter'], 1.0, record['batches'], record['particles'],
+                            plots=False, source=source)
+        objects['settings.xml'].seed = 1 + i * record['mu_groups'] + j
+        write_model(path, objects)
+        openmc.run(cwd=path, threads=threads, output=False)
+
+        statepoint = os.path.join(path, 'statepoint.%u.h5' % (record['batches']))
+        arrays     = {}
+        for k, name in enumerate(TALLIES):
+            tally = load_tally(statepoint, name, scores=['flux'])
+            arrays['mean_%u' % (k)] = tally['mean'].ravel()
+            arrays['std_%u'  % (k)] = tally['std_dev'].ravel()
+            arrays['shape_%u' % (k)] = np.array(tally['mean'].shape)
+    except Exception:
+        return i, j, traceback.format_exc()
+
+    # Written last and atomically, so an interrupted slice is rerun
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    np.savez(fname + '.tmp.npz', **arrays)
+    os.replace(fname + '.tmp.npz', fname)
+    return i, j, 'done'
+
+def assemble(root, record):
+
+    # Response of every tally bin to one source particle in each slice, indexed (z group, cosine group, bin)
+    data      = load_source_data(record['data_file'])
+    z_groups  = get_groups(len(data['z_p']) , record['z_groups'])
+    mu_groups = get_groups(len(data['mu_p']), record['mu_groups'])
+    response  = {'z_groups': z_groups, 'mu_groups': mu_groups, 'z_p': data['z_p'], 'mu_p': data['mu_p']}
+    for i in range(record['z_groups']):
+        for j in range(record['mu_groups']):
+            with np.load(get_slice_name(root, i, j)) as f:
+                for k in range(len(TALLIES)):
+                    if i == 0 and j == 0:
+                        shape = (record['z_groups'], record['mu_groups'], len(f['mean_%u' % (k)]))
+                        response['mean_%u'  % (k)] = np.zeros(shape)
+                        response['std_%u'   % (k)] = np.zeros(shape)
+                        response['shape_%u' % (k)] = f['shape_%u' % (k)]
+                    response['mean_%u' % (k)][i, j] = f['mean_%u' % (k)]
+                    response['std_%u'  % (k)][i, j] = f['std_%u'  % (k)]
+
+    fname = os.path.join(root, 'response.npz')
+    print('Writing %s' % (fname))
+    np.savez(fname + '.tmp.npz', **response)
+    os.replace(fname + '.tmp.npz', fname)
+    return response
+
+def build_response(root, args, workers=1, threads=None):
+
+    # Slices already in root/slices are reused, so an interrupted build resumes where it stopped
+    record = get_settings_record(args)
+    fname  = os.path.join(root, 'response.json')
+    os.makedirs(root, exist_ok=True)
+    if os.path.exists(fname):
+        with open(fname, 'r') as r: stored = json.load(r)
+        if stored != record:
+            raise ValueError('%s was built with other settings: %s' % (root, json.dumps(stored)))
+    else:
+        with open(fname, 'w') as w: json.dump(record, w, indent=2)
+
+    slices  = [(i, j) for i in range(args.z_groups) for j in range(args.mu_groups)]
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    failed  = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_slice, root, record, i, j, threads) for i, j in slices]
+        for future in concurrent.futures.as_completed(futures):
+            i, j, status = future.result()
+            if status in ('done', 'reused'):
+                print('Slice %u, %u: %s' % (i, j, status))
+            else:
+                print('Slice %u, %u: failed\n%s' % (i, j, status))
+                failed.append((i, j))
+    if failed: raise RuntimeError('%u of %u slices failed, rerun to resume' % (len(failed), len(slices)))
+
+    return assemble(root, record)
+
+def load_response(fname):
+
+    with np.load(fname) as f: return {x: f[x] for x in f.files}
+
+def get_group_weights(values, groups):
+
+    # Source probability of each group, for one profile or one profile per row
+    values = np.atleast_2d(np.asarray(values, dtype=float))
+    sums   = np.add.reduceat(values, groups[:-1], axis=1)
+    return sums / np.sum(sums, 1, keepdims=True)
+
+def evaluate(response, z_p=None, mu_p=None, strength=1.0):
+
+    # Tallies of any z profile and cosine table (as in the source data file, one profile per row for many at
+    # once) from the slice responses: mean and standard deviation of every bin, per source particle times
+    # strength. Profiles are summed into the slice groups, whose inner shape is that of the data file.
+    z_p  = response['z_p']  if z_p  is None else z_p
+    mu_p = response['mu_p'] if mu_p is None else mu_p
+    single = np.ndim(z_p) == 1 and np.ndim(mu_p) == 1
+    w_z    = get_group_weights(z_p , response['z_groups'])
+    w_mu   = get_group_weights(mu_p, response['mu_groups'])
+    w_z, w_mu = np.broadcast_arrays(w_z[:, :, None], w_mu[:, None, :])
+    weights   = (w_z * w_mu).reshape(len(w_z), -1)
+
+    results = {}
+    for k, name in enumerate(TALLIES):
+        mean  = response['mean_%u' % (k)].reshape(weights.shape[1], -1)
+        std   = response['std_%u'  % (k)].reshape(weights.shape[1], -1)
+        shape = tuple(response['shape_%u' % (k)])
+        value = strength * (weights @ mean)
+        error = strength * np.sqrt(weights**2 @ std**2)
+        if single: value, error = value[0], error[0]
+        results[name] = {'mean'   : value.reshape(value.shape[:-1] + shape),
+                         'std_dev': error.reshape(error.shape[:-1] + shape)}
+    return results
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Build source-slice responses of the SHINE NDAS model, '
+                                                 'or evaluate them for other source profiles')
+    parser.add_argument('-o', '--output'   , default='response')
+    parser.add_argument('--length'         , type=float, default=137.0)
+    parser.add_argument('--diameter'       , type=float, default=3.29 * 2.54)
+    parser.add_argument('--batches'        , type=int  , default=10)
+    parser.add_argument('--particles'      , type=float, default=1e6, help='particles per batch of each slice')
+    parser.add_argument('--z-groups'       , type=int  , default=137, help='slices along z (137 is one per bin)')
+    parser.add_argument('--mu-groups'      , type=int  , default=1  , help='slices of the cosine table')
+    parser.add_argument('-d', '--data'     , default=None, help='source data file the slices are cut from')
+    parser.add_argument('-j', '--workers'  , type=int  , default=1, help='slices run at the same time')
+    parser.add_argument('-t', '--threads'  , type=int  , default=None, help='OpenMP threads per slice')
+    parser.add_argument('-e', '--evaluate' , nargs='+' , default=None,
+                        help='source data files to evaluate with an existing response')
+    args = parser.parse_args()
+    args.particles = int(args.particles)
+
+    if args.evaluate is None:
+        build_response(args.output, args, args.workers, args.threads)
+        return
+
+    fname    = os.path.join(args.output, 'response.npz')
+    print('Reading %s' % (fname))
+    response = load_response(fname)
+    z_p      = [load_source_data(x)['z_p']  for x in args.evaluate]
+    mu_p     = [load_source_data(x)['mu_p'] for x in args.evaluate]
+    t0       = time.perf_counter()
+    results  = evaluate(response, z_p, mu_p)
+    print('%u profiles in %.3f s' % (len(z_p), time.perf_counter() - t0))
+
+    # Totals over the bins of each tally, with the errors of the bins taken as independent
+    for n, name in enumerate(args.evaluate):
+        for tally, values in results.items():
+            print('%-30s %-10s %12.5e +- %.2e' % (name, tally, np.sum(values['mean'][n]),
+                                                  np.sqrt(np.sum(values['std_dev'][n]**2))))
+
+if __name__ == '__main__': main()
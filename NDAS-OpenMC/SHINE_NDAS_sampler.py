@@ -0,0 +1,241 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import time
+import numpy as np
+import h5py
+
+import os
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from source_bias import add_bias_arguments, get_bias_arguments
+from source_data import get_z_profile, get_mu_profile
+from SHINE_NDAS_source import get_spatial_distribution, get_angular_distribution, get_energy_distribution
+
+# Source particle layout used by openmc.write_source_file()
+POS_DTYPE    = np.dtype([('x', '<f8'), ('y', '<f8'), ('z', '<f8')])
+SOURCE_DTYPE = np.dtype([('r', POS_DTYPE), ('u', POS_DTYPE), ('E', '<f8'), ('time', '<f8'), ('wgt', '<f8'),
+                         ('delayed_group', '<i4'), ('surf_id', '<i4'), ('particle', '<i4')])
+
+def get_biased_table(p, bias=None):
+
+    # Bin probabilities of an analog table and of its biased version q = p * bias, with the weights p / q that
+    # keep the tallies unbiased (1 / bias, since source_bias.get_bias() keeps the sum of q at 1)
+    p = np.asarray(p, dtype=float) / np.sum(p)
+    q = p if bias is None else p * np.asarray(bias, dtype=float)
+    q = q / np.sum(q)
+    with np.errstate(divide='ignore', invalid='ignore'): w = np.where(q > 0, p / q, 0.0)
+    return p, np.cumsum(q), w
+
+def get_tables(length, diameter, z_bias=None, mu_bias=None, data_file=None):
+
+    # Pull the tables out of the same distributions used by get_source(). The z histogram and the cosine
+    # table are sampled biased (when a bias is given) straight from the source data, with the weights p / q.
+    dist_space  = get_spatial_distribution(length, diameter, data_file=data_file)
+    dist_angle  = get_angular_distribution(data_file=data_file)
+    dist_energy = get_energy_distribution(data_file)
+
+    tables = {}
+
+    # Histogram in z (bin probabilities from the linear source of the bins, all the same width)
+    z_p = get_z_profile(data_file)
+    tables['z_x'] = np.linspace(-length / 2, length / 2, len(z_p) + 1)
+    tables['z_p'], tables['z_cdf'], tables['z_wgt'] = get_biased_table(z_p, z_bias)
+
+    # Power law in r, uniform in phi
+    tables['r_a']    = dist_space.r.a
+    tables['r_b']    = dist_space.r.b
+    tables['r_n']    = dist_space.r.n
+    tables['phi_a']  = dist_space.phi.a
+    tables['phi_b']  = dist_space.phi.b
+    tables['origin'] = np.asarray(dist_space.origin, dtype=float)
+
+    # Histogram in mu, uniform in phi about the reference direction
+    mu_x, mu_p = get_mu_profile(data_file)
+    tables['mu_x'] = np.asarray(mu_x, dtype=float)
+    tables['mu_p'], tables['mu_cdf'], tables['mu_wgt'] = get_biased_table(mu_p, mu_bias)
+    tables['mu_phi_a']  = dist_angle.phi.a
+    tables['mu_phi_b']  = dist_angle.phi.b
+    tables['reference'] = np.asarray(dist_angle.reference_uvw, dtype=float)
+
+    # Linear-linear energy spectrum (bin probabilities from trapezoids)
+    e_x = np.asarray(dist_energy.x, dtype=float)
+    e_p = np.asarray(dist_energy.p, dtype=float)
+    e_a = 0.5 * (e_p[:-1] + e_p[1:]) * np.diff(e_x)
+    tables['e_x']   = e_x
+    tables['e_p']   = e_p
+    tables['e_cdf'] = np.cumsum(e_a) / np.sum(e_a)
+
+    return tables
+
+def sample_histogram(x, cdf, xi_bin, xi_pos):
+
+    # Pick the bin by CDF search, then sample uniformly inside of it
+    i = np.minimum(np.searchsorted(cdf, xi_bin, side='right'), len(cdf) - 1)
+    return x[i] + xi_pos * (x[i + 1] - x[i]), i
+
+def sample_linear(x, p, cdf, xi_bin, xi_pos):
+
+    # Pick the bin by CDF search, then invert the linear density inside of it
+    i = np.minimum(np.searchsorted(cdf, xi_bin, side='right'), len(cdf) - 1)
+    return sample_linear_bins(x[i], x[i + 1], p[i], p[i + 1], xi_pos), i
+
+def sample_linear_bins(x0, x1, p0, p1, xi):
+
+    # Inverse CDF of a linear density between (x0, p0) and (x1, p1)
+    dx    = x1 - x0
+    slope = (p1 - p0) / np.where(dx > 0, dx, 1)
+    area  = 0.5 * (p0 + p1) * dx
+    disc  = np.sqrt(np.maximum(p0**2 + 2 * slope * xi * area, 0))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = np.where(np.abs(slope) * dx > 1e-12 * (p0 + p1), (disc - p0) / slope, xi * dx)
+    return x0 + np.clip(step, 0, dx)
+
+def rotate_direction(mu, phi, reference):
+
+    # Build an orthonormal basis around the reference direction
+    w = reference / np.linalg.norm(reference)
+    a = np.array([1.0, 0.0, 0.0]) if abs(w[0]) < 0.9 else np.array([0.0, 1.0, 0.0])
+    a = a - np.dot(a, w) * w
+    a = a / np.linalg.norm(a)
+    b = np.cross(w, a)
+
+    s = np.sqrt(np.maximum(1 - mu**2, 0))
+    u = (mu[:, None] * w + (s * np.cos(phi))[:, None] * a + (s * np.sin(phi))[:, None] * b)
+    return u
+
+def sample_particles(tables, n, rng):
+
+    xi = rng.random((9, n))
+
+    # Position
+    z, iz = sample_histogram(tables['z_x'], tables['z_cdf'], xi[0], xi[1])
+    a     = tables['r_a'] ** (tables['r_n'] + 1)
+    b     = tables['r_b'] ** (tables['r_n'] + 1)
+    r     = (a + xi[2] * (b - a)) ** (1 / (tables['r_n'] + 1))
+    phi   = tables['phi_a'] + xi[3] * (tables['phi_b'] - tables['phi_a'])
+
+    # Direction
+    mu, imu = sample_histogram(tables['mu_x'], tables['mu_cdf'], xi[4], xi[5])
+    mu_phi  = tables['mu_phi_a'] + xi[6] * (tables['mu_phi_b'] - tables['mu_phi_a'])
+    u       = rotate_direction(mu, mu_phi, tables['reference'])
+
+    # Energy
+    E, _ = sample_linear(tables['e_x'], tables['e_p'], tables['e_cdf'], xi[7], xi[8])
+
+    particles = np.zeros(n, dtype=SOURCE_DTYPE)
+    particles['r']['x'] = tables['origin'][0] + r * np.cos(phi)
+    particles['r']['y'] = tables['origin'][1] + r * np.sin(phi)
+    particles['r']['z'] = tables['origin'][2] + z
+    particles['u']['x'] = u[:, 0]
+    particles['u']['y'] = u[:, 1]
+    particles['u']['z'] = u[:, 2]
+    particles['E']      = E
+    particles['wgt']    = tables['z_wgt'][iz] * tables['mu_wgt'][imu]
+
+    return particles
+
+def iter_particles(tables, n, batch_size=1000000, seed=1, sample=sample_particles):
+
+    # Stream the source in fixed-size batches from a single generator
+    rng = np.random.default_rng(seed)
+    for start in range(0, n, batch_size):
+        yield sample(tables, min(batch_size, n - start), rng)
+
+def write_source_bank(fname, tables, n, batch_size=1000000, seed=1, sample=sample_particles):
+
+    # Contiguous layout so that the bank can be memory-mapped afterwards
+    t0 = time.perf_counter()
+    with h5py.File(fname, 'w') as f:
+        f.attrs['filetype'] = np.bytes_('source')
+        dset  = f.create_dataset('source_bank', shape=(n,), dtype=SOURCE_DTYPE)
+        start = 0
+        for particles in iter_particles(tables, n, batch_size, seed, sample):
+            dset[start:start + len(particles)] = particles
+            start += len(particles)
+    elapsed = time.perf_counter() - t0
+
+    return n / elapsed if elapsed > 0 else float('inf')
+
+def read_source_bank(fname, mmap=True):
+
+    # Memory-map the bank when it is stored contiguously, otherwise read it
+    with h5py.File(fname, 'r') as f:
+        dset   = f['source_bank']
+        offset = dset.id.get_offset()
+        if not mmap or offset is None: return dset[()]
+        shape  = dset.shape
+    return np.memmap(fname, dtype=SOURCE_DTYPE, mode='r', offset=offset, shape=shape)
+
+def get_file_source(fname, strength):
+
+    import openmc
+    return openmc.FileSource(path=fname, strength=strength)
+
+def get_moments(x, p):
+
+    # First and second moments of a histogram, uniform within each bin
+    x0, x1 = x[:-1], x[1:]
+    return np.sum(p * (x0 + x1) / 2), np.sum(p * (x0**2 + x0 * x1 + x1**2) / 3)
+
+def check_source_bank(particles, tables):
+
+    # Compare sampled bin populations against the (biased) table probabilities, and the weighted moments of z
+    # and mu against those of the analog tables, as (weighted - analog) / standard error
+    results = {}
+    mu_ref  = np.dot(np.stack([particles['u']['x'], particles['u']['y'], particles['u']['z']], 1),
+                     tables['reference'] / np.linalg.norm(tables['reference']))
+    checks  = [('z', particles['r']['z'] - tables['origin'][2], tables['z_x'], tables['z_cdf']),
+               ('mu', mu_ref, tables['mu_x'], tables['mu_cdf']),
+               ('E', particles['E'], tables['e_x'], tables['e_cdf'])]
+    for name, vals, x, cdf in checks:
+        counts   = np.histogram(vals, bins=x)[0]
+        expected = np.diff(np.append(0, cdf)) * len(vals)
+        mask     = expected > 0
+        chi2     = np.sum((counts[mask] - expected[mask])**2 / expected[mask])
+        results[name] = chi2 / max(np.count_nonzero(mask) - 1, 1)
+
+    w = particles['wgt']
+    for name, vals in (('z', checks[0][1]), ('mu', mu_ref)):
+        analog = get_moments(tables['%s_x' % (name)], tables['%s_p' % (name)])
+        for k in (1, 2):
+            terms = w * vals**k
+            error = np.std(terms) / np.sqrt(len(vals))
+            results['%s moment %u' % (name, k)] = (np.mean(terms) - analog[k - 1]) / error if error > 0 else 0.0
+
+    return results
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Sample the SHINE NDAS source into an OpenMC source file')
+    parser.add_argument('-n', '--particles' , type=float, default=1e7)
+    parser.add_argument('-o', '--output'    , default='source.h5')
+    parser.add_argument('-b', '--batch-size', type=int, default=1000000)
+    parser.add_argument('-s', '--seed'      , type=int, default=1)
+    parser.add_argument('--check'           , action='store_true')
+    add_bias_arguments(parser)
+    args = parser.parse_args()
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+
+    z_bias, mu_bias = get_bias_arguments(args, length, diameter)
+    tables = get_tables(length, diameter, z_bias, mu_bias)
+    n      = int(args.particles)
+
+    print('Writing %s' % (args.output))
+    rate = write_source_bank(args.output, tables, n, args.batch_size, args.seed)
+    print('Sampled %u particles at %.3e particles/s' % (n, rate))
+
+    if args.check:
+        results = check_source_bank(read_source_bank(args.output), tables)
+        for name, value in results.items():
+            if ' moment ' in name: print('Weighted %-11s: %+.2f standard errors from the analog table' % (name, value))
+            else                 : print('Reduced chi-square for %-2s: %.3f' % (name, value))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,134 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import traceback
+import numpy as np
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from case_id import get_case_id
+from openmc_tallies import load_tally
+from stage_timing import stage, run_openmc, get_record, write_record
+from SHINE_NDAS import export_model
+
+# Inputs that define a case (anything that changes the results)
+PARAMETERS = ('length', 'diameter', 'strength', 'batches', 'particles')
+
+def get_cases(grid):
+
+    # Cartesian product of every parameter's values
+    names = [x for x in PARAMETERS if x in grid]
+    return [dict(zip(names, values)) for values in itertools.product(*[grid[x] for x in names])]
+
+def collect_tallies(path, batches):
+
+    # Reduce the cell and mesh tallies of one case to a row of the results table
+    fname      = os.path.join(path, 'statepoint.%u.h5' % (batches))
+    cell_tally = load_tally(fname, 'Cell tally')
+    mesh_tally = load_tally(fname, 'Mesh tally')
+
+    cell_mean = cell_tally['mean'].ravel()
+    cell_std  = cell_tally['std_dev'].ravel()
+    mesh_mean = mesh_tally['mean'].ravel()
+    mesh_std  = mesh_tally['std_dev'].ravel()
+    np.savez_compressed(os.path.join(path, 'tallies.npz'), cell_mean=cell_mean, cell_std=cell_std,
+                        mesh_mean=mesh_mean, mesh_std=mesh_std)
+
+    results = {}
+    nonzero = mesh_mean > 0
+    results['cell_flux']        = float(np.sum(cell_mean))
+    results['cell_flux_std']    = float(np.sqrt(np.sum(cell_std**2)))
+    results['mesh_flux_max']    = float(np.max(mesh_mean))
+    results['mesh_rel_err_max'] = float(np.max(mesh_std[nonzero] / mesh_mean[nonzero], initial=0))
+    return results
+
+def run_case(case, root, threads):
+
+    # Every case runs in its own directory, named by the hash of its inputs
+    case_id = get_case_id(case)
+    path    = os.path.join(root, 'case_%s' % (case_id))
+    fname   = os.path.join(path, 'results.json')
+    if os.path.exists(fname):
+        with open(fname, 'r') as r: return json.load(r)
+
+    os.makedirs(path, exist_ok=True)
+    record = {'case_id': case_id}
+    record.update(case)
+    timer  = []
+    try:
+        export_model(path, case['length'], case['diameter'], case['strength'],
+                     case['batches'], case['particles'], plots=False, timer=timer)
+        with stage(timer, 'openmc run') as item: run_openmc(path, threads, output=False, item=item)
+        with stage(timer, 'collect tallies'): record.update(collect_tallies(path, case['batches']))
+        record['status'] = 'done'
+        write_record(os.path.join(path, 'timing.json'),
+                     get_record(timer, os.path.join(path, 'statepoint.%u.h5' % (case['batches'])),
+                                case_id=case_id, threads=threads, **case))
+    except Exception:
+        record['status'] = 'failed'
+        with open(os.path.join(path, 'error.txt'), 'w') as w: w.write(traceback.format_exc())
+        return record
+
+    # Written last and atomically, so an interrupted case is rerun
+    with open(fname + '.tmp', 'w') as w: json.dump(record, w, indent=2)
+    os.replace(fname + '.tmp', fname)
+
+    return record
+
+def run_sweep(grid, root, workers=1, threads=None):
+
+    cases   = get_cases(grid)
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    os.makedirs(root, exist_ok=True)
+
+    records = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_case, case, root, threads): case for case in cases}
+        for future in concurrent.futures.as_completed(futures):
+            record = future.result()
+            print('Case %s: %s' % (record['case_id'], record['status']))
+            records.append(record)
+
+    # One row per case, in grid order
+    order   = {get_case_id(case): i for i, case in enumerate(cases)}
+    records = sorted(records, key=lambda x: order[x['case_id']])
+    fname   = os.path.join(root, 'results.csv')
+    columns = []
+    for record in records: columns += [x for x in record if x not in columns]
+    print('Writing %s' % (fname))
+    with open(fname, 'w', newline='') as w:
+        writer = csv.DictWriter(w, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(records)
+
+    return records
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Run a parameter sweep of the SHINE NDAS model')
+    parser.add_argument('--length'   , type=float, nargs='+', default=[137.0])
+    parser.add_argument('--diameter' , type=float, nargs='+', default=[3.29 * 2.54])
+    parser.add_argument('--strength' , type=float, nargs='+', default=[2.7e13])
+    parser.add_argument('--batches'  , type=int  , nargs='+', default=[10])
+    parser.add_argument('--particles', type=float, nargs='+', default=[1e7])
+    parser.add_argument('-j', '--workers', type=int, default=1, help='cases run at the same time')
+    parser.add_argument('-t', '--threads', type=int, default=None, help='OpenMP threads per case')
+    parser.add_argument('-o', '--output' , default='sweep')
+    args = parser.parse_args()
+
+    grid = {key: getattr(args, key) for key in PARAMETERS}
+    grid['particles'] = [int(x) for x in grid['particles']]
+
+    run_sweep(grid, args.output, args.workers, args.threads)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,162 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import json
+import os
+import shutil
+import numpy as np
+import openmc
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from openmc_tallies import get_transport_time
+from SHINE_NDAS import get_model, write_model
+from SHINE_NDAS_converge import get_errors
+
+def get_ww_mesh(tallies):
+
+    # Weight windows share the mesh of the mesh tally
+    tally = [x for x in tallies if x.name == 'Mesh tally'][0]
+    return tally.find_filter(openmc.MeshFilter).mesh
+
+def get_ww_model(length, diameter, strength, batches, particles, weight_windows=None, generate=False):
+
+    objects  = get_model(length, diameter, strength, batches, particles, plots=False)
+    settings = objects['settings.xml']
+    if weight_windows is not None:
+        settings.weight_windows    = openmc.hdf5_to_wws(weight_windows)
+        settings.weight_windows_on = True
+    if generate:
+        settings.weight_window_generators = openmc.WeightWindowGenerator(
+            get_ww_mesh(objects['tallies.xml']), particle_type='neutron', method='magic',
+            max_realizations=batches)
+    return objects
+
+def run_model(path, objects, threads=None):
+
+    # Statepoint written by the run
+    write_model(path, objects)
+    openmc.run(cwd=path, threads=threads, output=False)
+    batches = objects['settings.xml'].batches
+    return os.path.join(path, 'statepoint.%u.h5' % (batches))
+
+def generate_ww(path, length, diameter, strength, iterations=3, batches=10, particles=int(1e6), threads=None):
+
+    # MAGIC iterations: each run transports with the previous windows and writes improved ones
+    os.makedirs(path, exist_ok=True)
+    fname = None
+    for i in range(iterations):
+        objects = get_ww_model(length, diameter, strength, batches, particles, fname, generate=True)
+        run_model(path, objects, threads)
+        fname = os.path.join(path, 'weight_windows.%u.h5' % (i + 1))
+        print('Writing %s' % (fname))
+        shutil.copy(os.path.join(path, 'weight_windows.h5'), fname)
+
+    return fname
+
+def write_wwinp(fname, weight_windows):
+
+    # MCNP wwinp for a cylindrical (nr = 16) mesh: r, axial and theta meshes, one coarse bin per fine bin
+    ww     = openmc.hdf5_to_wws(weight_windows)[0]
+    mesh   = ww.mesh
+    r      = np.asarray(mesh.r_grid)
+    z      = np.asarray(mesh.z_grid)
+    theta  = np.asarray(mesh.phi_grid) / (2 * np.pi)
+    origin = np.asarray(mesh.origin) + [0, 0, z[0]]
+    energy = np.asarray(ww.energy_bounds)[1:] * 1e-6
+    lower  = np.asarray(ww.lower_ww_bounds).reshape(len(r) - 1, len(theta) - 1, len(z) - 1, len(energy))
+    lower  = np.where(lower > 0, lower, 0)
+
+    def block(values):
+        values = ['%13.5E' % (x) for x in values]
+        return [''.join(values[i:i + 6]) for i in range(0, len(values), 6)]
+
+    def coarse(bounds):
+        return block([0] + [x for b in bounds[1:] for x in (1, b - bounds[0], 1)])
+
+    lines = ['%10u%10u%10u%10u%20s%s' % (1, 1, 1, 16, '', 'SHINE NDAS'),
+             '%10u' % (len(energy))]
+    lines += block([len(r) - 1, len(z) - 1, len(theta) - 1] + list(origin))
+    lines += block([len(r) - 1, len(z) - 1, len(theta) - 1] + list(origin + [0, 0, z[-1] - z[0]]))
+    lines += block(list(origin + [1, 0, 0]) + [2])
+    lines += coarse(r) + coarse(z) + coarse(theta)
+    lines += block(energy)
+
+    # r varies fastest, then the axial position, then theta
+    for e in range(len(energy)):
+        lines += block(np.transpose(lower[:, :, :, e], (1, 2, 0)).ravel())
+
+    with open(fname, 'w') as w: w.write('\n'.join(lines) + '\n')
+
+def get_fom(fname, targets):
+
+    # FOM = 1 / (R^2 T) per target, with T the transport time reported by OpenMC (without initialization and
+    # reading cross sections, which weight windows do not change)
+    runtime = get_transport_time(fname)
+    errors  = get_errors(fname, targets)
+    return {x: {'rel_err': y, 'time': runtime, 'fom': 1 / (y**2 * runtime) if y > 0 else 0} for x, y in errors.items()}
+
+def compare_fom(path, length, diameter, strength, weight_windows, targets, batches=10, particles=int(1e6), threads=None):
+
+    # Same batches and particles with and without the weight windows
+    foms = {}
+    for label, ww in (('analog', None), ('weight_windows', weight_windows)):
+        run_path = os.path.join(path, label)
+        os.makedirs(run_path, exist_ok=True)
+        objects = get_ww_model(length, diameter, strength, batches, particles, ww)
+        fname       = run_model(run_path, objects, threads)
+        foms[label] = get_fom(fname, targets)
+
+    report = {'file': weight_windows, 'analog': foms['analog'], 'weight_windows': foms['weight_windows'], 'gain': {}}
+    for name in targets:
+        analog = foms['analog'][name]['fom']
+        report['gain'][name] = foms['weight_windows'][name]['fom'] / analog if analog > 0 else float('inf')
+        print('%-10s FOM gain %.2f' % (name, report['gain'][name]))
+
+    return report
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Generate weight windows for the SHINE NDAS model')
+    parser.add_argument('-i', '--iterations', type=int  , default=3)
+    parser.add_argument('-b', '--batches'   , type=int  , default=10)
+    parser.add_argument('-n', '--particles' , type=float, default=1e6)
+    parser.add_argument('-t', '--threads'   , type=int  , default=None)
+    parser.add_argument('-w', '--weight-windows', default=None, help='reuse these windows instead of generating new ones')
+    parser.add_argument('-o', '--output'    , default='ww')
+    parser.add_argument('--wwinp'           , default='wwinp')
+    parser.add_argument('--no-compare'      , action='store_true')
+    parser.add_argument('-p', '--production', type=int  , default=0, help='batches of a production run with the windows')
+    args = parser.parse_args()
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+    strength = 2.7e13
+    targets  = {'Cell tally': ('max', 0), 'Mesh tally': (95, 0)}
+
+    fname = args.weight_windows or generate_ww(args.output, length, diameter, strength, args.iterations,
+                                               args.batches, int(args.particles), args.threads)
+
+    wwinp = os.path.join(args.output, args.wwinp)
+    print('Writing %s' % (wwinp))
+    write_wwinp(wwinp, fname)
+
+    if not args.no_compare:
+        report = compare_fom(args.output, length, diameter, strength, fname, targets,
+                             args.batches, int(args.particles), args.threads)
+        rname = os.path.join(args.output, 'fom.json')
+        print('Writing %s' % (rname))
+        with open(rname, 'w') as w: json.dump(report, w, indent=2)
+
+    if args.production > 0:
+        path    = os.path.join(args.output, 'production')
+        objects = get_ww_model(length, diameter, strength, args.production, int(args.particles), fname)
+        os.makedirs(path, exist_ok=True)
+        run_model(path, objects, args.threads)
+
+if __name__ == '__main__': main()
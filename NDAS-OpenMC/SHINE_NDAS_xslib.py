@@ -0,0 +1,179 @@
+#!/usr/bin/python3
+
+# ******************************************************************************
+# Copyright 2025, SHINE Technologies. All rights reserved.
+# ******************************************************************************
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import h5py
+import numpy as np
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from source_data import load_source_data
+
+# Pruned libraries are kept here, one directory per full library and set of options
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'xslib')
+
+# Margin kept above the highest source energy when the energy grids are cut
+MARGIN = 0.01
+
+def get_source_max_energy(data_file=None):
+
+    # Highest neutron energy of the source (D-T neutrons emitted forward) [eV]: the end of the last nonzero
+    # bin of the spectra of the source data file, OpenMC's and MCNP's
+    data = load_source_data(data_file)
+    p    = np.maximum(data['e_p'], data['e_mu_p'].max(0))
+    last = np.nonzero(p)[0][-1]
+    return float(data['e_x'][min(last + 1, len(data['e_x']) - 1)])
+
+def get_nuclides():
+
+    # Nuclides of the materials of the model, with elements expanded to their natural isotopes
+    from SHINE_NDAS import get_materials
+    nuclides = set()
+    for material in get_materials().values(): nuclides.update(material.get_nuclides())
+    return sorted(nuclides)
+
+def get_temperature_names(group, temperatures):
+
+    # Temperatures of a nuclide (e.g. 294K) nearest to each one requested [K]
+    names  = list(group['kTs'].keys())
+    values = np.array([float(re.match(r'^(\d+)K$', x).group(1)) for x in names])
+    return sorted({names[int(np.argmin(np.abs(values - x)))] for x in temperatures})
+
+def copy_attrs(src, dst):
+
+    for key, value in src.attrs.items(): dst.attrs[key] = value
+
+def prune_nuclide(src, dst, temperatures, max_energy=None):
+
+    # Copy a nuclide's HDF5 file with only the temperatures kept (the 0 K elastic data go too). With a maximum
+    # energy, the energy grids end at the first point above it and reactions with a higher threshold are dropped.
+    # Returns the lowest top of the energy grids kept [eV].
+    top = np.inf
+    with h5py.File(src, 'r') as fi, h5py.File(dst + '.tmp', 'w') as fo:
+        copy_attrs(fi, fo)
+        for name, group in fi.items():
+            out   = fo.create_group(name)
+            keep  = get_temperature_names(group, temperatures)
+            every = set(group['kTs'].keys()) | {'0K'}
+            copy_attrs(group, out)
+
+            # Number of grid points kept at every temperature
+            points = {}
+            for temp in keep:
+                energy       = group['energy'][temp][()]
+                points[temp] = len(energy)
+                if max_energy: points[temp] = min(len(energy), int(np.searchsorted(energy, max_energy, 'right')) + 1)
+                top          = min(top, energy[points[temp] - 1])
+
+            for key, item in group.items():
+                if key in ('kTs', 'urr'):
+                    sub = out.create_group(key)
+                    copy_attrs(item, sub)
+                    for temp in keep:
+                        if temp in item: fi.copy(item[temp], sub, temp)
+                elif key == 'energy':
+                    sub = out.create_group(key)
+                    copy_attrs(item, sub)
+                    for temp in keep:
+                        sub.create_dataset(temp, data=item[temp][:points[temp]])
+                        copy_attrs(item[temp], sub[temp])
+                elif key == 'reactions':
+                    sub = out.create_group(key)
+                    copy_attrs(item, sub)
+                    for rname, reaction in item.items():
+                        start = {x: int(reaction[x]['xs'].attrs['threshold_idx']) for x in keep}
+                        if all(start[x] >= points[x] for x in keep): continue
+                        rout = sub.create_group(rname)
+                        copy_attrs(reaction, rout)
+                        for child, value in reaction.items():
+                            if child in keep:
+                                tout = rout.create_group(child)
+                                copy_attrs(value, tout)
+                                xs = value['xs']
+                                tout.create_dataset('xs', data=xs[:max(points[child] - start[child], 1)])
+                                copy_attrs(xs, tout['xs'])
+                            elif child not in every:
+                                fi.copy(value, rout, child)
+                else:
+                    fi.copy(item, out, key)
+    os.replace(dst + '.tmp', dst)
+    return top
+
+def get_key(cross_sections, nuclides, temperatures, max_energy):
+
+    text = json.dumps([os.path.abspath(cross_sections), nuclides, sorted(temperatures), max_energy])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def build_library(cross_sections=None, temperatures=(294,), max_energy=None, nuclides=None, root=CACHE_DIR,
+                  data_file=None):
+
+    # Pruned copy of the library with the nuclides of the model only, built once per set of options; returns
+    # the path of its cross_sections.xml. Every energy grid must reach the highest source energy, or OpenMC
+    # would lower its maximum energy and reject the source neutrons above it.
+    import openmc.data
+    from SHINE_NDAS import get_cross_sections
+
+    cross_sections = cross_sections or get_cross_sections()
+    nuclides       = nuclides or get_nuclides()
+    source_max     = get_source_max_energy(data_file)
+    if max_energy and max_energy < source_max:
+        raise ValueError('Maximum energy %g eV is below the source maximum %g eV' % (max_energy, source_max))
+    key            = get_key(cross_sections, nuclides, temperatures, max_energy)
+    path           = os.path.join(root, key[:16])
+    fname          = os.path.join(path, 'cross_sections.xml')
+    if os.path.exists(fname):
+        print('Reusing %s' % (fname))
+        return fname
+
+    library = {x['materials'][0]: x['path'] for x in openmc.data.DataLibrary.from_xml(cross_sections).libraries
+               if x['type'] == 'neutron'}
+    missing = [x for x in nuclides if x not in library]
+    if missing: raise KeyError('Not in %s: %s' % (cross_sections, ', '.join(missing)))
+
+    os.makedirs(path, exist_ok=True)
+    pruned = openmc.data.DataLibrary()
+    before = 0
+    after  = 0
+    for nuclide in nuclides:
+        dst = os.path.join(path, '%s.h5' % (nuclide))
+        print('Writing %s' % (dst))
+        top = prune_nuclide(library[nuclide], dst, temperatures, max_energy)
+        if top < source_max:
+            raise ValueError('%s ends at %g eV, below the source maximum %g eV' % (nuclide, top, source_max))
+        pruned.register_file(dst)
+        before += os.path.getsize(library[nuclide])
+        after  += os.path.getsize(dst)
+
+    # Written last, so an interrupted build is redone
+    print('Writing %s (%.0f MB of %.0f MB)' % (fname, after / 2**20, before / 2**20))
+    pruned.export_to_xml(fname + '.tmp')
+    os.replace(fname + '.tmp', fname)
+    return fname
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Build a cross section library with only the data the SHINE NDAS '
+                                                 'model needs')
+    parser.add_argument('-l', '--library'     , default=None, help='full cross_sections.xml')
+    parser.add_argument('-T', '--temperatures', type=float, nargs='+', default=[294], help='temperatures kept [K]')
+    parser.add_argument('-e', '--max-energy'  , nargs='?', default=None, const='source',
+                        help='drop data above this energy [eV], or just above the source maximum without a value')
+    parser.add_argument('-d', '--data'        , default=None, help='source data file (default: SHINE_NDAS_source.npz)')
+    parser.add_argument('-o', '--output'      , default=CACHE_DIR)
+    args = parser.parse_args()
+
+    max_energy = args.max_energy
+    if max_energy == 'source': max_energy = get_source_max_energy(args.data) * (1 + MARGIN)
+    elif max_energy          : max_energy = float(max_energy)
+    fname = build_library(args.library, args.temperatures, max_energy, root=args.output, data_file=args.data)
+    print('export SHINE_NDAS_CROSS_SECTIONS=%s' % (os.path.abspath(fname)))
+
+if __name__ == '__main__': main()
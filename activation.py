@@ -0,0 +1,280 @@
+#!/usr/bin/python3
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+
+from mcnp_mctal import get_tally
+from openmc_tallies import load_tally, get_filter_bins
+from geometry_outline import get_tally_volume
+
+# Layout version of the cached group cross sections
+VERSION = 1
+
+# Materials of get_materials() (NDAS-OpenMC/SHINE_NDAS.py), and the MCNP deck of the nominal model that gives
+# the tally cell volume of statepoints without a geometry.xml
+MATERIALS = ('SS304', 'Cu', 'H2O')
+DECK      = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'NDAS-MCNP', 'SHINE_NDAS.i')
+
+# Activation reactions: target, MT, product, half-life [s] and the photon lines of the product [(MeV, per decay)]
+# (ENDF/B-VIII.0 decay data, lines under 1% left out; 0.511 MeV lines are the annihilation photons of beta+)
+HOUR = 3600.0
+DAY  = 24 * HOUR
+YEAR = 365.25 * DAY
+REACTIONS = (
+    ('Fe56', 103, 'Mn56', 2.5789 * HOUR, [(0.8468, 0.989), (1.8107, 0.272), (2.1131, 0.143)]),
+    ('Fe54', 103, 'Mn54', 312.20 * DAY , [(0.8348, 1.000)]),
+    ('Fe58', 102, 'Fe59', 44.495 * DAY , [(1.0992, 0.565), (1.2916, 0.432)]),
+    ('Mn55', 102, 'Mn56', 2.5789 * HOUR, [(0.8468, 0.989), (1.8107, 0.272), (2.1131, 0.143)]),
+    ('Cr50', 102, 'Cr51', 27.701 * DAY , [(0.3201, 0.099)]),
+    ('Ni58', 103, 'Co58', 70.86  * DAY , [(0.8108, 0.994), (0.5110, 0.298)]),
+    ('Ni60', 103, 'Co60', 5.2714 * YEAR, [(1.1732, 0.999), (1.3325, 1.000)]),
+    ('Ni58',  16, 'Ni57', 35.60  * HOUR, [(1.3776, 0.817), (0.5110, 0.870), (0.1274, 0.167)]),
+    ('Cu63', 102, 'Cu64', 12.701 * HOUR, [(0.5110, 0.352)]),
+    ('Cu65', 102, 'Cu66', 5.120  * 60  , [(1.0394, 0.092)]),
+    ('Cu63',  16, 'Cu62', 9.67   * 60  , [(0.5110, 1.953)]),
+    ('Cu65',  16, 'Cu64', 12.701 * HOUR, [(0.5110, 0.352)]),
+    ('O16' , 103, 'N16' , 7.13         , [(6.1289, 0.670), (7.1151, 0.049)]))
+
+# Partial reactions summed when a library has no total for an MT (n,p levels)
+PARTIALS = {103: range(600, 650)}
+
+# Contact dose of a semi-infinite slab (as in FISPACT): 5.76e-10 Sv/h per MeV/kg/s times the buildup over two and
+# the ratio of the energy absorption coefficient of air to the attenuation coefficient of the material
+# (NIST, cm^2/g, at the energies [MeV] below)
+DOSE_FACTOR = 5.76e-10
+BUILDUP     = 2.0
+MU_ENERGY   = np.array([0.1    , 0.3    , 0.5    , 1.0    , 2.0    , 5.0    , 10.0   ])
+MU_EN_AIR   = np.array([0.02325, 0.02872, 0.02966, 0.02789, 0.02345, 0.01740, 0.01450])
+MU_MATERIAL = {'SS304': np.array([0.3717, 0.1080, 0.08414, 0.05995, 0.04265, 0.03066, 0.02994]),
+               'Cu'   : np.array([0.4584, 0.1083, 0.08362, 0.05901, 0.04205, 0.03070, 0.03059]),
+               'H2O'  : np.array([0.1707, 0.1186, 0.09687, 0.07072, 0.04942, 0.03031, 0.02219])}
+
+_cache = {}
+
+def get_reaction_name(reaction):
+
+    kind = {102: 'n,g', 103: 'n,p', 16: 'n,2n'}.get(reaction[1], 'MT%u' % (reaction[1]))
+    return '%s(%s)%s' % (reaction[0], kind, reaction[2])
+
+def collapse(energy, sigma, edges):
+
+    # Group average of a pointwise cross section, weighted by 1/E (flat in lethargy) within each group. The cross
+    # section is linear between its points and zero outside them, so each interval integrates exactly.
+    grid = np.union1d(energy, edges)
+    grid = grid[grid > 0]
+    s    = np.interp(grid, energy, sigma)
+    b    = np.diff(s) / np.diff(grid)
+    a    = s[:-1] - b * grid[:-1]
+    part = a * np.log(grid[1:] / grid[:-1]) + b * np.diff(grid)
+    mid  = 0.5 * (grid[1:] + grid[:-1])
+    part[(mid < energy[0]) | (mid > energy[-1])] = 0
+    cum  = np.concatenate(([0], np.cumsum(part)))
+    at   = np.interp(edges, grid, cum)
+    return np.diff(at) / np.log(edges[1:] / edges[:-1])
+
+def compute_group_data(library, edges):
+
+    # Group cross sections of every reaction and the target atom densities of every material, read with OpenMC
+    import openmc
+    import openmc.data
+    import sys
+    sys.dont_write_bytecode = True
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'NDAS-OpenMC'))
+    from SHINE_NDAS import get_materials
+
+    mats      = get_materials()
+    library   = library or openmc.Materials.cross_sections
+    paths     = {x['materials'][0]: x['path'] for x in openmc.data.DataLibrary.from_xml(library).libraries
+                 if x['type'] == 'neutron'}
+    sigma     = np.zeros((len(REACTIONS), len(edges) - 1))
+    densities = np.zeros((len(MATERIALS), len(REACTIONS)))
+    nuclides  = {}
+    for r, (target, mt, _, _, _) in enumerate(REACTIONS):
+        if target not in nuclides: nuclides[target] = openmc.data.IncidentNeutron.from_hdf5(paths[target])
+        data        = nuclides[target]
+        temperature = sorted(data.temperatures)[0]
+        parts       = [mt] if mt in data.reactions else [x for x in PARTIALS.get(mt, []) if x in data.reactions]
+        for part in parts:
+            xs = data.reactions[part].xs[temperature]
+            sigma[r] += collapse(xs.x, xs.y, edges)
+        for m, name in enumerate(MATERIALS):
+            densities[m, r] = mats[name].get_nuclide_atom_densities().get(target, 0.0)
+
+    return {'edges'    : edges,
+            'sigma'    : sigma * 1e-24,
+            'densities': densities * 1e24,
+            'mass'     : np.array([mats[x].get_mass_density() for x in MATERIALS])}
+
+def get_group_data(library=None, edges=None, cache=True):
+
+    # Cross sections [cm^2] of every reaction in the groups of the cell tally (CCFE-709), target atom densities
+    # [atoms/cm^3] and mass densities [g/cm^3] of every material, cached in .cache/ so OpenMC and the nuclear data
+    # are only needed the first time
+    if edges is None:
+        import openmc.mgxs
+        edges = np.asarray(openmc.mgxs.GROUP_STRUCTURES['CCFE-709'], dtype=float)
+    library = library or os.environ.get('SHINE_NDAS_CROSS_SECTIONS') or os.environ.get('OPENMC_CROSS_SECTIONS', '')
+    text    = json.dumps([VERSION, os.path.abspath(library) if library else '', MATERIALS,
+                          [x[:3] for x in REACTIONS]])
+    digest  = hashlib.sha256(text.encode())
+    digest.update(np.ascontiguousarray(edges).tobytes())
+    key     = digest.hexdigest()
+    fname   = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'group_xs.%s.npz' % (key[:16]))
+    if key in _cache: return _cache[key]
+
+    if cache and os.path.exists(fname):
+        with np.load(fname) as f: data = {x: f[x] for x in f.files}
+    else:
+        data = compute_group_data(library, edges)
+        if cache:
+            os.makedirs(os.path.dirname(fname), exist_ok=True)
+            np.savez(fname + '.tmp.npz', **data)
+            os.replace(fname + '.tmp.npz', fname)
+
+    _cache[key] = data
+    return data
+
+def load_openmc_flux(fname, deck=DECK):
+
+    # Group flux [n/cm^2-s] of the cell tally of a statepoint (OpenMC normalizes it to the source strength)
+    tally = load_tally(fname, 'Cell tally', scores=['flux'])
+    edges = get_filter_bins(tally, 'energy')
+    return edges, tally['mean'][:, 0] / get_tally_volume(fname, deck)
+
+def load_mcnp_flux(fname):
+
+    # Group flux [n/cm^2-s] of the F14 tally of an mctal file (fm14 holds the source strength)
+    tally = get_tally(fname, 14)
+    edges = tally['e'] * 1e6
+    return edges, tally['value'][0, 0, 0, 0, 0, 0, 1:len(edges), 0]
+
+def get_schedule_arrays(schedules):
+
+    # Schedules as [(duration [s], fraction of full power)] padded to one length with empty steps
+    num_steps = max(len(x) for x in schedules)
+    durations = np.zeros((len(schedules), num_steps))
+    fractions = np.zeros((len(schedules), num_steps))
+    for k, schedule in enumerate(schedules):
+        for n, (duration, fraction) in enumerate(schedule):
+            durations[k, n] = duration
+            fractions[k, n] = fraction
+    return durations, fractions
+
+def get_activation(flux, schedules, cooling, data):
+
+    # Reaction rates, inventories, activities and contact dose rates of every material for every flux spectrum
+    # (one per row, on the edges of data) and every irradiation schedule, after every cooling time [s].
+    # Products are built by one reaction from a target that is not depleted, so each step of a schedule has
+    # an exact solution and a schedule is a sum over its steps.
+    flux    = np.atleast_2d(flux)
+    cooling = np.asarray(cooling, dtype=float)
+    lam     = np.log(2) / np.array([x[3] for x in REACTIONS])
+
+    # Reactions per target atom and per second [S, R], and per cm^3 of each material at full power [S, M, R]
+    rates      = flux @ data['sigma'].T
+    production = rates[:, None, :] * data['densities'][None, :, :]
+
+    # Atoms at the end of each schedule per atom produced per second: each step builds up for its duration,
+    # then decays during the steps after it [K, R]
+    durations, fractions = get_schedule_arrays(schedules)
+    after   = np.cumsum(durations[:, ::-1], 1)[:, ::-1] - durations
+    build   = -np.expm1(-lam[None, None, :] * durations[:, :, None]) / lam[None, None, :]
+    decay   = np.exp(-lam[None, None, :] * after[:, :, None])
+    buildup = np.sum(fractions[:, :, None] * build * decay, 1)
+
+    # Inventories [S, M, K, C, R] in atoms/cm^3 and activities in Bq/cm^3
+    cooled    = np.exp(-lam[None, :] * cooling[:, None])
+    inventory = production[:, :, None, None, :] * buildup[None, None, :, None, :] * cooled[None, None, None, :, :]
+    activity  = inventory * lam
+
+    # Photon energy emitted per decay, weighted by the absorption in air over the attenuation in each material
+    weights = np.zeros((len(MATERIALS), len(REACTIONS)))
+    for m, name in enumerate(MATERIALS):
+        for r, reaction in enumerate(REACTIONS):
+            energy, intensity = np.array(reaction[4]).T
+            ratio = np.interp(np.log(energy), np.log(MU_ENERGY), MU_EN_AIR / MU_MATERIAL[name])
+            weights[m, r] = np.sum(energy * intensity * ratio)
+    dose = DOSE_FACTOR * BUILDUP / 2 * np.einsum('smkcr,mr->smkc', activity, weights) / \
+           (data['mass'][None, :, None, None] * 1e-3)
+
+    return {'rates'    : rates,
+            'inventory': inventory,
+            'activity' : activity,
+            'dose'     : dose}
+
+def get_continuous(times):
+
+    # Irradiation at full power for each of the times [s]
+    return [[(x, 1.0)] for x in times]
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Reaction rates, activation and contact dose rates from the cell '
+                                                 'tally spectra of the SHINE NDAS models')
+    parser.add_argument('-s', '--statepoint', nargs='*', default=[], help='OpenMC statepoints')
+    parser.add_argument('-m', '--mctal'     , nargs='*', default=[], help='MCNP mctal files')
+    parser.add_argument('--schedules'       , default=None,
+                        help='JSON file of schedules, each a list of [duration [s], fraction of full power]')
+    parser.add_argument('--irradiation'     , type=float, nargs='+', default=[1, 24, 24 * 7, 24 * 365.25],
+                        help='continuous irradiation times [h], without --schedules')
+    parser.add_argument('--cooling'         , type=float, nargs='+', default=[0, 1, 24, 24 * 7, 24 * 30, 24 * 365.25],
+                        help='cooling times [h]')
+    parser.add_argument('--library'         , default=None, help='OpenMC cross_sections.xml')
+    parser.add_argument('-o', '--output'    , default=None, help='npz file of every result')
+    args = parser.parse_args()
+
+    # Spectra of every input on the same groups
+    names   = []
+    spectra = []
+    for fname in args.statepoint:
+        print('Reading %s' % (fname))
+        names.append(fname)
+        spectra.append(load_openmc_flux(fname))
+    for fname in args.mctal:
+        print('Reading %s' % (fname))
+        names.append(fname)
+        spectra.append(load_mcnp_flux(fname))
+    if not spectra: parser.error('no statepoint or mctal file given')
+
+    edges = spectra[0][0]
+    for fname, (other, _) in zip(names, spectra):
+        if len(other) != len(edges) or not np.allclose(other, edges, rtol=1e-4):
+            raise ValueError('%s does not have the energy groups of %s' % (fname, names[0]))
+    flux = np.array([x[1] for x in spectra])
+
+    if args.schedules:
+        print('Reading %s' % (args.schedules))
+        with open(args.schedules, 'r') as r: schedules = json.load(r)
+        labels = ['schedule %u' % (k) for k in range(len(schedules))]
+    else:
+        schedules = get_continuous(np.array(args.irradiation) * HOUR)
+        labels    = ['%g h' % (x) for x in args.irradiation]
+    cooling = np.array(args.cooling) * HOUR
+
+    data    = get_group_data(args.library, edges)
+    t0      = time.perf_counter()
+    results = get_activation(flux, schedules, cooling, data)
+    print('%u spectra, %u schedules, %u cooling times in %.3f s' %
+          (len(flux), len(schedules), len(cooling), time.perf_counter() - t0))
+
+    for s, name in enumerate(names):
+        print(name)
+        for r, reaction in enumerate(REACTIONS):
+            print('  %-18s %12.4e reactions/atom-s' % (get_reaction_name(reaction), results['rates'][s, r]))
+        for m, material in enumerate(MATERIALS):
+            print('  %-6s %-12s %s' % (material, 'cooling [h]', ' '.join('%10g' % (x) for x in args.cooling)))
+            for k, label in enumerate(labels):
+                print('  %-6s %-12s %s' % ('', label, ' '.join('%10.3e' % (x) for x in results['dose'][s, m, k])))
+        print('  contact dose rates in Sv/h')
+
+    if args.output:
+        print('Writing %s' % (args.output))
+        np.savez(args.output, names=np.array(names), flux=flux, edges=edges, cooling=cooling,
+                 materials=np.array(MATERIALS), reactions=np.array([get_reaction_name(x) for x in REACTIONS]),
+                 **results)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import time
+import numpy as np
+
+import sys
+sys.dont_write_bytecode = True
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'NDAS-OpenMC'))
+from mcnp_mctal import get_tally as get_mctal_tally
+from mcnp_meshtal import get_tally as get_meshtal_tally
+
+# Benchmark metrics and whether larger values are better
+METRICS = {'setup_time'     : False,
+           'transport_time' : False,
+           'particles_per_s': True,
+           'peak_memory'    : False,
+           'fom_cell'       : True,
+           'fom_mesh'       : True}
+
+# Error statistics used for the figures of merit (as in SHINE_NDAS_converge.py)
+MESH_PERCENTILE = 95
+
+def run_command(args, cwd, log):
+
+    # Wall-clock time and peak resident memory of one child process
+    with open(os.path.join(cwd, log), 'w') as w:
+        t0   = time.perf_counter()
+        proc = subprocess.Popen(args, cwd=cwd, stdout=w, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0: raise RuntimeError('%s failed, see %s' % (args[0], os.path.join(cwd, log)))
+    return elapsed, usage.ru_maxrss * 1024
+
+def get_fom(rel_err, seconds):
+
+    return 1 / (rel_err**2 * seconds) if rel_err > 0 and seconds > 0 else 0.0
+
+def get_rel_err(value, error, stat):
+
+    # Relative errors of the bins that scored, reduced to a max or a percentile
+    error = np.asarray(error)[np.asarray(value) != 0]
+    if len(error) == 0: return float('inf')
+    return float(np.max(error)) if stat == 'max' else float(np.percentile(error, stat))
+
+def bench_openmc(path, particles, batches, seed, threads):
+
+    import openmc
+    from openmc_tallies import read_runtime, get_transport_time
+    from SHINE_NDAS import get_model, write_model
+    from SHINE_NDAS_converge import get_errors
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+    strength = 2.7e13
+
+    # Model construction and export count as setup, along with OpenMC's own initialization
+    os.makedirs(path, exist_ok=True)
+    t0 = time.perf_counter()
+    objects = get_model(length, diameter, strength, batches, particles, plots=False)
+    objects['settings.xml'].seed = seed
+    write_model(path, objects)
+    build = time.perf_counter() - t0
+
+    args = ['openmc'] + (['-s', str(threads)] if threads else [])
+    wall, memory = run_command(args, path, 'openmc.log')
+
+    fname   = os.path.join(path, 'statepoint.%u.h5' % (batches))
+    timers  = read_runtime(fname)
+    setup   = build + timers.get('total initialization', 0.0)
+    elapsed = get_transport_time(fname)
+    errors  = get_errors(fname, {'Cell tally': ('max', 0), 'Mesh tally': (MESH_PERCENTILE, 0)})
+
+    return {'status'         : 'done',
+            'version'        : str(openmc.__version__),
+            'wall_time'      : wall,
+            'setup_time'     : setup,
+            'transport_time' : elapsed,
+            'particles_per_s': particles * batches / elapsed,
+            'peak_memory'    : memory,
+            'rel_err_cell'   : errors['Cell tally'],
+            'rel_err_mesh'   : errors['Mesh tally'],
+            'fom_cell'       : get_fom(errors['Cell tally'], elapsed),
+            'fom_mesh'       : get_fom(errors['Mesh tally'], elapsed)}
+
+def get_mcnp_deck(fname, nps, seed):
+
+    # Fixed particle count and random number seed
+    with open(fname, 'r') as r: deck = r.read()
+    deck, count = re.subn(r'^ *nps .*$', '  nps       %u\n  rand    seed=%u' % (nps, seed), deck, 1, re.M)
+    if count != 1: raise ValueError('No nps card in %s' % (fname))
+    return deck
+
+def get_mcnp_transport_time(fname):
+
+    # Computer time of the transport (mcrun) from the problem summary of outp, or else the ctm of the last dump,
+    # in seconds. None when outp holds neither.
+    with open(fname, 'r') as r: text = r.read()
+    values = re.findall(r'computer time in mcrun +([-+.0-9Ee]+) +minutes', text)
+    values = values or re.findall(r'ctm = +([-+.0-9Ee]+)', text)
+    return 60 * float(values[-1]) if values else None
+
+def bench_mcnp(path, nps, seed, threads, executable='mcnp6'):
+
+    # Without MCNP the entry is a stub, so that the results keep the same layout
+    if shutil.which(executable) is None:
+        return {'status': 'stub', 'reason': '%s not found' % (executable)}
+
+    deck_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'NDAS-MCNP')
+    os.makedirs(path, exist_ok=True)
+    for name in ('outp', 'runtpe', 'mctal', 'meshtal'):
+        if os.path.exists(os.path.join(path, name)): os.remove(os.path.join(path, name))
+    shutil.copy(os.path.join(deck_dir, 'SHINE_NDAS_source.txt'), path)
+    with open(os.path.join(path, 'SHINE_NDAS.i'), 'w') as w:
+        w.write(get_mcnp_deck(os.path.join(deck_dir, 'SHINE_NDAS.i'), nps, seed))
+
+    args = [executable, 'i=SHINE_NDAS.i'] + (['tasks', str(threads)] if threads else [])
+    wall, memory = run_command(args, path, 'mcnp.log')
+
+    cell     = get_mctal_tally(os.path.join(path, 'mctal'), 14)
+    mesh     = get_meshtal_tally(os.path.join(path, 'meshtal'), 24)
+    err_cell = get_rel_err(cell['value'], cell['error'], 'max')
+    err_mesh = get_rel_err(mesh['mean'], mesh['error'], MESH_PERCENTILE)
+
+    # Setup is whatever the run spent outside of the transport. Without a transport time in outp the numbers are
+    # based on the wall time of the whole process, and are labeled as such.
+    elapsed = get_mcnp_transport_time(os.path.join(path, 'outp'))
+    timing  = 'wall' if elapsed is None else 'mcrun'
+    setup   = None if elapsed is None else max(wall - elapsed, 0.0)
+    elapsed = wall if elapsed is None else elapsed
+
+    return {'status'         : 'done',
+            'timing'         : timing,
+            'wall_time'      : wall,
+            'setup_time'     : setup,
+            'transport_time' : elapsed,
+            'particles_per_s': nps / elapsed,
+            'peak_memory'    : memory,
+            'rel_err_cell'   : err_cell,
+            'rel_err_mesh'   : err_mesh,
+            'fom_cell'       : get_fom(err_cell, elapsed),
+            'fom_mesh'       : get_fom(err_mesh, elapsed)}
+
+def get_metadata(args):
+
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date'     : datetime.datetime.now().isoformat(timespec='seconds'),
+            'host'     : platform.node(),
+            'cpus'     : os.cpu_count(),
+            'commit'   : commit,
+            'particles': args.particles,
+            'batches'  : args.batches,
+            'seed'     : args.seed,
+            'threads'  : args.threads}
+
+def compare(results, baseline, tolerance=0.1):
+
+    # Relative change of every metric, flagged when it is worse than the tolerance
+    rows = []
+    for code in results['codes']:
+        new = results['codes'][code]
+        old = baseline.get('codes', {}).get(code, {})
+        if new.get('status') != 'done' or old.get('status') != 'done': continue
+        # MCNP numbers based on the wall time are left out, as are results timed differently from the baseline
+        if new.get('timing') != old.get('timing') or new.get('timing') == 'wall': continue
+        for metric, higher in METRICS.items():
+            if not new.get(metric) or not old.get(metric): continue
+            ratio = new[metric] / old[metric]
+            worse = ratio < 1 - tolerance if higher else ratio > 1 + tolerance
+            rows.append({'code': code, 'metric': metric, 'baseline': old[metric], 'value': new[metric],
+                         'ratio': ratio, 'status': 'worse' if worse else 'ok'})
+    return rows
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Benchmark the SHINE NDAS models')
+    parser.add_argument('-n', '--particles', type=float, default=1e6, help='OpenMC particles per batch')
+    parser.add_argument('-b', '--batches'  , type=int  , default=10)
+    parser.add_argument('-s', '--seed'     , type=int  , default=1)
+    parser.add_argument('-t', '--threads'  , type=int  , default=None)
+    parser.add_argument('-c', '--codes'    , nargs='+' , default=['openmc', 'mcnp'])
+    parser.add_argument('-o', '--output'   , default='benchmark')
+    parser.add_argument('--baseline'       , default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline'  , action='store_true')
+    parser.add_argument('--tolerance'      , type=float, default=0.1)
+    args = parser.parse_args()
+
+    particles = int(args.particles)
+    results   = {'metadata': get_metadata(args), 'codes': {}}
+    if 'openmc' in args.codes:
+        results['codes']['openmc'] = bench_openmc(os.path.join(args.output, 'openmc'), particles, args.batches,
+                                                  args.seed, args.threads)
+    if 'mcnp' in args.codes:
+        results['codes']['mcnp'] = bench_mcnp(os.path.join(args.output, 'mcnp'), particles * args.batches,
+                                              args.seed, args.threads)
+
+    for code, result in results['codes'].items():
+        if result['status'] != 'done':
+            print('%-6s %s (%s)' % (code, result['status'], result.get('reason', '')))
+            continue
+        print('%-6s %.3e particles/s, %s %.1f s, peak memory %.0f MB, FOM cell %.3e, mesh %.3e' %
+              (code, result['particles_per_s'], 'wall' if result.get('timing') == 'wall' else 'transport',
+               result['transport_time'], result['peak_memory'] / 2**20, result['fom_cell'], result['fom_mesh']))
+
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        print('Reading %s' % (args.baseline))
+        with open(args.baseline, 'r') as r: baseline = json.load(r)
+        results['comparison'] = compare(results, baseline, args.tolerance)
+        for row in results['comparison']:
+            print('%-6s %-15s %11.4e -> %11.4e (x%.3f) %s' % (row['code'], row['metric'], row['baseline'],
+                                                             row['value'], row['ratio'], row['status']))
+
+    os.makedirs(args.output, exist_ok=True)
+    fname = os.path.join(args.output, 'results.json')
+    print('Writing %s' % (fname))
+    with open(fname, 'w') as w: json.dump(results, w, indent=2)
+
+    if args.save_baseline:
+        print('Writing %s' % (args.baseline))
+        with open(args.baseline, 'w') as w: json.dump(results, w, indent=2)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+
+import argparse
+import concurrent.futures
+import hashlib
+import json
+import os
+import traceback
+
+import plot_meshtal
+import plot_source
+import plot_spectrum
+
+# Inputs of a case directory, relative to it
+SOURCE     = 'SHINE_NDAS_source.npz'
+MESHTAL    = os.path.join('NDAS-MCNP', 'meshtal')
+MCTAL      = os.path.join('NDAS-MCNP', 'mctal')
+STATEPOINT = os.path.join('NDAS-OpenMC', 'statepoint.10.h5')
+DECK       = os.path.join('NDAS-MCNP', 'SHINE_NDAS.i')
+MANIFEST   = os.path.join('.cache', 'figures.json')
+
+LENGTH   = 137.0
+DIAMETER = 3.29 * 2.54
+
+def get_path(root, name):
+
+    return os.path.join(root, name)
+
+def get_image(root, name):
+
+    return os.path.join(root, 'images', name)
+
+def get_shared(shared, loader, *args):
+
+    # Inputs parsed once per task, for every figure of the group that needs them
+    key = (loader.__module__, loader.__name__) + tuple(map(str, args))
+    if key not in shared: shared[key] = loader(*args)
+    return shared[key]
+
+def draw_profile_vertical(root, shared):
+
+    plot_source.plot_vertical(get_image(root, 'profile_vertical.png'), LENGTH, get_path(root, SOURCE))
+
+def draw_profile_angular(root, shared):
+
+    plot_source.plot_angular(get_image(root, 'profile_angular.png'), get_path(root, SOURCE))
+
+def draw_profile_radial(root, shared):
+
+    plot_source.plot_radial(get_image(root, 'profile_radial.png'), LENGTH, DIAMETER, get_path(root, SOURCE))
+
+def draw_profile_energy_angle(root, shared):
+
+    plot_source.plot_energy_angle(get_image(root, 'profile_energy_angle.png'),
+                                  get_image(root, 'profile_energy_angle_full.png'), get_path(root, SOURCE))
+
+def draw_profile_energy(root, shared):
+
+    plot_source.plot_energy(get_image(root, 'profile_energy.png'),
+                            get_image(root, 'profile_energy_full.png'), get_path(root, SOURCE))
+
+def draw_flux_map_mcnp(root, shared):
+
+    extent, res = get_shared(shared, plot_meshtal.load_mcnp, get_path(root, MESHTAL))
+    outline     = get_shared(shared, plot_meshtal.load_outline, extent, get_path(root, DECK))
+    plot_meshtal.plot_flux_map(get_image(root, 'flux_map_mcnp.png'), extent, res, outline, 'MCNP')
+
+def draw_flux_map_openmc(root, shared):
+
+    extent, res = get_shared(shared, plot_meshtal.load_openmc, get_path(root, STATEPOINT))
+    outline     = get_shared(shared, plot_meshtal.load_outline, extent, get_path(root, DECK))
+    plot_meshtal.plot_flux_map(get_image(root, 'flux_map_openmc.png'), extent, res, outline, 'OpenMC')
+
+def draw_tally_spectrum(root, shared):
+
+    ebins_m, flux_m = get_shared(shared, plot_spectrum.load_mcnp, get_path(root, MCTAL))
+    ebins_o, flux_o = get_shared(shared, plot_spectrum.load_openmc, get_path(root, STATEPOINT), get_path(root, DECK))
+    plot_spectrum.plot_spectrum(get_image(root, 'tally_spectrum.png'), ebins_m, flux_m, ebins_o, flux_o)
+
+# Figures: the group rendered together (sharing parsed inputs), the images written, the case inputs and
+# the scripts that draw them
+SOURCE_SCRIPTS   = ['plot_source.py', 'source_data.py']
+MESHTAL_SCRIPTS  = ['plot_meshtal.py', 'mcnp_meshtal.py', 'openmc_tallies.py', 'geometry_outline.py', 'mcnp_sdef.py']
+SPECTRUM_SCRIPTS = ['plot_spectrum.py', 'mcnp_mctal.py', 'openmc_tallies.py', 'geometry_outline.py', 'mcnp_sdef.py']
+FIGURES = {
+    'profile_vertical'    : ('source'  , ['profile_vertical.png'], [SOURCE], SOURCE_SCRIPTS, draw_profile_vertical),
+    'profile_angular'     : ('source'  , ['profile_angular.png'] , [SOURCE], SOURCE_SCRIPTS, draw_profile_angular),
+    'profile_radial'      : ('source'  , ['profile_radial.png']  , [SOURCE], SOURCE_SCRIPTS, draw_profile_radial),
+    'profile_energy_angle': ('source'  , ['profile_energy_angle.png', 'profile_energy_angle_full.png'],
+                                         [SOURCE], SOURCE_SCRIPTS, draw_profile_energy_angle),
+    'profile_energy'      : ('source'  , ['profile_energy.png', 'profile_energy_full.png'],
+                                         [SOURCE], SOURCE_SCRIPTS, draw_profile_energy),
+    'flux_map_mcnp'       : ('flux_map', ['flux_map_mcnp.png']   , [MESHTAL, DECK], MESHTAL_SCRIPTS,
+                                         draw_flux_map_mcnp),
+    'flux_map_openmc'     : ('flux_map', ['flux_map_openmc.png'] , [STATEPOINT, DECK], MESHTAL_SCRIPTS,
+                                         draw_flux_map_openmc),
+    'tally_spectrum'      : ('spectrum', ['tally_spectrum.png']  , [MCTAL, STATEPOINT, DECK], SPECTRUM_SCRIPTS,
+                                         draw_tally_spectrum)}
+
+def get_digest(fname, files):
+
+    # Content hash of a file, only recomputed when its size or modification time changed
+    stat   = os.stat(fname)
+    key    = os.path.abspath(fname)
+    record = files.get(key)
+    if record and record['size'] == stat.st_size and record['mtime_ns'] == stat.st_mtime_ns:
+        return record['sha256']
+
+    digest = hashlib.sha256()
+    with open(fname, 'rb') as r:
+        for block in iter(lambda: r.read(1 << 20), b''): digest.update(block)
+    files[key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': digest.hexdigest()}
+    return files[key]['sha256']
+
+def get_figure_key(root, name, files):
+
+    # Hash of every input and script of a figure, None when an input is missing
+    _, _, inputs, scripts, _ = FIGURES[name]
+    here   = os.path.dirname(os.path.abspath(__file__))
+    fnames = [get_path(root, x) for x in inputs] + [os.path.join(here, x) for x in scripts]
+    if not all(os.path.exists(x) for x in fnames): return None
+    digest = hashlib.sha256()
+    for fname in fnames: digest.update(get_digest(fname, files).encode())
+    return digest.hexdigest()
+
+def read_manifest(root):
+
+    fname = get_path(root, MANIFEST)
+    if not os.path.exists(fname): return {'files': {}, 'figures': {}}
+    with open(fname, 'r') as r: return json.load(r)
+
+def write_manifest(root, manifest):
+
+    fname = get_path(root, MANIFEST)
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    with open(fname + '.tmp', 'w') as w: json.dump(manifest, w, indent=2)
+    os.replace(fname + '.tmp', fname)
+
+def get_stale(root, names, manifest, force=False):
+
+    # Figures whose inputs changed since they were drawn, or with an image missing
+    stale = {}
+    for name in names:
+        key = get_figure_key(root, name, manifest['files'])
+        if key is None:
+            print('Skipping %s in %s, missing inputs' % (name, root))
+            continue
+        outputs = [get_image(root, x) for x in FIGURES[name][1]]
+        if force or manifest['figures'].get(name) != key or not all(os.path.exists(x) for x in outputs):
+            stale[name] = key
+    return stale
+
+def render(root, names):
+
+    # One task per group of a case: inputs are parsed once and shared between its figures
+    shared = {}
+    done   = []
+    os.makedirs(os.path.join(root, 'images'), exist_ok=True)
+    for name in names:
+        try:
+            FIGURES[name][4](root, shared)
+            done.append((name, None))
+        except Exception:
+            done.append((name, traceback.format_exc()))
+    return root, done
+
+def build(roots, names=None, workers=1, force=False, dry_run=False):
+
+    names     = names or list(FIGURES)
+    manifests = {root: read_manifest(root) for root in roots}
+    stales    = {root: get_stale(root, names, manifests[root], force) for root in roots}
+
+    tasks = []
+    for root, stale in stales.items():
+        groups = {}
+        for name in stale: groups.setdefault(FIGURES[name][0], []).append(name)
+        tasks += [(root, x) for x in groups.values()]
+        print('%s: %u of %u figures out of date' % (root, len(stale), len(names)))
+    if dry_run or not tasks:
+        for root in roots: write_manifest(root, manifests[root])
+        return stales
+
+    failed = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+        futures = [pool.submit(render, *x) for x in tasks]
+        for future in concurrent.futures.as_completed(futures):
+            root, done = future.result()
+            for name, error in done:
+                if error is None:
+                    manifests[root]['figures'][name] = stales[root][name]
+                else:
+                    print('Failed %s in %s\n%s' % (name, root, error))
+                    failed.append((root, name))
+
+    for root in roots: write_manifest(root, manifests[root])
+    if failed: raise RuntimeError('%u figures failed' % (len(failed)))
+    return stales
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Redraw the figures whose inputs changed')
+    parser.add_argument('roots'          , nargs='*', default=['.'], help='case directories, with an images/ directory')
+    parser.add_argument('-f', '--figures', nargs='+', default=None, choices=list(FIGURES))
+    parser.add_argument('-j', '--workers', type=int , default=os.cpu_count())
+    parser.add_argument('--force'        , action='store_true', help='redraw every figure')
+    parser.add_argument('-n', '--dry-run', action='store_true', help='only list the figures out of date')
+    args = parser.parse_args()
+
+    stales = build(args.roots, args.figures, args.workers, args.force, args.dry_run)
+    if args.dry_run:
+        for root, stale in stales.items():
+            for name in stale: print('%s %s' % (root, name))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,10 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+
+def get_case_id(case):
+
+    # Hash of the inputs of one case, shared by the MCNP decks and the OpenMC sweep so that both name a case alike
+    text = json.dumps({key: case[key] for key in sorted(case)}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+
+import argparse
+import concurrent.futures
+import csv
+import glob
+import json
+import os
+import re
+import traceback
+import numpy as np
+
+from geometry_outline import read_mcnp_geometry, get_volume, get_tally_volume
+from mcnp_mctal import get_tally as get_mctal_tally
+from mcnp_meshtal import get_tally as get_meshtal_tally
+from openmc_tallies import load_tally, get_filter_bins
+
+# Inputs of a case directory, relative to it (or all in the directory itself)
+MCTAL      = os.path.join('NDAS-MCNP', 'mctal')
+MESHTAL    = os.path.join('NDAS-MCNP', 'meshtal')
+DECK       = os.path.join('NDAS-MCNP', 'SHINE_NDAS.i')
+STATEPOINT = os.path.join('NDAS-OpenMC', 'statepoint.*.h5')
+
+# Bins with a larger relative error in either code are left out of the ratio statistics
+MAX_ERROR = 0.1
+
+# Both codes are brought to the same bins, and every map is OpenMC / MCNP, with z = (OpenMC - MCNP) / sigma
+# where sigma combines the standard deviations of both codes
+
+def find_input(root, name):
+
+    # Latest match (highest batch for statepoints) in the repository layout, or in the directory itself
+    for pattern in (os.path.join(root, name), os.path.join(root, os.path.basename(name))):
+        fnames = glob.glob(pattern)
+        if fnames: return max(fnames, key=lambda x: [int(y) for y in re.findall(r'\d+', os.path.basename(x))])
+    return None
+
+def load_mcnp_spectrum(fname, number=14):
+
+    # Group flux [n/cm^2-s] of an F4 tally (e lists the upper bin edges, the first bin ends at the lowest one)
+    tally = get_mctal_tally(fname, number)
+    edges = tally['e'] * 1e6
+    value = tally['value'][0, 0, 0, 0, 0, 0, 1:len(edges), 0]
+    error = tally['error'][0, 0, 0, 0, 0, 0, 1:len(edges), 0]
+    return {'edges': edges, 'value': value, 'std': value * error}
+
+def load_openmc_spectrum(fname, volume):
+
+    # Group flux [n/cm^2-s] of the cell tally (normalized by OpenMC to the source strength)
+    tally = load_tally(fname, 'Cell tally', scores=['flux'])
+    return {'edges': get_filter_bins(tally, 'energy'),
+            'value': tally['mean'][:, 0] / volume,
+            'std'  : tally['std_dev'][:, 0] / volume}
+
+def load_mcnp_mesh(fname, number=24):
+
+    # Flux [n/cm^2-s] of a cylindrical mesh tally indexed (z, r): the total over energy and time, averaged
+    # over theta
+    tally = get_meshtal_tally(fname, number)
+    theta = np.diff(tally['bounds'][2])
+    mean  = tally['mean'][-1, -1]
+    var   = (mean * tally['error'][-1, -1])**2
+    return {'r_grid': tally['bounds'][0],
+            'z_grid': tally['bounds'][1] + tally['origin'][2],
+            'value' : ((mean * theta).sum(-1) / theta.sum()).T,
+            'std'   : (np.sqrt((var * theta**2).sum(-1)) / theta.sum()).T}
+
+def load_openmc_mesh(fname):
+
+    # Flux [n/cm^2-s] of the cylindrical mesh tally indexed (z, r), summed over phi
+    tally  = load_tally(fname, 'Mesh tally', scores=['flux'])
+    r_grid = tally['mesh_r_grid']
+    z_grid = tally['mesh_z_grid']
+    shape  = (len(z_grid) - 1, len(tally['mesh_phi_grid']) - 1, len(r_grid) - 1)
+    volume = np.pi * np.diff(r_grid**2)[None, :] * np.diff(z_grid)[:, None]
+    mean   = tally['mean'].reshape(shape + (-1,)).sum((1, 3))
+    var    = (tally['std_dev']**2).reshape(shape + (-1,)).sum((1, 3))
+    return {'r_grid': r_grid, 'z_grid': z_grid, 'value': mean / volume, 'std': np.sqrt(var) / volume}
+
+def get_common_edges(a, b):
+
+    # The coarser of two grids, over the range both cover
+    if len(a) == len(b) and np.allclose(a, b, rtol=1e-6): return a
+    edges = a if len(a) < len(b) else b
+    lo    = max(a[0], b[0])
+    hi    = min(a[-1], b[-1])
+    tol   = 1e-9 * (hi - lo)
+    return edges[(edges >= lo - tol) & (edges <= hi + tol)]
+
+def get_overlap(src, dst, measure):
+
+    # Share of every source bin (rows) that falls in every target bin (columns), in the measure of the axis
+    # (lethargy for energy, r^2 for rings, length for z), the flux being flat within a source bin
+    a = measure(np.asarray(src, dtype=float))
+    b = measure(np.asarray(dst, dtype=float))
+    overlap = np.minimum(a[1:, None], b[None, 1:]) - np.maximum(a[:-1, None], b[None, :-1])
+    return np.clip(overlap, 0, None) / np.diff(a)[:, None]
+
+def remap_spectrum(spectrum, edges):
+
+    # Group fluxes are integrals over the groups, so they add up over the share of each group
+    overlap = get_overlap(spectrum['edges'], edges, np.log)
+    return {'edges': edges,
+            'value': spectrum['value'] @ overlap,
+            'std'  : np.sqrt(spectrum['std']**2 @ overlap**2)}
+
+def remap_mesh(mesh, r_grid, z_grid):
+
+    # Fluxes are volume averages: the voxel integrals add up over the share of each voxel, then are divided
+    # by the new volumes
+    o_r    = get_overlap(mesh['r_grid'], r_grid, np.square)
+    o_z    = get_overlap(mesh['z_grid'], z_grid, lambda x: x)
+    volume = np.pi * np.diff(mesh['r_grid']**2)[None, :] * np.diff(mesh['z_grid'])[:, None]
+    target = np.pi * np.diff(r_grid**2)[None, :] * np.diff(z_grid)[:, None]
+    return {'r_grid': r_grid, 'z_grid': z_grid,
+            'value' : o_z.T @ (mesh['value'] * volume) @ o_r / target,
+            'std'   : np.sqrt((o_z**2).T @ (mesh['std'] * volume)**2 @ o_r**2) / target}
+
+def get_significance(mcnp, openmc):
+
+    # Ratio and z-score of every bin, nan where they are undefined
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sigma = np.hypot(mcnp['std'], openmc['std'])
+        ratio = np.where(mcnp['value'] > 0, openmc['value'] / mcnp['value'], np.nan)
+        z     = np.where(sigma > 0, (openmc['value'] - mcnp['value']) / sigma, np.nan)
+    return ratio, z
+
+def get_summary(mcnp, openmc, ratio, z, weights, centers, max_error=MAX_ERROR):
+
+    # Statistics of a map: totals (weighted, e.g. by voxel volume), the spread of the ratio where both codes
+    # are converged, and the share of bins that differ by more than 2 and 3 sigma where both scored
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rel_m = mcnp['std'] / mcnp['value']
+        rel_o = openmc['std'] / openmc['value']
+    scored    = (mcnp['value'] > 0) & (openmc['value'] > 0)
+    converged = scored & (rel_m < max_error) & (rel_o < max_error)
+
+    total_m  = np.sum(mcnp['value'] * weights)
+    total_o  = np.sum(openmc['value'] * weights)
+    sigma    = np.hypot(np.sqrt(np.sum((mcnp['std'] * weights)**2)), np.sqrt(np.sum((openmc['std'] * weights)**2)))
+    summary  = {'bins'       : int(ratio.size),
+                'scored'     : int(scored.sum()),
+                'converged'  : int(converged.sum()),
+                'total_ratio': float(total_o / total_m) if total_m > 0 else None,
+                'total_z'    : float((total_o - total_m) / sigma) if sigma > 0 else None}
+
+    values = ratio[converged]
+    for key, q in (('ratio_p05', 5), ('ratio_median', 50), ('ratio_p95', 95)):
+        summary[key] = float(np.percentile(values, q)) if values.size else None
+
+    values = np.abs(z[scored])
+    summary['chi2_dof']     = float(np.mean(values**2)) if values.size else None
+    summary['frac_z2']      = float(np.mean(values > 2)) if values.size else None
+    summary['frac_z3']      = float(np.mean(values > 3)) if values.size else None
+    summary['max_abs_z']    = float(values.max()) if values.size else None
+    summary['max_abs_z_at'] = None
+    if values.size:
+        index = np.unravel_index(np.argmax(np.where(scored, np.abs(z), -1)), z.shape)
+        summary['max_abs_z_at'] = [float(x[index]) for x in centers]
+    return summary
+
+def compare(root, max_error=MAX_ERROR, save=True):
+
+    # Cell spectra and flux maps of one case, on common bins, in one pass over whole arrays
+    fnames = {'mctal': find_input(root, MCTAL), 'meshtal': find_input(root, MESHTAL),
+              'deck' : find_input(root, DECK) , 'statepoint': find_input(root, STATEPOINT)}
+    if not fnames['statepoint']: raise FileNotFoundError('No statepoint in %s' % (root))
+    summary = {'root': root, 'statepoint': fnames['statepoint']}
+    maps    = {}
+
+    if fnames['mctal']:
+        volume   = get_tally_volume(fnames['statepoint'], fnames['deck'])
+        mcnp     = load_mcnp_spectrum(fnames['mctal'])
+        openmc   = load_openmc_spectrum(fnames['statepoint'], volume)
+        edges    = get_common_edges(mcnp['edges'], openmc['edges'])
+        mcnp     = remap_spectrum(mcnp, edges)
+        openmc   = remap_spectrum(openmc, edges)
+        ratio, z = get_significance(mcnp, openmc)
+        centers  = [np.sqrt(edges[1:] * edges[:-1])]
+        summary['volume'] = volume
+        if fnames['deck']:
+            geometry = read_mcnp_geometry(fnames['deck'])
+            summary['volume_mcnp'] = get_volume(geometry, geometry['tallies'].get(14, []))
+        summary['spectrum'] = get_summary(mcnp, openmc, ratio, z, np.ones(len(edges) - 1), centers, max_error)
+        maps.update({'spectrum_edges'  : edges,
+                     'spectrum_mcnp'   : mcnp['value'],   'spectrum_mcnp_std'  : mcnp['std'],
+                     'spectrum_openmc' : openmc['value'], 'spectrum_openmc_std': openmc['std'],
+                     'spectrum_ratio'  : ratio,           'spectrum_z'         : z})
+
+    if fnames['meshtal']:
+        mcnp     = load_mcnp_mesh(fnames['meshtal'])
+        openmc   = load_openmc_mesh(fnames['statepoint'])
+        r_grid   = get_common_edges(mcnp['r_grid'], openmc['r_grid'])
+        z_grid   = get_common_edges(mcnp['z_grid'], openmc['z_grid'])
+        mcnp     = remap_mesh(mcnp, r_grid, z_grid)
+        openmc   = remap_mesh(openmc, r_grid, z_grid)
+        ratio, z = get_significance(mcnp, openmc)
+        volume   = np.pi * np.diff(r_grid**2)[None, :] * np.diff(z_grid)[:, None]
+        centers  = np.meshgrid(0.5 * (r_grid[1:] + r_grid[:-1]), 0.5 * (z_grid[1:] + z_grid[:-1]))
+        summary['mesh'] = get_summary(mcnp, openmc, ratio, z, volume / volume.sum(), centers, max_error)
+        maps.update({'mesh_r_grid': r_grid, 'mesh_z_grid': z_grid,
+                     'mesh_mcnp'  : mcnp['value'],   'mesh_mcnp_std'  : mcnp['std'],
+                     'mesh_openmc': openmc['value'], 'mesh_openmc_std': openmc['std'],
+                     'mesh_ratio' : ratio,           'mesh_z'         : z})
+
+    if save:
+        fname = os.path.join(root, 'comparison.npz')
+        print('Writing %s' % (fname))
+        np.savez(fname + '.tmp.npz', **maps)
+        os.replace(fname + '.tmp.npz', fname)
+        fname = os.path.join(root, 'comparison.json')
+        print('Writing %s' % (fname))
+        with open(fname + '.tmp', 'w') as w: json.dump(summary, w, indent=2)
+        os.replace(fname + '.tmp', fname)
+
+    return summary, maps
+
+def compare_case(root, max_error):
+
+    try:
+        return compare(root, max_error)[0]
+    except Exception:
+        return {'root': root, 'error': traceback.format_exc()}
+
+def get_row(summary):
+
+    # Flat row of a summary, one column per statistic of each map
+    row = {'root': summary['root']}
+    for key, value in summary.items():
+        if isinstance(value, dict):
+            row.update({'%s %s' % (key, x): y for x, y in value.items() if not isinstance(y, list)})
+        elif key != 'root':
+            row[key] = value.strip().splitlines()[-1] if key == 'error' else value
+    return row
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Compare the MCNP and OpenMC tallies of the SHINE NDAS models')
+    parser.add_argument('roots'          , nargs='*', default=['.'],
+                        help='case directories laid out like the repository, or holding every input')
+    parser.add_argument('--max-error'    , type=float, default=MAX_ERROR,
+                        help='relative error above which bins are left out of the ratio statistics')
+    parser.add_argument('-j', '--workers', type=int, default=1)
+    parser.add_argument('-o', '--output' , default='comparison.csv')
+    args = parser.parse_args()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as pool:
+        summaries = list(pool.map(compare_case, args.roots, [args.max_error] * len(args.roots)))
+
+    rows    = [get_row(x) for x in summaries]
+    columns = []
+    for row in rows: columns += [x for x in row if x not in columns]
+    print('Writing %s' % (args.output))
+    with open(args.output, 'w', newline='') as w:
+        writer = csv.DictWriter(w, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    fmt = lambda x: '%8.4f' % (x) if x is not None else '%8s' % ('-')
+    print('%-40s %8s %8s %8s %8s %8s %8s' % ('Case', 'spec', 'median', '|z|>3', 'mesh', 'median', '|z|>3'))
+    for summary in summaries:
+        if 'error' in summary:
+            print('%-40s failed: %s' % (summary['root'], summary['error'].strip().splitlines()[-1]))
+            continue
+        values = []
+        for key in ('spectrum', 'mesh'):
+            item    = summary.get(key, {})
+            values += [item.get('total_ratio'), item.get('ratio_median'), item.get('frac_z3')]
+        print('%-40s %s' % (summary['root'], ' '.join(fmt(x) for x in values)))
+
+if __name__ == '__main__': main()
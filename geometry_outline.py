@@ -0,0 +1,343 @@
+#!/usr/bin/python3
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import numpy as np
+from xml.etree import ElementTree
+
+from mcnp_sdef import iter_cards
+
+# Geometry of an axisymmetric model, shared by the MCNP and OpenMC readers
+#   surfaces : {id: ('cyl', (r, z0, z1))}, inside when r' < r and z0 < z < z1 (planes have r = inf)
+#              {id: ('sphere', (r, z0))}, inside when r'^2 + (z - z0)^2 < r^2
+#   cells    : [(material, region)], the first cell that contains a point wins (material 0 is void)
+#   region   : ('half', sign, id), ('and', [regions]), ('or', [regions]) or ('not', region)
+#   ids      : cell numbers, in the order of cells (names as well where the model has them)
+INF = float('inf')
+
+_cache = {}
+
+def parse_surface(tokens):
+
+    kind, params = tokens[0].lower(), [float(x) for x in tokens[1:]]
+    if kind == 'rcc':
+        vx, vy, vz, hx, hy, hz, r = params
+        if vx or vy or hx or hy: raise ValueError('RCC not on the z axis: %s' % (' '.join(tokens)))
+        return ('cyl', (r, min(vz, vz + hz), max(vz, vz + hz)))
+    if kind == 'cz': return ('cyl', (params[0], -INF, INF))
+    if kind == 'pz': return ('cyl', (INF, -INF, params[0]))
+    if kind == 'so': return ('sphere', (params[0], 0.0))
+    if kind == 'sz': return ('sphere', (params[1], params[0]))
+    raise ValueError('Surface %s is not handled' % (kind))
+
+def parse_cell(tokens):
+
+    # Cell number, material (and density), then an intersection of signed surfaces up to the parameters
+    material = int(tokens[1])
+    tokens   = tokens[3:] if material != 0 else tokens[2:]
+    region   = []
+    for token in tokens:
+        if '=' in token or token[0].isalpha(): break
+        if not re.match(r'^[-+]?\d+$', token):
+            raise ValueError('Only intersections of surfaces are handled, found %s' % (token))
+        region.append(('half', -1 if token.startswith('-') else 1, abs(int(token))))
+    return material, ('and', region)
+
+def read_mcnp_geometry(fname):
+
+    # Cell and surface blocks of an MCNP deck (the first line is the title)
+    key = os.path.abspath(fname)
+    if key not in _cache:
+        with open(fname, 'r') as r: text = r.read()
+        blocks = re.split(r'\n\s*\n', text.split('\n', 1)[1])
+        cards  = list(iter_cards(blocks[0]))
+        cells  = [parse_cell(x.split()) for x in cards]
+        surfs  = {int(x.split()[0]): parse_surface(x.split()[1:]) for x in iter_cards(blocks[1])}
+
+        # Cells of the F4 (cell flux) tallies
+        tallies = {}
+        for card in iter_cards(blocks[2] if len(blocks) > 2 else ''):
+            match = re.match(r'^\s*\*?f(\d*4):\w+\s+(.*)$', card, re.I)
+            if match: tallies[int(match.group(1))] = [int(x) for x in re.findall(r'\d+', match.group(2))]
+
+        _cache[key] = {'surfaces': surfs, 'cells': cells, 'ids': [int(x.split()[0]) for x in cards],
+                       'tallies': tallies}
+    return _cache[key]
+
+def parse_region(text):
+
+    # OpenMC region expression: signed surface ids, intersections (spaces), unions (|), complements (~)
+    tokens = re.findall(r'[()|~]|[-+]?\d+', text)
+    pos    = [0]
+
+    def peek(): return tokens[pos[0]] if pos[0] < len(tokens) else None
+    def union():
+        items = [intersection()]
+        while peek() == '|':
+            pos[0] += 1
+            items.append(intersection())
+        return items[0] if len(items) == 1 else ('or', items)
+    def intersection():
+        items = []
+        while peek() not in (None, '|', ')'): items.append(factor())
+        return items[0] if len(items) == 1 else ('and', items)
+    def factor():
+        token   = peek()
+        pos[0] += 1
+        if token == '~': return ('not', factor())
+        if token == '(':
+            region  = union()
+            pos[0] += 1
+            return region
+        return ('half', -1 if token.startswith('-') else 1, abs(int(token)))
+
+    return union() if tokens else ('and', [])
+
+def read_openmc_xml(fname):
+
+    # Same layout from the geometry.xml of a run, for models of a single universe
+    key = os.path.abspath(fname)
+    if key not in _cache:
+        root     = ElementTree.parse(fname).getroot()
+        get      = lambda x, name: x.get(name) if x.get(name) is not None else x.findtext(name)
+        surfaces = {}
+        for surf in root.iter('surface'):
+            sid    = int(get(surf, 'id'))
+            kind   = get(surf, 'type')
+            params = [float(x) for x in get(surf, 'coeffs').split()]
+            axial  = kind == 'z-plane' or not (params[0] or params[1])
+            if   kind == 'z-cylinder' and axial: surfaces[sid] = ('cyl', (params[2], -INF, INF))
+            elif kind == 'z-plane'             : surfaces[sid] = ('cyl', (INF, -INF, params[0]))
+            elif kind == 'sphere'     and axial: surfaces[sid] = ('sphere', (params[3], params[2]))
+            else: raise ValueError('Surface %u is not symmetric about the z axis' % (sid))
+
+        cells = []
+        ids   = []
+        names = []
+        for cell in root.iter('cell'):
+            material = get(cell, 'material')
+            if get(cell, 'fill') is not None: raise ValueError('Cell %s is filled with a universe' % (get(cell, 'id')))
+            cells.append((0 if material in (None, 'void') else int(material), parse_region(get(cell, 'region') or '')))
+            ids.append(int(get(cell, 'id')))
+            names.append(get(cell, 'name'))
+        _cache[key] = {'surfaces': surfaces, 'cells': cells, 'ids': ids, 'names': names}
+    return _cache[key]
+
+def get_openmc_geometry(geometry):
+
+    # Same layout from an openmc.Geometry made of z cylinders, z planes and spheres on the z axis
+    import openmc
+
+    surfaces = {}
+    for sid, surf in geometry.get_all_surfaces().items():
+        if   isinstance(surf, openmc.ZCylinder) and not (surf.x0 or surf.y0):
+            surfaces[sid] = ('cyl', (surf.r, -INF, INF))
+        elif isinstance(surf, openmc.ZPlane):
+            surfaces[sid] = ('cyl', (INF, -INF, surf.z0))
+        elif isinstance(surf, openmc.Sphere) and not (surf.x0 or surf.y0):
+            surfaces[sid] = ('sphere', (surf.r, surf.z0))
+        else:
+            raise ValueError('Surface %u is not symmetric about the z axis' % (sid))
+
+    def convert(region):
+        if region is None                      : return ('and', [])
+        if isinstance(region, openmc.Halfspace): return ('half', -1 if region.side == '-' else 1, region.surface.id)
+        if isinstance(region, openmc.Complement): return ('not', convert(region.node))
+        if isinstance(region, openmc.Union)    : return ('or' , [convert(x) for x in region])
+        return ('and', [convert(x) for x in region])
+
+    cells = []
+    for cell in geometry.root_universe.cells.values():
+        material = cell.fill.id if isinstance(cell.fill, openmc.Material) else 0
+        cells.append((material, convert(cell.region)))
+
+    return {'surfaces': surfaces, 'cells': cells,
+            'ids'     : list(geometry.root_universe.cells.keys()),
+            'names'   : [x.name for x in geometry.root_universe.cells.values()]}
+
+def get_inside(surface, r, z):
+
+    kind, params = surface
+    if kind == 'sphere': return r**2 + (z - params[1])**2 < params[0]**2
+    return (r < params[0]) & (z > params[1]) & (z < params[2])
+
+def get_region(region, inside):
+
+    kind = region[0]
+    if kind == 'half': return inside[region[2]] if region[1] < 0 else ~inside[region[2]]
+    if kind == 'not' : return ~get_region(region[1], inside)
+    masks = [get_region(x, inside) for x in region[1]]
+    if not masks: return True
+    return np.logical_and.reduce(masks) if kind == 'and' else np.logical_or.reduce(masks)
+
+def get_cell_index(geometry, x, z):
+
+    # Index of the cell at points of the y = 0 plane, -1 outside every cell
+    r      = np.abs(x)
+    inside = {sid: get_inside(surf, r, z) for sid, surf in geometry['surfaces'].items()}
+    result = -np.ones(len(x), dtype=int)
+    for n, (material, region) in enumerate(geometry['cells']):
+        mask = (result < 0) & get_region(region, inside)
+        result[mask] = n
+    return result
+
+def get_materials(geometry, x, z):
+
+    # Material at points of the y = 0 plane, -1 outside every cell
+    materials = np.array([x[0] for x in geometry['cells']] + [-1])
+    return materials[get_cell_index(geometry, x, z)]
+
+def get_surface_ids(region):
+
+    if region[0] == 'half': return {region[2]}
+    if region[0] == 'not' : return get_surface_ids(region[1])
+    return set().union(*[get_surface_ids(x) for x in region[1]])
+
+def get_cell_volumes(geometry):
+
+    # Volume of every cell [cm^3]. The cylinders and planes cut the rz half-plane into rectangles that each
+    # lie in one cell, so the volumes are exact; inf for cells that reach past the outermost surfaces and
+    # nan for cells bounded by spheres, which the rectangles only approximate.
+    params = np.array([x[1][:3] for x in geometry['surfaces'].values() if x[0] == 'cyl']).reshape(-1, 3)
+    radii  = params[:, 0][np.isfinite(params[:, 0])]
+    planes = params[:, 1:][np.isfinite(params[:, 1:])]
+    r_max  = 2 * max(radii.max(initial=0.0), 1.0)
+    z_max  = 2 * max(np.abs(planes).max(initial=0.0), 1.0)
+    r_grid = np.unique(np.concatenate(([0.0], radii, [r_max])))
+    z_grid = np.unique(np.concatenate(([-z_max], planes, [z_max])))
+
+    # One point in every rectangle, and the rectangles at the border that stand for the rest of space
+    rc, zc = [x.ravel() for x in np.meshgrid(0.5 * (r_grid[1:] + r_grid[:-1]), 0.5 * (z_grid[1:] + z_grid[:-1]))]
+    dv     = (np.pi * np.diff(r_grid**2)[None, :] * np.diff(z_grid)[:, None]).ravel()
+    border = np.zeros((len(z_grid) - 1, len(r_grid) - 1), dtype=bool)
+    border[[0, -1], :] = True
+    border[:, -1]      = True
+    border = border.ravel()
+
+    index   = get_cell_index(geometry, rc, zc)
+    ncells  = len(geometry['cells'])
+    inside  = index >= 0
+    volumes = np.bincount(index[inside & ~border], weights=dv[inside & ~border], minlength=ncells)
+    volumes[np.bincount(index[inside & border], minlength=ncells) > 0] = INF
+    spheres = {sid for sid, surf in geometry['surfaces'].items() if surf[0] == 'sphere'}
+    for n, (material, region) in enumerate(geometry['cells']):
+        if get_surface_ids(region) & spheres: volumes[n] = np.nan
+    return volumes
+
+def get_volume(geometry, cells):
+
+    # Total volume of cells given by number or by name [cm^3]
+    volumes = get_cell_volumes(geometry)
+    keys    = [geometry['ids'], geometry.get('names') or []]
+    total   = 0.0
+    for cell in cells:
+        match = [n for n, x in enumerate(keys[isinstance(cell, str)]) if x == cell]
+        if not match: raise KeyError('No cell %s in the geometry' % (cell))
+        total += volumes[match[0]]
+    return total
+
+def get_tally_volume(statepoint, deck=None, name='Tally cell', number=14):
+
+    # Volume of the cell tally of a statepoint [cm^3], from the geometry.xml of its run or else from the
+    # cells of the F4 tally of the MCNP deck of the same model
+    fname = os.path.join(os.path.dirname(os.path.abspath(statepoint)), 'geometry.xml')
+    if os.path.exists(fname): return get_volume(read_openmc_xml(fname), [name])
+    if deck is None: raise FileNotFoundError('No geometry.xml next to %s and no MCNP deck' % (statepoint))
+    geometry = read_mcnp_geometry(deck)
+    if number not in geometry['tallies']: raise KeyError('No f%u tally in %s' % (number, deck))
+    return get_volume(geometry, geometry['tallies'][number])
+
+def get_key(geometry, extent):
+
+    text = json.dumps([sorted(geometry['surfaces'].items()), geometry['cells'], list(extent)])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def get_segments(geometry, extent):
+
+    # Every cylinder and plane cuts the xz plane along lines, split where they cross each other;
+    # a piece is kept when the materials on its two sides differ
+    x0, x1, z0, z1 = extent
+    params = np.array([x[1][:3] for x in geometry['surfaces'].values() if x[0] == 'cyl']).reshape(-1, 3)
+    radii  = np.unique(np.round(params[np.isfinite(params[:, 0]), 0], 9))
+    radii  = np.concatenate((-radii, radii))
+    xs     = radii[(radii > x0) & (radii < x1)]
+    zs     = np.unique(np.round(params[:, 1:][np.isfinite(params[:, 1:])], 9))
+    zs     = zs[(zs > z0) & (zs < z1)]
+    xb     = np.unique(np.concatenate(([x0], xs, [x1])))
+    zb     = np.unique(np.concatenate(([z0], zs, [z1])))
+    eps    = 1e-6 * max(x1 - x0, z1 - z0)
+
+    # Vertical pieces at x = +-r and horizontal pieces at z = z_i, as [[x0, z0], [x1, z1]]
+    xv, iz = [x.ravel() for x in np.meshgrid(xs, np.arange(len(zb) - 1), indexing='ij')]
+    zh, ix = [x.ravel() for x in np.meshgrid(zs, np.arange(len(xb) - 1), indexing='ij')]
+    vertical   = np.stack((np.stack((xv, zb[iz]), -1), np.stack((xv, zb[iz + 1]), -1)), 1)
+    horizontal = np.stack((np.stack((xb[ix], zh), -1), np.stack((xb[ix + 1], zh), -1)), 1)
+    segments   = np.concatenate((vertical, horizontal)).reshape(-1, 2, 2)
+
+    middle = segments.mean(1)
+    normal = np.zeros_like(middle)
+    normal[:len(xv), 0] = eps
+    normal[len(xv):, 1] = eps
+    lower  = get_materials(geometry, *(middle - normal).T)
+    upper  = get_materials(geometry, *(middle + normal).T)
+
+    # Join the pieces kept along each line into continuous segments
+    merged = []
+    for segment in segments[lower != upper]:
+        if merged and np.array_equal(merged[-1][1], segment[0]):
+            merged[-1][1] = segment[1]
+        else:
+            merged.append(segment.copy())
+    return np.array(merged).reshape(-1, 2, 2)
+
+def get_outline(geometry, extent, cache_dir=None):
+
+    # Line segments of the material boundaries in the xz plane, cached per geometry and extent
+    key = get_key(geometry, extent)
+    if key in _cache: return _cache[key]
+    fname = os.path.join(cache_dir, 'outline.%s.npy' % (key[:16])) if cache_dir else None
+    if fname and os.path.exists(fname):
+        segments = np.load(fname)
+    else:
+        segments = get_segments(geometry, extent)
+        if fname:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(fname, segments)
+    segments.flags.writeable = False
+    _cache[key] = segments
+    return segments
+
+def get_mcnp_outline(fname, extent):
+
+    # Cached in .cache/ next to the deck
+    cache_dir = os.path.join(os.path.dirname(os.path.abspath(fname)), '.cache')
+    return get_outline(read_mcnp_geometry(fname), extent, cache_dir)
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Outline the geometry of the SHINE NDAS models in the xz plane')
+    parser.add_argument('deck'    , nargs='?', default=os.path.join('NDAS-MCNP', 'SHINE_NDAS.i'))
+    parser.add_argument('--extent', type=float, nargs=4, default=[-100, 100, -100, 100],
+                        metavar=('X0', 'X1', 'Z0', 'Z1'))
+    parser.add_argument('--openmc', action='store_true', help='compare with the outline of get_geometry()')
+    args = parser.parse_args()
+
+    print('Reading %s' % (args.deck))
+    segments = get_mcnp_outline(args.deck, args.extent)
+    print('%u segments' % (len(segments)))
+    for (xa, za), (xb, zb) in segments: print('%10.4f %10.4f  %10.4f %10.4f' % (xa, za, xb, zb))
+
+    if args.openmc:
+        import sys
+        sys.dont_write_bytecode = True
+        sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'NDAS-OpenMC'))
+        from SHINE_NDAS import get_materials as get_openmc_materials, get_geometry
+        geometry = get_openmc_geometry(get_geometry(137.0, 3.29 * 2.54, get_openmc_materials()))
+        other    = get_outline(geometry, args.extent)
+        key      = lambda x: sorted(map(tuple, np.round(x.reshape(-1, 4), 4)))
+        print('OpenMC outline %s' % ('matches' if key(segments) == key(other) else 'differs'))
+
+if __name__ == '__main__': main()
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+import argparse
+import concurrent.futures
+import csv
+import re
+import numpy as np
+
+# Bin types of a tally, in the order of the values (t varies fastest)
+BINS     = ('f', 'd', 'u', 's', 'm', 'c', 'e', 't')
+TALLY_RE = re.compile(r'^tally +(\d+)', re.M)
+BIN_RE   = re.compile(r'^([fdusmcet])([tc]?) +(\d+)(?: +(\d+))?\s*$')
+
+# MCNP's ten statistical checks of a tally fluctuation chart bin
+CHECKS = ('mean random behavior',
+          'relative error < 0.1',
+          'relative error monotonic decrease',
+          'relative error 1/sqrt(nps) decrease',
+          'VOV < 0.1',
+          'VOV monotonic decrease',
+          'VOV 1/nps decrease',
+          'FOM constant',
+          'FOM random behavior',
+          'PDF slope > 3')
+
+def parse_numbers(lines):
+
+    return np.array(' '.join(lines).split(), dtype=float) if lines else np.zeros(0)
+
+def parse_header(lines):
+
+    # Code, version, date, time, dump number, histories and random numbers, then the title
+    tokens = lines[0].split()
+    header = {'code': tokens[0], 'title': lines[1].strip()}
+    ints   = [x for x in tokens[1:] if x.isdigit()]
+    if len(ints) >= 2: header['nps'] = int(ints[-2])
+    if len(ints) >= 1: header['rnr'] = int(ints[-1])
+    return header
+
+def parse_tally(text):
+
+    lines = text.splitlines()
+    head  = lines[0].split()
+    tally = {'number': int(head[1]), 'particle': int(head[2]) if len(head) > 2 else 0,
+             'comment': '', 'dims': {}, 'totals': {}}
+
+    # Particle list and comment lines up to the first bin card
+    i = 1
+    if tally['particle'] < 0: i += 1
+    comments = []
+    while i < len(lines) and not BIN_RE.match(lines[i]):
+        comments.append(lines[i].strip())
+        i += 1
+    tally['comment'] = ' '.join(comments)
+
+    # Bin cards, each followed by its list of cells or bin boundaries
+    while i < len(lines) and not lines[i].startswith('vals'):
+        match = BIN_RE.match(lines[i])
+        i    += 1
+        if not match: continue
+        kind, flag, count = match.group(1), match.group(2), int(match.group(3))
+        tally['dims'  ][kind] = max(count, 1)
+        tally['totals'][kind] = flag == 't'
+        values = []
+        while i < len(lines) and not BIN_RE.match(lines[i]) and not lines[i].startswith('vals'):
+            values.append(lines[i])
+            i += 1
+        if values: tally[kind] = parse_numbers(values)
+
+    # Value and relative error pairs, then the tally fluctuation chart
+    start = i + 1
+    stop  = next((j for j in range(start, len(lines)) if lines[j].startswith('tfc')), len(lines))
+    shape = tuple(tally['dims'].get(x, 1) for x in BINS)
+    vals  = parse_numbers(lines[start:stop]).reshape(shape + (2,))
+    tally['value'] = vals[..., 0]
+    tally['error'] = vals[..., 1]
+
+    tally['tfc'] = np.zeros((0, 4))
+    if stop < len(lines):
+        tokens = lines[stop].split()
+        count  = int(tokens[1])
+        tally['tfc_bin'] = np.array(tokens[2:], dtype=int)
+        tfc = parse_numbers(lines[stop + 1:stop + 1 + count])
+        tally['tfc'] = tfc.reshape(count, -1)[:, :4]
+
+    return tally
+
+def read_mctal(fname):
+
+    # Tallies are split on their 'tally' lines and each parsed in bulk
+    with open(fname, 'r') as r: text = r.read()
+    starts  = [x.start() for x in TALLY_RE.finditer(text)]
+    header  = parse_header(text[:starts[0] if starts else len(text)].splitlines())
+    tallies = {}
+    for n, start in enumerate(starts):
+        end   = starts[n + 1] if n + 1 < len(starts) else len(text)
+        kcode = text.find('\nkcode', start, end)
+        tally = parse_tally(text[start:kcode + 1 if kcode >= 0 else end])
+        tallies[tally['number']] = tally
+
+    return {'header': header, 'tallies': tallies}
+
+def get_tally(fname, number):
+
+    tallies = read_mctal(fname)['tallies']
+    if number not in tallies: raise KeyError('No tally %u in %s' % (number, fname))
+    return tallies[number]
+
+def get_checks(tally):
+
+    # Checks over the last half of the fluctuation chart: 1 passed, 0 missed, -1 not in the mctal file
+    # (the variance of the variance and the history score PDF are only printed in the output file)
+    checks = -np.ones(len(CHECKS), dtype=np.int8)
+    tfc    = tally['tfc']
+    if len(tfc) < 2: return checks
+
+    nps, mean, error, fom = tfc[len(tfc) // 2:].T
+    if len(nps) < 2: nps, mean, error, fom = tfc[-2:].T
+    def monotonic(x): return bool(np.all(np.diff(x) >= 0) or np.all(np.diff(x) <= 0))
+
+    slope = np.polyfit(np.log(nps), np.log(np.maximum(error, 1e-30)), 1)[0] if np.all(error > 0) else 0
+    checks[0] = abs(mean[-1] - mean[0]) <= 2 * error[-1] * abs(mean[-1]) or not monotonic(mean)
+    checks[1] = error[-1] < 0.1
+    checks[2] = bool(np.all(np.diff(error) <= 0))
+    checks[3] = abs(slope + 0.5) < 0.1
+    checks[7] = fom[-1] > 0 and np.max(np.abs(fom / fom[-1] - 1)) < 0.1
+    checks[8] = len(fom) < 3 or not monotonic(fom)
+
+    return checks
+
+def analyze_mctal(fname):
+
+    # One row per tally: final statistics of the chart bin and the number of checks missed
+    try:
+        mctal = read_mctal(fname)
+    except Exception as e:
+        return [{'file': fname, 'tally': '', 'status': 'unreadable: %s' % (e)}]
+
+    rows = []
+    for number, tally in mctal['tallies'].items():
+        checks = get_checks(tally)
+        row    = {'file': fname, 'tally': number, 'nps': mctal['header'].get('nps', '')}
+        if len(tally['tfc']):
+            row['mean'], row['error'], row['fom'] = tally['tfc'][-1, 1:4]
+        row['error_max'] = float(np.max(tally['error'][tally['value'] != 0], initial=0))
+        row['missed']    = '; '.join(CHECKS[i] for i in np.flatnonzero(checks == 0))
+        row['status']    = 'converged' if not row['missed'] else 'not converged'
+        rows.append(row)
+
+    return rows
+
+def analyze_mctals(fnames, workers=1):
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        return [row for rows in pool.map(analyze_mctal, fnames, chunksize=8) for row in rows]
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Check the convergence of MCNP mctal files')
+    parser.add_argument('mctal', nargs='+')
+    parser.add_argument('-j', '--workers', type=int, default=1)
+    parser.add_argument('-o', '--output' , default=None, help='CSV summary')
+    args = parser.parse_args()
+
+    rows = analyze_mctals(args.mctal, args.workers)
+    for row in rows:
+        print('%-40s %6s  %-13s %s' % (row['file'], row['tally'], row['status'], row.get('missed', '')))
+
+    if args.output:
+        columns = []
+        for row in rows: columns += [x for x in row if x not in columns]
+        print('Writing %s' % (args.output))
+        with open(args.output, 'w', newline='') as w:
+            writer = csv.DictWriter(w, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+
+import mmap
+import os
+import re
+import sys
+import numpy as np
+
+# Section and header lines of a meshtal file
+TALLY_RE  = re.compile(rb'^ *Mesh Tally Number +(\d+)', re.M)
+BOUNDS_RE = re.compile(r'^ *(X|Y|Z|R|Theta) direction[^:]*:(.*)$', re.M)
+ENERGY_RE = re.compile(r'^ *Energy bin boundaries:(.*)$', re.M)
+TIME_RE   = re.compile(r'^ *Time bin boundaries:(.*)$', re.M)
+ORIGIN_RE = re.compile(r'origin at(.*?),? *axis in(.*?)direction', re.I)
+NPS_RE    = re.compile(r'Number of histories used for normalizing tallies *= *(\S+)')
+
+# Column names of the column formats, and the matrix blocks
+COLUMN_RE = re.compile(rb'^ *(?:Energy|Time|X|R)\b.*Result.*$', re.M)
+NAMES_RE  = re.compile(r'Rslt \* Vol|Rel Error|Result|Volume|Energy|Time|Th|X|Y|Z|R')
+MATRIX_RE = re.compile(rb'^ *Tally Results: *(\w+) \(across\) by (\w+) \(down\)', re.M)
+BIN_RE    = re.compile(rb'^ *(Total )?(Energy|Time|X|Y|Z|R|Theta) [Bb]in(?:: *(\S+))?', re.M)
+
+# Axis names as printed in the header, the columns and the matrix blocks
+AXES = {'cyl': ('r', 'z', 'theta'), 'rec': ('x', 'y', 'z')}
+KEYS = {'X': 'x', 'Y': 'y', 'Z': 'z', 'R': 'r', 'Th': 'theta', 'Theta': 'theta'}
+
+# Bytes parsed at a time from the data block
+CHUNK = 1 << 24
+
+def parse_values(text):
+
+    # Bin boundaries may continue on lines that hold only numbers
+    values = []
+    for line in text.splitlines():
+        tokens = line.split()
+        try: values.extend(float(x) for x in tokens)
+        except ValueError: break
+    return np.array(values)
+
+def parse_header(text):
+
+    tally = {'comment': ''}
+    match = NPS_RE.search(text)
+    if match: tally['nps'] = float(match.group(1))
+
+    lines = text.splitlines()
+    if len(lines) > 1: tally['comment'] = lines[1].strip()
+
+    match = ORIGIN_RE.search(text)
+    tally['geometry'] = 'cyl' if match else 'rec'
+    if match:
+        tally['origin'] = np.array(match.group(1).split(), dtype=float)
+        tally['axis'  ] = np.array(match.group(2).split(), dtype=float)
+
+    bounds = {}
+    for match in BOUNDS_RE.finditer(text):
+        end = text.find('\n', match.end())
+        bounds[KEYS[match.group(1)]] = parse_values(match.group(2) + text[end:end + 4096] if end >= 0 else match.group(2))
+    tally['axes'  ] = AXES[tally['geometry']]
+    tally['bounds'] = [bounds.get(x, np.array([0.0, 1.0])) for x in tally['axes']]
+
+    for key, regex in (('energy', ENERGY_RE), ('time', TIME_RE)):
+        match = regex.search(text)
+        tally[key] = parse_values(match.group(1)) if match else np.array([0.0, np.inf])
+
+    return tally
+
+def get_shape(tally, totals):
+
+    # (energy, time, i, j, k), with the 'Total' energy and time bins last when they are printed
+    return (len(tally['energy']) - 1 + totals[0], len(tally['time']) - 1 + totals[1]) + \
+           tuple(len(x) - 1 for x in tally['bounds'])
+
+def get_axis(name):
+
+    name = name.decode()
+    return KEYS.get(name, name.lower())
+
+def get_index(values, bounds, total):
+
+    # Columns hold bin centers (or upper edges for energy and time), 'Total' is read as inf
+    index = np.clip(np.searchsorted(bounds, values) - 1, 0, len(bounds) - 2)
+    if total: index[np.isinf(values)] = len(bounds) - 1
+    return index
+
+def iter_chunks(buf, start, end, size=CHUNK):
+
+    # Stream a block of whole lines, a few MB at a time
+    while start < end:
+        stop = min(start + size, end)
+        if stop < end:
+            stop = buf.find(b'\n', stop, end) + 1 or end
+        yield buf[start:stop]
+        start = stop
+
+def parse_columns(buf, start, end, tally):
+
+    header  = buf[start:buf.find(b'\n', start)].decode()
+    names   = [KEYS.get(x, x) for x in NAMES_RE.findall(header)]
+    start   = buf.find(b'\n', start) + 1
+    columns = []
+    for chunk in iter_chunks(buf, start, end):
+        values = np.array(chunk.replace(b'Total', b'inf').split(), dtype=float)
+        columns.append(values.reshape(-1, len(names)))
+    data = np.concatenate(columns) if columns else np.zeros((0, len(names)))
+
+    totals = [int('Energy' in names and np.any(np.isinf(data[:, names.index('Energy')]))),
+              int('Time'   in names and np.any(np.isinf(data[:, names.index('Time'  )])))]
+    shape  = get_shape(tally, totals)
+    index  = []
+    for name, bounds, total in [('Energy', tally['energy'], totals[0]), ('Time', tally['time'], totals[1])] + \
+                               [(x, y, 0) for x, y in zip(tally['axes'], tally['bounds'])]:
+        if name in names: index.append(get_index(data[:, names.index(name)], bounds, total))
+        else            : index.append(np.zeros(len(data), dtype=int))
+    index = tuple(index)
+
+    tally['mean' ] = np.zeros(shape)
+    tally['error'] = np.zeros(shape)
+    tally['mean' ][index] = data[:, names.index('Result'   )]
+    tally['error'][index] = data[:, names.index('Rel Error')]
+    if 'Volume' in names:
+        tally['volume'] = np.zeros(shape[2:])
+        tally['volume'][index[2:]] = data[:, names.index('Volume')]
+
+    return tally
+
+def parse_matrix(buf, start, end, tally):
+
+    # Blocks of one mesh plane per energy, time and third-axis bin: results, then relative errors
+    axes   = list(tally['axes'])
+    totals = [int(re.search(rb'Total Energy', buf[start:end]) is not None),
+              int(re.search(rb'Total Time'  , buf[start:end]) is not None)]
+    shape  = get_shape(tally, totals)
+    tally['mean' ] = np.zeros(shape)
+    tally['error'] = np.zeros(shape)
+
+    # Current energy, time and plane bins, from the 'Bin:' lines before each block
+    current = {'energy': 0, 'time': 0}
+    blocks = list(MATRIX_RE.finditer(buf, start, end))
+    for n, match in enumerate(blocks):
+        prev = blocks[n - 1].end() if n > 0 else start
+        for bin_match in BIN_RE.finditer(buf, prev, match.start()):
+            key = get_axis(bin_match.group(2))
+            if bin_match.group(1):
+                current[key] = shape[0 if key == 'energy' else 1] - 1
+            elif bin_match.group(3):
+                bounds       = tally[key] if key in ('energy', 'time') else tally['bounds'][axes.index(key)]
+                current[key] = int(np.clip(np.searchsorted(bounds, float(bin_match.group(3)), 'right') - 1,
+                                           0, len(bounds) - 2))
+        across = get_axis(match.group(1))
+        down   = get_axis(match.group(2))
+        plane  = [x for x in axes if x not in (across, down)][0]
+
+        # Results and errors tables each end at the first blank line
+        stop  = blocks[n + 1].start() if n + 1 < len(blocks) else end
+        text  = buf[match.end():stop].decode()
+        parts = re.split(r'\n *Relative Errors *\n', text, 1)
+        for key, part in zip(('mean', 'error'), parts):
+            lines = re.split(r'\n\s*\n', part.strip('\n'))[0].splitlines()
+            # The printed bin centers are rounded, the planes always cover every bin in order
+            cols  = len(lines[0].split())
+            rows  = np.array(' '.join(lines[1:]).split(), dtype=float).reshape(-1, cols + 1)
+            index = [current['energy'], current['time'], None, None, None]
+            index[2 + axes.index(across)] = np.arange(cols)[None, :]
+            index[2 + axes.index(down  )] = np.arange(len(rows))[:, None]
+            index[2 + axes.index(plane )] = current.get(plane, 0)
+            tally[key][tuple(index)] = rows[:, 1:]
+
+    return tally
+
+def parse_tally(buf, start, end):
+
+    # Header up to the first data block, then the data in column or matrix format
+    column = COLUMN_RE.search(buf, start, end)
+    matrix = MATRIX_RE.search(buf, start, end)
+    first  = min(x.start() for x in (column, matrix) if x is not None) if (column or matrix) else end
+    tally  = parse_header(buf[start:first].decode())
+    if column and (matrix is None or column.start() < matrix.start()):
+        return parse_columns(buf, column.start(), end, tally)
+    if matrix:
+        return parse_matrix(buf, start, end, tally)
+    return tally
+
+def read_meshtal(fname, tallies=None):
+
+    # Memory-map the file and only parse the requested tallies
+    result = {}
+    with open(fname, 'rb') as r:
+        if os.fstat(r.fileno()).st_size == 0: return result
+        with mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            header  = buf[:buf.find(b'Mesh Tally Number')].decode()
+            match   = NPS_RE.search(header)
+            nps     = float(match.group(1)) if match else None
+            matches = list(TALLY_RE.finditer(buf))
+            for n, match in enumerate(matches):
+                number = int(match.group(1))
+                if tallies is not None and number not in tallies: continue
+                end   = matches[n + 1].start() if n + 1 < len(matches) else len(buf)
+                tally = parse_tally(buf, match.start(), end)
+                tally['number'] = number
+                if nps is not None: tally['nps'] = nps
+                result[number] = tally
+
+    return result
+
+def get_tally(fname, number):
+
+    tallies = read_meshtal(fname, [number])
+    if number not in tallies: raise KeyError('No mesh tally %u in %s' % (number, fname))
+    return tallies[number]
+
+def main():
+
+    fname = sys.argv[1] if len(sys.argv) > 1 else os.path.join('NDAS-MCNP', 'meshtal')
+    print('Reading %s' % (fname))
+    for number, tally in read_meshtal(fname).items():
+        print('  %u %s %s, %s' % (number, tally['geometry'], 'x'.join(str(x) for x in tally['mean'].shape),
+                                   tally['comment']))
+
+if __name__ == '__main__': main()
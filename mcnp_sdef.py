@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+
+import hashlib
+import os
+import re
+import sys
+import numpy as np
+
+# Cards handled by the tokenizer (sdef keywords, distributions and comments)
+CARD_RE    = re.compile(r'^(sdef|sc|si|sp|sb|ds)(\d*)$')
+SHORT_RE   = re.compile(r'^(\d*)(ilog|i|r)$')
+OPTION_RE  = re.compile(r'^[a-z]$')
+
+_cache = {}
+
+def expand_values(tokens):
+
+    # Expand the Ni, Nilog and Nr shorthands into explicit values
+    values  = []
+    pending = None
+    for token in tokens:
+        match = SHORT_RE.match(token)
+        if match:
+            count = int(match.group(1)) if match.group(1) else 1
+            if match.group(2) == 'r':
+                values.extend([values[-1]] * count)
+            else:
+                pending = (match.group(2), count)
+            continue
+        value = float(token)
+        if pending is not None:
+            kind, count = pending
+            if kind == 'i': interp = np.linspace(values[-1], value, count + 2)[1:-1]
+            else          : interp = np.geomspace(values[-1], value, count + 2)[1:-1]
+            values.extend(interp)
+            pending = None
+        values.append(value)
+
+    return np.array(values, dtype=float)
+
+def iter_cards(text):
+
+    # Join continuation lines and strip comments in a single pass
+    card = None
+    for line in text.splitlines():
+        line = line.split('$')[0].rstrip()
+        if not line.strip(): continue
+        if re.match(r'^ {0,4}[cC]( |$)', line):
+            continue
+        if line.startswith('     ') and card is not None:
+            card.append(line)
+        elif card is not None and card[-1].endswith('&'):
+            card[-1] = card[-1][:-1]
+            card.append(line)
+        else:
+            if card is not None: yield ' '.join(card)
+            card = [line]
+    if card is not None: yield ' '.join(card)
+
+def parse_sdef(text):
+
+    # Keywords are the tokens followed by '=', dependencies (fext, fdir, ...) nest
+    tokens = text.lower().replace('=', ' = ').split()
+    sdef   = {}
+    key    = None
+    for i, token in enumerate(tokens):
+        if token == '=': continue
+        is_key = i + 1 < len(tokens) and tokens[i + 1] == '='
+        if is_key and key is not None and not sdef[key] and token.startswith('f'):
+            sdef[key] = ['%s =' % (token)]
+        elif is_key:
+            key = token
+            sdef[key] = []
+        elif key is not None:
+            sdef[key].append(token)
+
+    return {key: ' '.join(value) for key, value in sdef.items()}
+
+def parse_source(text):
+
+    source = {'sdef': {}, 'cards': {}, 'options': {}, 'comments': {}}
+    for card in iter_cards(text):
+        tokens = card.split()
+        name   = tokens[0].lower()
+        match  = CARD_RE.match(name)
+        if not match: continue
+        kind = match.group(1)
+        if kind == 'sdef':
+            source['sdef'] = parse_sdef(' '.join(tokens[1:]))
+        elif kind == 'sc':
+            source['comments'][name] = ' '.join(tokens[1:])
+        else:
+            values = [x.lower() for x in tokens[1:]]
+            option = ''
+            if values and OPTION_RE.match(values[0]):
+                option = values.pop(0)
+            elif kind in ('sp', 'sb') and values and re.match(r'^-\d+$', values[0]):
+                option = values.pop(0)
+            array = expand_values(values)
+            if kind == 'ds' and option in ('s', 'q'):
+                array = array.astype(int)
+            source['cards'  ][name] = array
+            source['options'][name] = option
+
+    return source
+
+def get_cache_name(fname, digest):
+
+    dname = os.path.join(os.path.dirname(os.path.abspath(fname)), '.cache')
+    return os.path.join(dname, '%s.%s.npz' % (os.path.basename(fname), digest[:16]))
+
+def save_cache(fname, source):
+
+    # Pack every card into one flat array so that loading is a handful of reads
+    names  = list(source['cards'])
+    arrays = [source['cards'][x] for x in names]
+    os.makedirs(os.path.dirname(fname), exist_ok=True)
+    np.savez(fname,
+             names          = np.array(names, dtype=str),
+             options        = np.array([source['options'][x] for x in names], dtype=str),
+             is_int         = np.array([x.dtype.kind == 'i' for x in arrays], dtype=bool),
+             offsets        = np.cumsum([0] + [len(x) for x in arrays]),
+             values         = np.concatenate(arrays) if arrays else np.zeros(0),
+             sdef_keys      = np.array(list(source['sdef'    ].keys  ()), dtype=str),
+             sdef_values    = np.array(list(source['sdef'    ].values()), dtype=str),
+             comment_keys   = np.array(list(source['comments'].keys  ()), dtype=str),
+             comment_values = np.array(list(source['comments'].values()), dtype=str))
+
+def load_cache(fname):
+
+    source = {'sdef': {}, 'cards': {}, 'options': {}, 'comments': {}}
+    with np.load(fname) as f:
+        names   = f['names'  ].tolist()
+        options = f['options'].tolist()
+        is_int  = f['is_int' ]
+        offsets = f['offsets']
+        values  = f['values' ]
+        source['sdef'    ] = dict(zip(f['sdef_keys'   ].tolist(), f['sdef_values'   ].tolist()))
+        source['comments'] = dict(zip(f['comment_keys'].tolist(), f['comment_values'].tolist()))
+    for i, name in enumerate(names):
+        array = values[offsets[i]:offsets[i + 1]]
+        source['cards'  ][name] = array.astype(int) if is_int[i] else array
+        source['options'][name] = options[i]
+
+    return source
+
+def read_source(fname, cache=True):
+
+    # Parse a source deck once, keyed by the hash of its contents
+    with open(fname, 'rb') as r: data = r.read()
+    digest = hashlib.sha256(data).hexdigest()
+    if digest in _cache: return _cache[digest]
+
+    cname = get_cache_name(fname, digest)
+    if cache and os.path.exists(cname):
+        source = load_cache(cname)
+    else:
+        source = parse_source(data.decode())
+        if cache: save_cache(cname, source)
+    _cache[digest] = source
+
+    return source
+
+def get_distribution(source, number):
+
+    # Return (option, si, sp, sb) for distribution number
+    name = '%u' % (number)
+    return (source['options'].get('si' + name, ''),
+            source['cards'  ].get('si' + name),
+            source['cards'  ].get('sp' + name),
+            source['cards'  ].get('sb' + name))
+
+def main():
+
+    fname  = sys.argv[1] if len(sys.argv) > 1 else os.path.join('NDAS-MCNP', 'SHINE_NDAS_source.txt')
+    print('Reading %s' % (fname))
+    source = read_source(fname)
+    for key, value in source['sdef'].items():
+        print('  sdef %-4s = %s' % (key, value))
+    print('  %u cards' % (len(source['cards'])))
+
+if __name__ == '__main__': main()
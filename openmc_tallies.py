@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+
+import hashlib
+import os
+import sys
+import numpy as np
+import h5py
+
+# Bytes hashed at each end of a statepoint, together with its size and mtime
+HASH_BYTES = 1 << 20
+
+_cache = {}
+
+def get_statepoint_key(fname):
+
+    # Cheap identity of a statepoint: size, mtime and the head and tail of the file
+    stat   = os.stat(fname)
+    digest = hashlib.sha256(('%u %u' % (stat.st_size, stat.st_mtime_ns)).encode())
+    with open(fname, 'rb') as r:
+        digest.update(r.read(HASH_BYTES))
+        if stat.st_size > 2 * HASH_BYTES:
+            r.seek(-HASH_BYTES, os.SEEK_END)
+            digest.update(r.read(HASH_BYTES))
+    return digest.hexdigest()
+
+def get_cache_name(fname, key, name):
+
+    dname = os.path.join(os.path.dirname(os.path.abspath(fname)), '.cache')
+    tag   = ''.join(x if x.isalnum() else '_' for x in name.lower())
+    return os.path.join(dname, '%s.%s.%s.npz' % (os.path.basename(fname), key[:16], tag))
+
+def decode(value):
+
+    value = value[()]
+    if isinstance(value, bytes): return value.decode()
+    if isinstance(value, np.ndarray) and value.dtype.kind == 'S': return value.astype(str)
+    return value
+
+def find_tally(f, name):
+
+    # Only the name of each tally is read until the right one is found
+    for key, group in f['tallies'].items():
+        if key.startswith('tally ') and decode(group['name']) == name: return group
+    raise KeyError('No tally named %r in %s' % (name, f.filename))
+
+def read_tally(fname, name, scores=None):
+
+    # Read one tally (and its filters and meshes) without loading the rest of the statepoint
+    tally = {}
+    with h5py.File(fname, 'r') as f:
+        group    = find_tally(f, name)
+        n        = int(f['n_realizations'][()])
+        nuclides = [str(x) for x in np.atleast_1d(decode(group['nuclides']))]
+        names    = [str(x) for x in np.atleast_1d(decode(group['scores']))]
+        columns  = [i * len(names) + j for i in range(len(nuclides)) for j in range(len(names))
+                    if scores is None or names[j] in scores]
+
+        # Only the requested score columns of the results are read from disk
+        results = group['results'][:, columns, :]
+        total   = results[:, :, 0] / n
+        total2  = results[:, :, 1] / n
+        tally['mean']           = total
+        tally['std_dev']        = np.sqrt(np.maximum(total2 - total**2, 0) / max(n - 1, 1))
+        tally['n_realizations'] = np.array(n)
+        tally['nuclides']       = np.array(nuclides)
+        tally['scores']         = np.array([x for x in names if scores is None or x in scores])
+
+        # Filters in order, the last one varies fastest in the results
+        filter_ids = np.atleast_1d(group['filters'][()]) if 'filters' in group else []
+        types      = []
+        for i, filter_id in enumerate(filter_ids):
+            filt = f['tallies/filters/filter %u' % (filter_id)]
+            kind = decode(filt['type'])
+            types.append(kind)
+            tally['filter_%u_bins' % (i)] = np.atleast_1d(filt['bins'][()])
+            if kind == 'mesh':
+                mesh = f['tallies/meshes/mesh %u' % (tally['filter_%u_bins' % (i)][0])]
+                tally['mesh_type'] = np.array(decode(mesh['type']))
+                for key in ('dimension', 'r_grid', 'phi_grid', 'z_grid', 'x_grid', 'y_grid',
+                            'lower_left', 'upper_right', 'width', 'origin'):
+                    if key in mesh: tally['mesh_%s' % (key)] = mesh[key][()]
+        tally['filter_types'] = np.array(types, dtype=str)
+
+    return tally
+
+def load_tally(fname, name, scores=None, cache=True):
+
+    # Extracted arrays are cached per statepoint, keyed by its size, mtime and hash
+    key   = get_statepoint_key(fname)
+    cname = get_cache_name(fname, key, name if scores is None else '%s %s' % (name, ' '.join(scores)))
+    if cname in _cache: return _cache[cname]
+
+    if cache and os.path.exists(cname):
+        with np.load(cname) as f: tally = {x: f[x] for x in f.files}
+    else:
+        tally = read_tally(fname, name, scores)
+        if cache:
+            os.makedirs(os.path.dirname(cname), exist_ok=True)
+            np.savez(cname, **tally)
+
+    # Shared between callers, so the arrays are read-only
+    for value in tally.values(): value.setflags(write=False)
+    _cache[cname] = tally
+
+    return tally
+
+def get_pool_edges(grid, factor):
+
+    n = len(grid) - 1
+    return grid[np.append(np.arange(0, n, factor), n)]
+
+def read_mesh_image(fname, name, score, shape, pool, chunk):
+
+    with h5py.File(fname, 'r') as f:
+        group    = find_tally(f, name)
+        n        = int(f['n_realizations'][()])
+        names    = [str(x) for x in np.atleast_1d(decode(group['scores']))]
+        column   = names.index(score)
+        results  = group['results']
+
+        # Bins of every filter, and the position of the mesh filter among them
+        n_bins = []
+        mesh   = None
+        for i, filter_id in enumerate(np.atleast_1d(group['filters'][()])):
+            filt = f['tallies/filters/filter %u' % (filter_id)]
+            if decode(filt['type']) == 'mesh':
+                k    = i
+                mesh = f['tallies/meshes/mesh %u' % (np.atleast_1d(filt['bins'][()])[0])]
+                n_bins.append(None)
+            else:
+                n_bins.append(int(filt['n_bins'][()]) if 'n_bins' in filt else len(filt['bins'][()]) - 1)
+        r_grid = mesh['r_grid'][()]
+        p_grid = mesh['phi_grid'][()]
+        z_grid = mesh['z_grid'][()]
+        nr, nphi, nz = len(r_grid) - 1, len(p_grid) - 1, len(z_grid) - 1
+        n_mesh  = nr * nphi * nz
+        n_inner = int(np.prod(n_bins[k + 1:]))
+        n_outer = int(np.prod(n_bins[:k]))
+
+        # Pooling factors, and slabs of whole pixel rows that hold at most about chunk result rows
+        fz    = -(-nz // shape[0])
+        fr    = -(-nr // shape[1])
+        plane = nr * nphi
+        slab  = fz * max(1, chunk // (n_outer * n_inner * plane * fz))
+        rows  = -(-nz // fz)
+        cols  = -(-nr // fr)
+        image = np.zeros((rows, cols))
+        total = np.zeros((rows, cols))
+        var   = np.zeros((rows, cols))
+        vol   = np.zeros((rows, cols))
+        r_idx = np.arange(0, nr, fr)
+
+        for z0 in range(0, nz, slab):
+            z1   = min(nz, z0 + slab)
+            v0   = z0 * plane * n_inner
+            v1   = z1 * plane * n_inner
+            data = np.stack([results[o * n_mesh * n_inner + v0:o * n_mesh * n_inner + v1, column, :]
+                             for o in range(n_outer)])
+
+            # Mean and variance of every bin in place, summed over the other filters (bins taken as independent)
+            data /= n
+            data[..., 1] -= data[..., 0]**2
+            data[..., 1] /= max(n - 1, 1)
+            np.maximum(data[..., 1], 0, out=data[..., 1])
+            data  = data.reshape(n_outer, z1 - z0, nphi, nr, n_inner, 2).sum((0, 2, 4))
+            dvol  = 0.5 * np.diff(r_grid**2)[None, :] * (p_grid[-1] - p_grid[0]) * np.diff(z_grid[z0:z1 + 1])[:, None]
+
+            z_idx = np.arange(0, z1 - z0, fz)
+            rsl   = slice(z0 // fz, z0 // fz + len(z_idx))
+            def pool_sum(x): return np.add.reduceat(np.add.reduceat(x, z_idx, 0), r_idx, 1)
+            total[rsl] += pool_sum(data[..., 0])
+            var  [rsl] += pool_sum(data[..., 1])
+            vol  [rsl] += pool_sum(dvol)
+            if pool == 'max':
+                data[..., 0] /= dvol
+                image[rsl] = np.maximum.reduceat(np.maximum.reduceat(data[..., 0], z_idx, 0), r_idx, 1)
+
+    # Volume-averaged (or peak) flux per pixel, and the relative error of the pixel average
+    if pool != 'max': image = total / vol
+    rel_err = np.divide(np.sqrt(var), total, out=np.zeros_like(total), where=total > 0)
+
+    return {'mean'   : image,
+            'rel_err': rel_err,
+            'r_grid' : get_pool_edges(r_grid, fr),
+            'z_grid' : get_pool_edges(z_grid, fz)}
+
+def reduce_mesh_tally(fname, name, score='flux', shape=(1000, 1000), pool='mean', chunk=1 << 20, cache=True):
+
+    # Display-resolution image of a cylindrical mesh tally, summed over the other filters (e.g. energy)
+    # and pooled in r and z, streamed from the statepoint in slabs so that memory does not grow with the mesh
+    key   = get_statepoint_key(fname)
+    cname = get_cache_name(fname, key, '%s %s %ux%u %s' % (name, score, shape[0], shape[1], pool))
+    if cname in _cache: return _cache[cname]
+
+    if cache and os.path.exists(cname):
+        with np.load(cname) as f: image = {x: f[x] for x in f.files}
+    else:
+        image = read_mesh_image(fname, name, score, shape, pool, chunk)
+        if cache:
+            os.makedirs(os.path.dirname(cname), exist_ok=True)
+            np.savez(cname, **image)
+
+    for value in image.values(): value.setflags(write=False)
+    _cache[cname] = image
+
+    return image
+
+def read_runtime(fname):
+
+    # Timers written by OpenMC at the end of the run [s]
+    with h5py.File(fname, 'r') as f:
+        if 'runtime' not in f: return {}
+        return {key: float(value[()]) for key, value in f['runtime'].items()}
+
+def get_transport_time(fname):
+
+    # Time spent transporting particles [s], without initialization and reading cross sections
+    runtime = read_runtime(fname)
+    if 'transport' not in runtime: raise KeyError('No transport timer in %s' % (fname))
+    return runtime['transport']
+
+def get_filter_bins(tally, kind):
+
+    types = tally['filter_types'].tolist()
+    return tally['filter_%u_bins' % (types.index(kind))]
+
+def get_mesh_volumes(tally):
+
+    # Cylindrical mesh cell volumes, ordered as the mesh filter bins (r fastest, then phi, then z)
+    r = tally['mesh_r_grid']
+    p = tally['mesh_phi_grid']
+    z = tally['mesh_z_grid']
+    v = 0.5 * np.diff(r**2)[None, None, :] * np.diff(p)[None, :, None] * np.diff(z)[:, None, None]
+    return v.ravel()
+
+def main():
+
+    fname = sys.argv[1] if len(sys.argv) > 1 else os.path.join('NDAS-OpenMC', 'statepoint.10.h5')
+    names = sys.argv[2:] or ['Cell tally', 'Mesh tally']
+    print('Reading %s' % (fname))
+    for name in names:
+        tally = load_tally(fname, name)
+        print('  %-12s %s, filters %s' % (name, 'x'.join(str(x) for x in tally['mean'].shape),
+                                          ', '.join(tally['filter_types'].tolist())))
+
+if __name__ == '__main__': main()
@@ -2,73 +2,58 @@
 
 import os
 import numpy as np
-import mcnptools
-import openmc
+from mcnp_meshtal import get_tally
+from openmc_tallies import reduce_mesh_tally
+from geometry_outline import get_mcnp_outline
 
 import matplotlib
 matplotlib.use('Agg')
 from matplotlib import pyplot as plt
 from matplotlib import colors as mcolors
 from matplotlib import ticker as mticker
-from matplotlib import image  as mpimg
+from matplotlib import collections as mcollections
 
-def load_mcnp():
+def load_mcnp(fname=os.path.join('NDAS-MCNP', 'meshtal')):
 
     # Load meshtal file
-    fname   = os.path.join('NDAS-MCNP', 'meshtal')
     print('Reading %s' % (fname))
-    meshtal = mcnptools.Meshtal(fname)
-    tally   = meshtal.GetTally(24)
+    tally = get_tally(fname, 24)
 
-    # Get mesh tally data
-    r_grid = np.array(tally.GetXRBounds())
-    z_grid = np.array(tally.GetYZBounds()) - 100
+    # Get mesh tally data (first energy and time bin, single theta bin)
+    r_grid = tally['bounds'][0]
+    z_grid = tally['bounds'][1] + tally['origin'][2]
     extent = [-r_grid[-1], r_grid[-1], z_grid[0], z_grid[-1]]
-    res    = np.zeros((len(z_grid) - 1, len(r_grid) - 1))
-    for i in range(len(z_grid) - 1):
-        for j in range(len(r_grid) - 1):
-            res[i, j] = tally.GetValue(j, i, 0, 0, 0)
+    res    = tally['mean'][0, 0, :, :, 0].T
 
     # Mirror across the x-axis
     res = np.concatenate((np.flip(res, 1), res), 1)
 
     return extent, res
 
-def load_openmc():
+def load_openmc(fname=os.path.join('NDAS-OpenMC', 'statepoint.10.h5')):
 
-    # Load statepoint
-    fname = os.path.join('NDAS-OpenMC', 'statepoint.10.h5')
+    # Stream the mesh tally into a display-resolution flux image (cached next to the statepoint)
     print('Reading %s' % (fname))
-    sp    = openmc.StatePoint(fname)
-    tally = sp.get_tally(name='Mesh tally')
-    sp.close()
+    image = reduce_mesh_tally(fname, 'Mesh tally', 'flux', shape=(1000, 1000))
 
-    # Get mesh tally data
-    slice  = tally.get_slice(scores=['flux'])
-    mesh   = tally.find_filter(openmc.MeshFilter).mesh
-    extent = [-mesh.r_grid[-1], mesh.r_grid[-1],
-               mesh.z_grid[ 0], mesh.z_grid[-1]]
-    slice.mean   .shape = (mesh.dimension[2], mesh.dimension[0])
-    slice.std_dev.shape = (mesh.dimension[2], mesh.dimension[0])
-
-    # Normalize by mesh cell volumes
-    res = slice.mean / mesh.volumes[:, 0, :].T
+    # Get mesh tally data, already normalized by mesh cell volumes
+    r_grid = image['r_grid']
+    z_grid = image['z_grid']
+    extent = [-r_grid[-1], r_grid[-1], z_grid[0], z_grid[-1]]
+    res    = image['mean']
 
     # Mirror across the x-axis
     res = np.concatenate((np.flip(res, 1), res), 1)
 
     return extent, res
 
-def main():
+def load_outline(extent, fname=os.path.join('NDAS-MCNP', 'SHINE_NDAS.i')):
 
-    extent_m, res_m = load_mcnp()
-    extent_o, res_o = load_openmc()
+    # Get geometry outline from the surfaces of the MCNP deck (cached next to the deck)
+    print('Reading %s' % (fname))
+    return get_mcnp_outline(fname, extent)
 
-    # Get geometry outline
-    fname   = os.path.join('images', 'geometry_xz.png')
-    img     = mpimg.imread(fname)
-    RGB     = np.array(img * 255, dtype=int)
-    outline = RGB[:, :, 0] * 65536 + RGB[:, :, 1] * 256 + RGB[:, :, 2]
+def plot_flux_map(fname, extent, res, outline, label):
 
     # Setup contour lines
     clevels = [2e8, 5e8, 1e9, 2e9, 5e9, 1e10    , 2e10  ]
@@ -81,31 +66,35 @@ def main():
         return r'$%u\times 10^%u$' % (base, expon)
 
     # Plot mesh tally
-    for k in range(2):
-        if   k == 0: res = res_m; extent = extent_m; label = 'MCNP'
-        elif k == 1: res = res_o; extent = extent_o; label = 'OpenMC'
-        fig, ax = plt.subplots(1, 1)
-        fig.set_size_inches(8, 6.5)
-        im = ax.imshow(res, origin='lower', extent=extent, cmap='Spectral_r',
-                       norm=mcolors.LogNorm(vmin=1e8, vmax=1e11))
-        ax.contour(outline, origin='upper', levels=np.unique(outline),
-                   extent=extent, colors='k', linestyles='solid', linewidths=1)
-        CS = ax.contour(res, origin='lower', extent=extent,
-                        levels=clevels, colors=ccolors)
-        ax.clabel(CS, fmt=fmt)
-        ax.xaxis.set_major_locator(mticker.MultipleLocator(base=20))
-        ax.yaxis.set_major_locator(mticker.MultipleLocator(base=20))
-        ax.set_xlabel('x position [cm]')
-        ax.set_ylabel('z position [cm]')
-        ax.set_title('Neutron flux map for bare SHINE NDAS - %s' % (label))
-        cbar = plt.colorbar(im, orientation='vertical')
-        cbar.set_label(r'Neutron flux [n/$\mathregular{cm^2}$-s]')
-        cbar.ax.hlines(clevels, cbar.ax.dataLim.x0, cbar.ax.dataLim.x1,
-                       colors=ccolors)
-        plt.tight_layout()
+    fig, ax = plt.subplots(1, 1)
+    fig.set_size_inches(8, 6.5)
+    im = ax.imshow(res, origin='lower', extent=extent, cmap='Spectral_r',
+                   norm=mcolors.LogNorm(vmin=1e8, vmax=1e11))
+    ax.add_collection(mcollections.LineCollection(outline, colors='k', linestyles='solid', linewidths=1))
+    CS = ax.contour(res, origin='lower', extent=extent,
+                    levels=clevels, colors=ccolors)
+    ax.clabel(CS, fmt=fmt)
+    ax.xaxis.set_major_locator(mticker.MultipleLocator(base=20))
+    ax.yaxis.set_major_locator(mticker.MultipleLocator(base=20))
+    ax.set_xlabel('x position [cm]')
+    ax.set_ylabel('z position [cm]')
+    ax.set_title('Neutron flux map for bare SHINE NDAS - %s' % (label))
+    cbar = plt.colorbar(im, orientation='vertical')
+    cbar.set_label(r'Neutron flux [n/$\mathregular{cm^2}$-s]')
+    cbar.ax.hlines(clevels, cbar.ax.dataLim.x0, cbar.ax.dataLim.x1,
+                   colors=ccolors)
+    plt.tight_layout()
+    print('Writing %s' % (fname))
+    plt.savefig(fname)
+    plt.close()
+
+def main():
+
+    extent_m, res_m = load_mcnp()
+    extent_o, res_o = load_openmc()
+
+    for extent, res, label in ((extent_m, res_m, 'MCNP'), (extent_o, res_o, 'OpenMC')):
         fname = os.path.join('images', 'flux_map_%s.png' % (label.lower()))
-        print('Writing %s' % (fname))
-        plt.savefig(fname)
-        plt.close()
+        plot_flux_map(fname, extent, res, load_outline(extent), label)
 
 if __name__ == '__main__': main()
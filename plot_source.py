@@ -9,18 +9,13 @@ from matplotlib import pyplot as plt
 from matplotlib import colors as mcolors
 from matplotlib import ticker as mticker
 
-def main():
+from source_data import get_z_profile, get_mu_profile, get_angular_spectra, get_beam_radii
 
-    fname = os.path.join('NDAS-MCNP', 'SHINE_NDAS_source.txt')
-    with open(fname, 'r') as r: text = r.read()
+def plot_vertical(fname, length, data=None):
 
     # Plot vertical (extent) profile
-    si1      = text.split(' si1 ')[1].split(' sp1 ')[0].split()
-    sp1      = text.split(' sp1 ')[1].split('c'    )[0].split()
-    zmin     = float(si1[ 0])
-    zmax     = float(si1[-1])
-    dist_z_p = np.array([float(x) for x in sp1[1:]])[::-1]
-    dist_z_x = np.linspace(0, zmax - zmin, len(dist_z_p) + 1)
+    dist_z_p = get_z_profile(data)[::-1]
+    dist_z_x = np.linspace(0, length, len(dist_z_p) + 1)
     xvals_p  = np.append(0, dist_z_x)
     yvals_p  = np.append(0, np.append(dist_z_p, 0))
     fig, ax = plt.subplots(1, 1)
@@ -31,17 +26,17 @@ def main():
     ax.set_title('SHINE NDAS vertical neutron source distribution')
     ax.grid()
     plt.tight_layout()
-    fname = os.path.join('images', 'profile_vertical.png')
     print('Writing %s' % (fname))
     plt.savefig(fname)
     plt.close()
 
+def plot_angular(fname, data=None):
+
     # Plot angular distribution
-    si2      = text.split(' si2 ')[1].split(' sp2 ')[0].split()
-    sp2      = text.split(' sp2 ')[1].split('c'    )[0].split()
-    dist_a_x = np.acos(np.array([float(x) for x in si2[1:]]))[::-1]
+    mu_x, mu_p = get_mu_profile(data)
+    dist_a_x = np.acos(mu_x)[::-1]
     areas    = (np.cos(dist_a_x)[:-1] - np.cos(dist_a_x)[1:]) * 2 * np.pi
-    dist_a_p = np.array([float(x) for x in sp2[1:]])[::-1] / areas
+    dist_a_p = mu_p[::-1] / areas
     xvals_p  = np.append(dist_a_x, 2 * np.pi - np.flip(dist_a_x[:-1], 0))
     yvals_p  = np.append(dist_a_p, np.flip(dist_a_p))
     yvals_p /= np.mean(yvals_p)
@@ -53,15 +48,15 @@ def main():
     ax.set_rlabel_position(270)
     ax.set_title('SHINE NDAS neutron angular distribution')
     plt.tight_layout()
-    fname = os.path.join('images', 'profile_angular.png')
     print('Writing %s' % (fname))
     plt.savefig(fname)
     plt.close()
 
+def plot_radial(fname, length, diameter, data=None):
+
     # Plot radial distribution
-    ds3      = text.split(' si101 ')[1].split('c')[0].split()
-    ds3      = [x for x in ds3 if not x.startswith('si') and not x == '0']
-    dist_r_x = np.array([float(x) for x in ds3])[::-1]
+    dist_z_x = np.linspace(0, length, len(get_z_profile(data)) + 1)
+    dist_r_x = get_beam_radii(length, diameter, data)[::-1]
     xvals_p  = np.append(dist_z_x, dist_z_x[-1])
     yvals_p  = np.append(np.append(0, dist_r_x), 0)
     fig, ax = plt.subplots(1, 1)
@@ -77,25 +72,23 @@ def main():
     ax.grid()
     ax.legend()
     plt.tight_layout()
-    fname = os.path.join('images', 'profile_radial.png')
     print('Writing %s' % (fname))
     plt.savefig(fname)
     plt.close()
 
-    # Plot angular-dependent energy distribution
-    num_angle = len(dist_a_x) - 1
-    spectra = np.zeros((num_angle, 1601))
-    for i in range(num_angle):
-        si = text.split(' si%u ' % (i + 5))[1].split(' sp%u ' % (i + 5))[0]
-        sp = text.split(' sp%u ' % (i + 5))[1].split('c'               )[0]
-        e_vals = [float(x) for x in si.split()[1:] if not x.endswith('i')]
-        e_inds = [round(x * 100) for x in e_vals]
-        e_dist = np.array([float(x) for x in sp.split()])
-        spectra[i, e_inds[0]:e_inds[1] + 1] = e_dist[:e_inds[1] - e_inds[0] + 1 ]
-        spectra[i, e_inds[2]:e_inds[3] + 1] = e_dist[ e_inds[1] - e_inds[0] + 1:]
-        #spectra[i, :] /= areas[i]
+def get_spectra(data=None):
+
+    # Angular-dependent energy spectra, from 0 to 180 degrees
+    _, spectra, _ = get_angular_spectra(data)
     e_vals  = np.linspace(0, (spectra.shape[1] - 1) / 100, spectra.shape[1])
     spectra = np.flip(spectra, 0) * 100
+    return e_vals, spectra
+
+def plot_energy_angle(fname, fname_full, data=None):
+
+    # Plot angular-dependent energy distribution
+    e_vals, spectra = get_spectra(data)
+    num_angle = spectra.shape[0]
     cvals   = np.linspace(0, 0.95, num_angle)
     colors  = [plt.cm.nipy_spectral(x) for x in cvals]
     fig, ax = plt.subplots(1, 1)
@@ -116,7 +109,6 @@ def main():
     ax.grid()
     ax.legend(loc='upper right')
     plt.tight_layout()
-    fname = os.path.join('images', 'profile_energy_angle.png')
     print('Writing %s' % (fname))
     plt.savefig(fname)
     ax.set_yscale('log')
@@ -125,12 +117,14 @@ def main():
     ax.xaxis.set_major_locator(mticker.MultipleLocator(base=1))
     ax.legend(loc='upper center')
     plt.tight_layout()
-    fname = os.path.join('images', 'profile_energy_angle_full.png')
-    print('Writing %s' % (fname))
-    plt.savefig(fname)
+    print('Writing %s' % (fname_full))
+    plt.savefig(fname_full)
     plt.close()
 
+def plot_energy(fname, fname_full, data=None):
+
     # Plot energy distribution
+    e_vals, spectra = get_spectra(data)
     fig, ax = plt.subplots(1, 1)
     fig.set_size_inches(8, 6)
     ax.plot(e_vals, np.sum(spectra, 0))
@@ -141,7 +135,6 @@ def main():
     ax.set_title('SHINE NDAS neutron energy distribution')
     ax.grid()
     plt.tight_layout()
-    fname = os.path.join('images', 'profile_energy.png')
     print('Writing %s' % (fname))
     plt.savefig(fname)
     ax.set_yscale('log')
@@ -149,9 +142,21 @@ def main():
     ax.set_ylim(1e9, 1e14)
     ax.xaxis.set_major_locator(mticker.MultipleLocator(base=1))
     plt.tight_layout()
-    fname = os.path.join('images', 'profile_energy_full.png')
-    print('Writing %s' % (fname))
-    plt.savefig(fname)
+    print('Writing %s' % (fname_full))
+    plt.savefig(fname_full)
     plt.close()
 
+def main():
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+
+    plot_vertical(os.path.join('images', 'profile_vertical.png'), length)
+    plot_angular(os.path.join('images', 'profile_angular.png'))
+    plot_radial(os.path.join('images', 'profile_radial.png'), length, diameter)
+    plot_energy_angle(os.path.join('images', 'profile_energy_angle.png'),
+                      os.path.join('images', 'profile_energy_angle_full.png'))
+    plot_energy(os.path.join('images', 'profile_energy.png'),
+                os.path.join('images', 'profile_energy_full.png'))
+
 if __name__ == '__main__': main()
@@ -2,8 +2,9 @@
 
 import os
 import numpy as np
-import mcnptools
-import openmc
+from mcnp_mctal import get_tally
+from openmc_tallies import load_tally, get_filter_bins
+from geometry_outline import get_tally_volume
 
 import matplotlib
 matplotlib.use('Agg')
@@ -11,18 +12,15 @@ from matplotlib import pyplot as plt
 from matplotlib import colors as mcolors
 from matplotlib import ticker as mticker
 
-def load_mcnp():
+def load_mcnp(fname=os.path.join('NDAS-MCNP', 'mctal')):
 
     # Load mctal file
-    fname = os.path.join('NDAS-MCNP', 'mctal')
     print('Reading %s' % (fname))
-    mctal = mcnptools.Mctal(fname)
+    tally = get_tally(fname, 14)
 
-    # Get cell tally data
-    tally = mctal.GetTally(14)
-    ebins = np.array(tally.GetEBins())
-    flux  = np.array([tally.GetValue(0, 0, 0, 0, 0, 0, i, 0, 0)
-                      for i in range(1, len(ebins))])
+    # Get cell tally data (e lists the upper bin edges, the first bin ends at the lowest one)
+    ebins = tally['e']
+    flux  = tally['value'][0, 0, 0, 0, 0, 0, 1:len(ebins), 0]
 
     # Normalize by energy bin width
     log_widths = np.log10(ebins[1:] / ebins[:-1])
@@ -30,21 +28,19 @@ def load_mcnp():
 
     return ebins, flux
 
-def load_openmc():
+def load_openmc(fname=os.path.join('NDAS-OpenMC', 'statepoint.10.h5'),
+                deck=os.path.join('NDAS-MCNP', 'SHINE_NDAS.i')):
 
-    # Load statepoint
-    fname = os.path.join('NDAS-OpenMC', 'statepoint.10.h5')
+    # Load the cell tally (cached next to the statepoint)
     print('Reading %s' % (fname))
-    sp    = openmc.StatePoint(fname)
-    tally = sp.get_tally(name='Cell tally')
-    sp.close()
+    tally = load_tally(fname, 'Cell tally', scores=['flux'])
 
     # Get cell tally data
-    ebins = tally.find_filter(openmc.EnergyFilter).values * 1e-6
-    flux  = tally.mean[:, 0, 0]
+    ebins = get_filter_bins(tally, 'energy') * 1e-6
+    flux  = tally['mean'][:, 0].copy()
 
-    # Normalize by volume
-    volume  = np.pi * (5.08**2 - 4.826**2) * 5.0
+    # Normalize by the volume of the tally cell (from geometry.xml next to the statepoint, or the MCNP deck)
+    volume  = get_tally_volume(fname, deck)
     flux   /= volume
 
     # Normalize by energy bin width
@@ -53,10 +49,7 @@ def load_openmc():
 
     return ebins, flux
 
-def main():
-
-    ebins_m, flux_m = load_mcnp()
-    ebins_o, flux_o = load_openmc()
+def plot_spectrum(fname, ebins_m, flux_m, ebins_o, flux_o):
 
     xvals_m = np.append(ebins_m, ebins_m[-1])
     xvals_o = np.append(ebins_o, ebins_o[-1])
@@ -80,9 +73,14 @@ def main():
     ax.legend()
     ax.grid()
     plt.tight_layout()
-    fname = os.path.join('images', 'tally_spectrum.png')
     print('Writing %s' % (fname))
     plt.savefig(fname)
     plt.close()
 
+def main():
+
+    ebins_m, flux_m = load_mcnp()
+    ebins_o, flux_o = load_openmc()
+    plot_spectrum(os.path.join('images', 'tally_spectrum.png'), ebins_m, flux_m, ebins_o, flux_o)
+
 if __name__ == '__main__': main()
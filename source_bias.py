@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+import argparse
+import numpy as np
+
+from source_data import get_z_profile, get_mu_profile
+
+def get_target_points(r0, r1, z0, z1, n=5):
+
+    # Grid of points covering a target region (a cell or a block of mesh voxels), in the source frame
+    r = np.linspace(r0, r1, n)
+    z = np.linspace(z0, z1, n)
+    return np.stack(np.meshgrid(r, z, indexing='ij'), -1).reshape(-1, 2)
+
+def get_importances(length, mu_x, points, z_p, sigma=0.2):
+
+    # Uncollided importance of each source z bin (1/d^2 to the target points), and of each cosine bin
+    # (z-weighted Gaussian around the direction from each z bin to each target point)
+    z_c   = (np.arange(len(z_p)) + 0.5) * length / len(z_p) - length / 2
+    dz    = z_c[:, None] - points[None, :, 1]
+    d2    = points[None, :, 0]**2 + dz**2
+    i_z   = np.mean(1 / d2, 1)
+
+    mu_c  = 0.5 * (mu_x[:-1] + mu_x[1:])
+    mu_t  = dz / np.sqrt(d2)
+    w_t   = z_p[:, None] / d2
+    i_mu  = np.sum(w_t[:, :, None] * np.exp(-0.5 * ((mu_c - mu_t[:, :, None]) / sigma)**2), (0, 1))
+
+    return i_z, i_mu
+
+def get_bias(p, importance, strength=0.5):
+
+    # Ratio q/p of the biased to the analog bin probabilities, from a mixture of the analog distribution
+    # and the importance-weighted one, so that the weights p/q never exceed 1/(1 - strength)
+    p = np.asarray(p, dtype=float) / np.sum(p)
+    a = p * importance
+    return (1 - strength) + strength * importance / np.sum(a)
+
+def get_source_bias(length, region, strength=0.5, sigma=0.2, fname=None):
+
+    # Bias ratios for the z histogram and the mu table, tuned toward region = (r0, r1, z0, z1)
+    z_p        = get_z_profile(fname)
+    mu_x, mu_p = get_mu_profile(fname)
+    points     = get_target_points(*region)
+    i_z, i_mu  = get_importances(length, mu_x, points, z_p, sigma)
+    return get_bias(z_p, i_z, strength), get_bias(mu_p, i_mu, strength)
+
+def get_tally_region(length, diameter):
+
+    # The annular tally cell, 54 cm above the bottom of the target chamber
+    radius = diameter / 2
+    center = -length / 2 + 54. / 137 * length
+    return (radius + 0.6477, radius + 0.9017, center - 2.5, center + 2.5)
+
+def add_bias_arguments(parser):
+
+    parser.add_argument('--bias'       , type=float, default=0, help='bias strength between 0 (analog) and 1')
+    parser.add_argument('--bias-region', type=float, nargs=4, default=None, metavar=('R0', 'R1', 'Z0', 'Z1'),
+                        help='target region [cm], the tally cell by default')
+    parser.add_argument('--bias-sigma' , type=float, default=0.2, help='width of the angular importance')
+
+def get_bias_arguments(args, length, diameter):
+
+    if args.bias <= 0: return None, None
+    region = args.bias_region or get_tally_region(length, diameter)
+    return get_source_bias(length, region, args.bias, args.bias_sigma)
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Print the source bias toward a target region')
+    add_bias_arguments(parser)
+    args = parser.parse_args()
+
+    length   = 137.0
+    diameter = 3.29 * 2.54
+
+    # Half-strength bias toward the tally cell unless told otherwise
+    args.bias       = args.bias or 0.5
+    z_bias, mu_bias = get_bias_arguments(args, length, diameter)
+    _, mu_p         = get_mu_profile()
+    for name, p, bias in (('z', get_z_profile(), z_bias), ('mu', mu_p, mu_bias)):
+        p = p / np.sum(p)
+        print('%-2s bias %.3f - %.3f, weights %.3f - %.3f, sum(q) = %.6f' %
+              (name, np.min(bias), np.max(bias), np.min(1 / bias), np.max(1 / bias), np.sum(p * bias)))
+
+if __name__ == '__main__': main()
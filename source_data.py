@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import numpy as np
+
+# Layout version of the source data file
+VERSION     = 1
+SOURCE_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SHINE_NDAS_source.npz')
+
+# Tables stored in the source data file
+#   z_p         : linear neutron source in each z bin, from the bottom to the top [n/cm-s]
+#   mu_x        : cosine bin boundaries, measured from the beam direction (0, 0, -1)
+#   mu_p        : neutron source in each cosine bin [n/s]
+#   e_x         : energy grid [eV]
+#   e_p         : angle-integrated energy spectrum on e_x (OpenMC)
+#   e_mu_p      : energy spectrum for each cosine bin on e_x (MCNP)
+#   e_mu_bounds : first and last e_x index of the DD and DT parts of each e_mu_p
+#   r_min       : beam radius at the target chamber entrance [cm]
+#   divergence  : beam divergence [rad]
+KEYS = ('z_p', 'mu_x', 'mu_p', 'e_x', 'e_p', 'e_mu_p', 'e_mu_bounds', 'r_min', 'divergence')
+
+_data = {}
+
+def load_source_data(fname=None):
+
+    # Read the file once per process, on first access
+    fname = os.path.abspath(fname or SOURCE_DATA)
+    if fname not in _data:
+        with np.load(fname) as f:
+            version = int(f['version'])
+            if version != VERSION:
+                raise ValueError('%s has source data version %u, expected %u' % (fname, version, VERSION))
+            _data[fname] = {key: f[key] for key in KEYS}
+
+    return _data[fname]
+
+def write_source_data(fname, **tables):
+
+    missing = [key for key in KEYS if key not in tables]
+    if missing: raise ValueError('Missing source tables: %s' % (', '.join(missing)))
+
+    arrays = {key: np.asarray(tables[key]) for key in KEYS}
+    np.savez_compressed(fname, version=np.array(VERSION), **arrays)
+    _data.pop(os.path.abspath(fname), None)
+
+def get_z_profile(fname=None):
+
+    return load_source_data(fname)['z_p']
+
+def get_mu_profile(fname=None):
+
+    data = load_source_data(fname)
+    return data['mu_x'], data['mu_p']
+
+def get_energy_spectrum(fname=None):
+
+    data = load_source_data(fname)
+    return data['e_x'], data['e_p']
+
+def get_angular_spectra(fname=None):
+
+    data = load_source_data(fname)
+    return data['e_x'], data['e_mu_p'], data['e_mu_bounds']
+
+def get_beam_radii(length, diameter, fname=None, r_min=None, divergence=None):
+
+    # Beam radius at the center of each z bin, from the bottom to the top
+    # The beam enters at the top and diverges until it is scraped by the wall
+    # Arrays of parameters (one value per case) give one row of radii per case
+    data       = load_source_data(fname)
+    num_z      = len(data['z_p'])
+    r_min      = data['r_min'] if r_min is None else r_min
+    divergence = data['divergence'] if divergence is None else divergence
+    length, diameter, r_min, divergence = [np.asarray(x, dtype=float)[..., None]
+                                           for x in (length, diameter, r_min, divergence)]
+    z_mid = (np.arange(num_z) + 0.5) * length / num_z
+    r_top = r_min + (length - z_mid) * divergence
+    return np.minimum(r_top, diameter / 2)
+
+def main():
+
+    fname = sys.argv[1] if len(sys.argv) > 1 else SOURCE_DATA
+    print('Reading %s' % (fname))
+    data = load_source_data(fname)
+    print('  version %u' % (VERSION))
+    for key in KEYS:
+        print('  %-11s %s' % (key, 'x'.join(str(x) for x in np.shape(data[key])) or 'scalar'))
+
+if __name__ == '__main__': main()
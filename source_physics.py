@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+
+import argparse
+import hashlib
+import itertools
+import os
+import time
+import numpy as np
+
+from source_data import VERSION, load_source_data, write_source_data
+
+# Masses [amu] and Q values [MeV] of D(t,n)4He and D(d,n)3He, the deuteron beam hits tritium or deuterium at rest
+M_N   = 1.008665
+M_D   = 2.014102
+MASS  = {'dt': (3.016049, 4.002603, 17.589), 'dd': (M_D, 3.016029, 3.269)}
+E_CHG = 1.602176634e-19
+K_B   = 1.380649e-23
+
+# Bosch and Hale (Nucl. Fusion 32, 1992) astrophysical S factors: Gamow constant [keV^1/2], numerator A1-A5,
+# denominator B1-B4 and upper limit [keV, center of mass] of each energy range
+BOSCH_HALE = {'dt': (34.3827, [(( 6.927e4, 7.454e8, 2.050e6, 5.2002e4, 0.0      ),
+                                (6.38e1, -9.95e-1, 6.981e-5, 1.728e-4), 550.0),
+                               ((-1.4714e6, 0.0, 0.0, 0.0, 0.0),
+                                (-8.4127e-3, 4.7983e-6, -1.0748e-9, 8.5184e-14), 4700.0)]),
+              'dd': (31.3970, [(( 5.3701e4, 3.3027e2, -1.2706e-1, 2.9327e-5, -2.5151e-9),
+                                (0.0, 0.0, 0.0, 0.0), 5000.0)])}
+
+# Andersen and Ziegler (1977) electronic stopping of hydrogen ions in hydrogen [eV / (1e15 atoms/cm^2)],
+# as a function of the energy per nucleon [keV/amu]
+ANDERSEN_ZIEGLER = (1.262, 1.44, 242.6, 1.2e4, 0.1159)
+
+# Deuteron energy grid of the slowing-down integrals [keV], deuteron energy step of the kinematics [keV] and
+# center of mass cosines sampled in each cosine bin
+E_FINE = np.concatenate(([0.0], np.geomspace(1e-3, 1e4, 20000)))
+E_STEP = 1.0
+NUM_CM = 16
+
+# Operating points computed together, which bounds the size of the intermediate tables
+CHUNK = 64
+
+# Operating point that approximates the stored source tables (SHINE_NDAS_source.npz) with a 2.7e13 n/s source:
+# the z profile within 3% of its peak (its first bins differ by up to 2x), the energy spectrum
+# within 6% of its peak and the cosine table within 0.5%
+NOMINAL = {'energy': 280.0, 'current': 0.039, 'pressure': 720.0, 't_fraction': 0.9}
+
+_cache = {}
+
+def get_cross_section(energy, reaction):
+
+    # Cross section [cm^2] for a deuteron of lab energy [keV] hitting a target nucleus at rest
+    energy   = np.asarray(energy, dtype=float)
+    target   = MASS[reaction][0]
+    e_cm     = energy * target / (M_D + target)
+    bg, sets = BOSCH_HALE[reaction]
+    sigma    = np.zeros_like(e_cm)
+    lower    = 0.0
+    for (a1, a2, a3, a4, a5), (b1, b2, b3, b4), upper in sets:
+        e    = np.clip(e_cm, 1e-3, upper)
+        s    = (a1 + e * (a2 + e * (a3 + e * (a4 + e * a5)))) / (1 + e * (b1 + e * (b2 + e * (b3 + e * b4))))
+        mask = (e_cm > lower) & (e_cm <= upper)
+        sigma[mask] = (s / e * np.exp(-bg / np.sqrt(e)))[mask]
+        lower = upper
+    return sigma * 1e-27
+
+def get_stopping(energy):
+
+    # Stopping cross section [eV cm^2] of deuterons of lab energy [keV] in hydrogen isotopes, per atom
+    a1, a2, a3, a4, a5 = ANDERSEN_ZIEGLER
+    e      = np.maximum(np.asarray(energy, dtype=float), 1e-6) / M_D
+    e_high = np.maximum(e, 10.0)
+    s_low  = a2 * e_high**0.45
+    s_high = a3 / e_high * np.log(1 + a4 / e_high + a5 * e_high)
+    s      = np.where(e < 10, a1 * np.sqrt(e), 1 / (1 / s_low + 1 / s_high))
+    return s * 1e-15
+
+def integrate(y, x):
+
+    # Cumulative trapezoidal integral, starting at 0
+    return np.concatenate(([0.0], np.cumsum(0.5 * (y[1:] + y[:-1]) * np.diff(x))))
+
+def get_slowing_down():
+
+    # Areal range [atoms/cm^2] and reactions per deuteron and per unit target fraction, while slowing down to 0
+    if 'slowing_down' not in _cache:
+        e_ev   = E_FINE * 1e3
+        stop   = get_stopping(E_FINE)
+        r      = integrate(1 / stop, e_ev)
+        r[1:] += 2 * e_ev[1] / stop[1]
+        yields = {x: integrate(get_cross_section(E_FINE, x) / stop, e_ev) for x in MASS}
+        _cache['slowing_down'] = (r, yields)
+    return _cache['slowing_down']
+
+def get_velocities(energy, reaction):
+
+    # Center of mass velocity and neutron velocity in the center of mass frame [(MeV/amu)^1/2],
+    # for deuterons of lab energy [MeV] (non-relativistic)
+    target, residual, q = MASS[reaction]
+    v_cm  = np.sqrt(2 * energy / M_D) * M_D / (M_D + target)
+    e_rel = energy * target / (M_D + target) + q
+    v_n   = np.sqrt(2 * e_rel * residual / (M_N + residual) / M_N)
+    return v_cm, v_n
+
+def get_kinematics(energy, cos_cm, reaction):
+
+    # Lab energy [MeV] and cosine to the beam of neutrons emitted at cos_cm in the center of mass frame
+    v_cm, v_n = get_velocities(energy, reaction)
+    v_z = v_cm + v_n * cos_cm
+    v_r = v_n * np.sqrt(np.maximum(1 - cos_cm**2, 0))
+    return 0.5 * M_N * (v_z**2 + v_r**2), v_z / np.sqrt(v_z**2 + v_r**2)
+
+def get_cm_cosines(energy, mu, reaction):
+
+    # Center of mass cosine of the neutrons emitted at lab cosine mu (the neutrons are faster than the center of mass)
+    v_cm, v_n = get_velocities(energy, reaction)
+    ratio     = v_cm / v_n
+    sin2      = 1 - mu**2
+    return np.clip(-ratio * sin2 + mu * np.sqrt(1 - ratio**2 * sin2), -1, 1)
+
+def get_response(e_grid, mu_x, e_x, reaction):
+
+    # Share of the neutrons from each deuteron energy bin in every (cosine bin, energy point), for neutrons emitted
+    # isotropically in the center of mass frame. Only the columns that can be reached are kept, cached per grid.
+    key = ('response', reaction, hashlib.sha256(np.concatenate((e_grid, mu_x, e_x)).tobytes()).hexdigest())
+    if key not in _cache:
+        e_mid   = (0.5 * (e_grid[1:] + e_grid[:-1]) * 1e-3)[:, None, None]
+        c_edges = get_cm_cosines(e_mid, mu_x[None, :, None], reaction)
+        c_lo    = c_edges[:, :-1]
+        c_hi    = c_edges[:, 1:]
+        cos_cm  = c_lo + (np.arange(NUM_CM) + 0.5) / NUM_CM * (c_hi - c_lo)
+        e_n, _  = get_kinematics(e_mid, cos_cm, reaction)
+        i_e     = np.clip(np.searchsorted(0.5 * (e_x[1:] + e_x[:-1]), e_n * 1e6), 0, len(e_x) - 1)
+        column  = np.arange(len(mu_x) - 1)[None, :, None] * len(e_x) + i_e
+        share   = np.broadcast_to((c_hi - c_lo) / (2 * NUM_CM), column.shape)
+        row     = np.broadcast_to(np.arange(len(e_mid))[:, None, None], column.shape)
+        columns, inverse = np.unique(column, return_inverse=True)
+        matrix  = np.bincount(row.ravel() * len(columns) + inverse.ravel(), share.ravel(),
+                              len(e_mid) * len(columns)).reshape(len(e_mid), len(columns))
+        _cache[key] = (columns, matrix)
+    return _cache[key]
+
+def get_depth_energies(energy, density, depth):
+
+    # Deuteron energy [keV] after each depth [cm] of gas, for every operating point (rows)
+    r, _   = get_slowing_down()
+    r0     = np.interp(energy, E_FINE, r)
+    left   = r0[:, None] - density[:, None] * depth
+    return np.where(left > 0, np.interp(left, r, E_FINE), 0.0)
+
+def get_points(energy, current, pressure, t_fraction, length, temperature):
+
+    # Operating points broadcast to 1D arrays
+    arrays = np.broadcast_arrays(*[np.atleast_1d(np.asarray(x, dtype=float))
+                                   for x in (energy, current, pressure, t_fraction, length, temperature)])
+    return [x.ravel() for x in arrays]
+
+def compute_source_terms(energy, current, pressure, t_fraction, length, temperature, num_z, mu_x, e_x):
+
+    # Gas of D2, DT and T2 molecules at the given pressure [Pa] and temperature [K]
+    density = 2 * pressure / (K_B * temperature) * 1e-6
+    beam    = current / E_CHG
+    _, ref  = get_slowing_down()
+    targets = {'dt': t_fraction, 'dd': 1 - t_fraction}
+
+    # Deuteron energy at every z bin boundary, from the top (beam entrance) down
+    edges   = np.linspace(0, 1, num_z + 1)[None, :] * length[:, None]
+    e_edges = get_depth_energies(energy, density, edges)
+    e_exit  = e_edges[:, -1]
+
+    # Reactions in each z bin (bottom to top), as differences of the reactions per deuteron
+    z_p = np.zeros((len(energy), num_z))
+    for reaction, fraction in targets.items():
+        cum  = np.interp(e_edges, E_FINE, ref[reaction])
+        z_p += (beam * fraction)[:, None] * -np.diff(cum, axis=1)
+    z_p = z_p[:, ::-1] / (length / num_z)[:, None]
+
+    # Same reactions per deuteron energy bin, spread over the neutron energies and angles by one matrix product
+    e_grid  = np.arange(0, np.max(energy) + E_STEP, E_STEP)
+    spectra = {}
+    for reaction, fraction in targets.items():
+        lo      = np.clip(e_grid[None, :-1], e_exit[:, None], energy[:, None])
+        hi      = np.clip(e_grid[None, 1: ], e_exit[:, None], energy[:, None])
+        weights = (beam * fraction)[:, None] * (np.interp(hi, E_FINE, ref[reaction]) - np.interp(lo, E_FINE, ref[reaction]))
+        columns, matrix = get_response(e_grid, mu_x, e_x, reaction)
+        counts  = np.zeros((len(energy), (len(mu_x) - 1) * len(e_x)))
+        counts[:, columns] = weights @ matrix
+        spectra[reaction] = counts.reshape(len(energy), len(mu_x) - 1, len(e_x))
+
+    # Indices of each part of the spectrum of every cosine bin, with a zero at each end
+    bounds = np.zeros((len(energy), len(mu_x) - 1, 4), dtype=int)
+    for k, reaction in enumerate(('dd', 'dt')):
+        nonzero = spectra[reaction] > 0
+        first   = np.argmax(nonzero, 2)
+        last    = len(e_x) - 1 - np.argmax(nonzero[:, :, ::-1], 2)
+        found   = np.any(nonzero, 2)
+        bounds[:, :, 2 * k    ] = np.where(found, np.maximum(first - 1, 0), 0)
+        bounds[:, :, 2 * k + 1] = np.where(found, np.minimum(last + 1, len(e_x) - 1), 0)
+
+    e_mu_p = spectra['dd'] + spectra['dt']
+    return {'z_p'        : z_p,
+            'mu_p'       : e_mu_p.sum(2) / 100,
+            'e_p'        : e_mu_p.sum(1),
+            'e_mu_p'     : e_mu_p,
+            'e_mu_bounds': bounds,
+            'e_exit'     : e_exit,
+            'dt_fraction': spectra['dt'].sum((1, 2)) / np.maximum(e_mu_p.sum((1, 2)), 1e-300)}
+
+def get_source_terms(energy, current, pressure, t_fraction=0.9, length=137.0, temperature=293.15,
+                     num_z=137, mu_x=None, e_x=None, spectra=True, cache=True):
+
+    # Source tables for many operating points at once: beam energy [keV], beam current [A], gas pressure [Pa],
+    # atom fraction of tritium in the gas, chamber length [cm] and gas temperature [K]. Every table has one row per
+    # point; the cosine and energy grids are those of the source data file unless given. The full energy-angle
+    # tables (e_mu_p) take 0.8 MB per point, scans over many points can leave them out with spectra=False.
+    points = get_points(energy, current, pressure, t_fraction, length, temperature)
+    data   = load_source_data()
+    mu_x   = data['mu_x'] if mu_x is None else np.asarray(mu_x, dtype=float)
+    e_x    = data['e_x' ] if e_x  is None else np.asarray(e_x , dtype=float)
+    if np.any(points[0] > 7800): raise ValueError('Beam energies above 7.8 MeV are outside the cross section fits')
+
+    digest = hashlib.sha256(('%u %u %u %u' % (VERSION, num_z, NUM_CM, spectra)).encode())
+    for x in points + [mu_x, e_x]: digest.update(np.ascontiguousarray(x).tobytes())
+    key    = digest.hexdigest()
+    dname  = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+    fname  = os.path.join(dname, 'source_terms.%s.npz' % (key[:16]))
+    if cache and key in _cache: return _cache[key]
+    if cache and os.path.exists(fname):
+        with np.load(fname) as f: terms = {x: f[x] for x in f.files}
+    else:
+        # Points in chunks, so that the intermediate tables stay small
+        chunks = []
+        for i in range(0, len(points[0]), CHUNK):
+            chunk = compute_source_terms(*[x[i:i + CHUNK] for x in points], num_z, mu_x, e_x)
+            if not spectra: del chunk['e_mu_p']
+            chunks.append(chunk)
+        terms = {x: np.concatenate([y[x] for y in chunks]) for x in chunks[0]}
+        terms.update(mu_x=mu_x, e_x=e_x)
+        for name, values in zip(('energy', 'current', 'pressure', 't_fraction', 'length', 'temperature'), points):
+            terms[name] = values
+        if cache:
+            os.makedirs(dname, exist_ok=True)
+            np.savez(fname + '.tmp.npz', **terms)
+            os.replace(fname + '.tmp.npz', fname)
+    if cache: _cache[key] = terms
+    return terms
+
+def write_source_terms(fname, terms, index=0, r_min=None, divergence=None):
+
+    # One operating point as a source data file, read by get_source() and the MCNP source cards
+    data = load_source_data()
+    write_source_data(fname,
+                      z_p=terms['z_p'][index], mu_x=terms['mu_x'], mu_p=terms['mu_p'][index], e_x=terms['e_x'],
+                      e_p=terms['e_p'][index], e_mu_p=terms['e_mu_p'][index], e_mu_bounds=terms['e_mu_bounds'][index],
+                      r_min=data['r_min'] if r_min is None else r_min,
+                      divergence=data['divergence'] if divergence is None else divergence)
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Compute the SHINE NDAS source tables from the beam and gas parameters')
+    parser.add_argument('-e', '--energy'     , type=float, nargs='+', default=[NOMINAL['energy']]    , help='deuteron beam energy [keV]')
+    parser.add_argument('-i', '--current'    , type=float, nargs='+', default=[NOMINAL['current']]   , help='beam current [A]')
+    parser.add_argument('-p', '--pressure'   , type=float, nargs='+', default=[NOMINAL['pressure']]  , help='gas pressure [Pa]')
+    parser.add_argument('-f', '--t-fraction' , type=float, nargs='+', default=[NOMINAL['t_fraction']], help='atom fraction of tritium')
+    parser.add_argument('-l', '--length'     , type=float, nargs='+', default=[137.0]                , help='chamber length [cm]')
+    parser.add_argument('-T', '--temperature', type=float, nargs='+', default=[293.15]               , help='gas temperature [K]')
+    parser.add_argument('-o', '--output'     , default=None, help='source data file of the first operating point')
+    parser.add_argument('--no-cache'         , action='store_true')
+    args = parser.parse_args()
+
+    grid   = [args.energy, args.current, args.pressure, args.t_fraction, args.length, args.temperature]
+    points = np.array(list(itertools.product(*grid))).T
+
+    t0    = time.perf_counter()
+    terms = get_source_terms(*points, spectra=args.output is not None, cache=not args.no_cache)
+    print('%u operating points in %.2f s' % (points.shape[1], time.perf_counter() - t0))
+
+    print('%9s %9s %9s %6s %7s %11s %8s %9s' % ('E [keV]', 'I [A]', 'P [Pa]', 'T frac', 'L [cm]', 'S [n/s]',
+                                                'DT frac', 'Exit [keV]'))
+    for i in range(points.shape[1]):
+        length = terms['length'][i]
+        print('%9.1f %9.3g %9.4g %6.3f %7.1f %11.4e %8.4f %9.1f' %
+              (terms['energy'][i], terms['current'][i], terms['pressure'][i], terms['t_fraction'][i], length,
+               np.sum(terms['z_p'][i]) * length / len(terms['z_p'][i]), terms['dt_fraction'][i], terms['e_exit'][i]))
+
+    if args.output:
+        print('Writing %s' % (args.output))
+        write_source_terms(args.output, terms)
+
+if __name__ == '__main__': main()
@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+
+import argparse
+import contextlib
+import csv
+import json
+import os
+import subprocess
+import time
+
+from openmc_tallies import read_runtime
+
+# Stages of a run are recorded in a list (the timer) that is passed down to the functions that build and run
+# the model; with no timer nothing is recorded. The peak memory of a stage is that of the stage alone: the
+# high-water mark of the process is reset when the stage starts, and a child (openmc) is waited for on its own.
+
+def get_rss():
+
+    # Resident memory of this process now [bytes], None where /proc is not available
+    try:
+        with open('/proc/self/statm', 'r') as r: return int(r.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+def reset_peak_rss():
+
+    # Reset the high-water mark of resident memory to the current size (Linux), False where it cannot be
+    try:
+        with open('/proc/self/clear_refs', 'w') as w: w.write('5')
+        return True
+    except OSError:
+        return False
+
+def get_peak_rss():
+
+    # Resident memory high-water mark of this process since the last reset [bytes]
+    try:
+        with open('/proc/self/status', 'r') as r:
+            for line in r:
+                if line.startswith('VmHWM:'): return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+@contextlib.contextmanager
+def stage(timer, name):
+
+    # The record of the stage is yielded, so that the peak memory of a child can be added to it
+    item = {'stage': name, 'peak_rss_children': None}
+    if timer is None:
+        yield item
+        return
+    reset = reset_peak_rss()
+    t0    = time.perf_counter()
+    try:
+        yield item
+    finally:
+        item.update({'wall_time': time.perf_counter() - t0,
+                     'rss'      : get_rss(),
+                     'peak_rss' : get_peak_rss() if reset else None})
+        timer.append(item)
+
+def run_openmc(path, threads=None, restart_file=None, output=True, item=None):
+
+    # Same command as openmc.run(), waited for with os.wait4 for the peak memory of this child alone
+    args    = ['openmc'] + (['-s', str(threads)] if threads else []) + (['-r', restart_file] if restart_file else [])
+    process = subprocess.Popen(args, cwd=path, stdout=None if output else subprocess.DEVNULL)
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if item is not None: item['peak_rss_children'] = usage.ru_maxrss * 1024
+    if process.returncode: raise subprocess.CalledProcessError(process.returncode, args)
+
+def get_record(timer, statepoint=None, **metadata):
+
+    # One record per run: the stages, and OpenMC's own timers from the statepoint (initialization, reading
+    # cross sections, transport, accumulating tallies, ...)
+    runtime = read_runtime(statepoint) if statepoint and os.path.exists(statepoint) else {}
+    return {'metadata'       : metadata,
+            'stages'         : timer,
+            'openmc'         : runtime,
+            'wall_time'      : sum(x['wall_time'] for x in timer),
+            'peak_rss'       : max([x['peak_rss'] for x in timer if x['peak_rss']], default=None),
+            'peak_rss_openmc': max([x['peak_rss_children'] for x in timer if x['peak_rss_children']], default=None)}
+
+def write_record(fname, record):
+
+    print('Writing %s' % (fname))
+    with open(fname + '.tmp', 'w') as w: json.dump(record, w, indent=2)
+    os.replace(fname + '.tmp', fname)
+
+def get_row(record):
+
+    # Flat row of a record: metadata, then the wall time of every stage and every OpenMC timer
+    row = dict(record['metadata'])
+    for item in record['stages']:
+        key      = 'stage %s' % (item['stage'])
+        row[key] = row.get(key, 0.0) + item['wall_time']
+    for key, value in record['openmc'].items(): row['openmc %s' % (key)] = value
+    for key in ('wall_time', 'peak_rss', 'peak_rss_openmc'): row[key] = record[key]
+    return row
+
+def collect(fnames):
+
+    rows = []
+    for fname in fnames:
+        with open(fname, 'r') as r: row = get_row(json.load(r))
+        rows.append(dict(file=fname, **row))
+    return rows
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Gather the timing records of many runs (e.g. sweep/*/timing.json)')
+    parser.add_argument('records'     , nargs='+')
+    parser.add_argument('-o', '--output', default='timing.csv')
+    args = parser.parse_args()
+
+    rows    = collect(args.records)
+    columns = []
+    for row in rows: columns += [x for x in row if x not in columns]
+    print('Writing %s' % (args.output))
+    with open(args.output, 'w', newline='') as w:
+        writer = csv.DictWriter(w, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    # Share of the wall time of every stage and OpenMC timer, summed over the runs
+    total = sum(x['wall_time'] for x in rows)
+    for column in columns:
+        if not column.startswith(('stage ', 'openmc ')): continue
+        value = sum(x.get(column) or 0.0 for x in rows)
+        print('%-40s %12.3f s %6.1f%%' % (column, value, 100 * value / total if total else 0))
+
+if __name__ == '__main__': main()